@@ -6,6 +6,36 @@
 import arcpy
 import requests
 import json
+from urllib.parse import urlencode
+import route_solver   # these three are in the same folder as this script
+import route_cache
+import request_scheduler
+
+# True to solve many ODs at once (see route_solver.py), False to solve
+# them one at a time in the cursor loop below
+USE_CONCURRENT_SOLVER = False
+# how many requests may be in flight at once
+MAX_IN_FLIGHT = 16
+# how many ODs to solve in each request (at most 75); None to send
+# one request per OD
+BATCH_PAIRS = 50
+# solved routes are kept in this SQLite file, so reruns and repeated ODs
+# aren't solved (and paid for) again; None to turn the cache off
+ROUTE_CACHE_PATH = r'C:\mapdata\NSroutes\data\route_cache.sqlite'
+# cached routes older than this many days are solved again
+ROUTE_CACHE_DAYS = 30
+# past this many routes, the least recently used are dropped
+ROUTE_CACHE_MAX_ENTRIES = 1000000
+# at most this many requests per second (None for no limit), and how
+# many times a throttled or failed request is retried before giving up
+MAX_REQUESTS_PER_SECOND = 10
+MAX_RETRIES = 6
+# the ODs are solved and written this many rows at a time, and the last
+# OBJECTID written is kept in this file; if a run dies partway, run the
+# script again and it carries on after that row (delete the file to
+# start over from the first row)
+CHECKPOINT_ROWS = 5000
+CHECKPOINT_PATH = r'C:\mapdata\NSroutes\data\ods_checkpoint.json'
 
 # file geodatabase that we want to work with
 arcpy.env.workspace = r'C:\mapdata\NSroutes\data\routes_data.gdb'
@@ -17,54 +47,77 @@ feature_class_name = "ods"
 # the first 4 are for reading, the last 2 are for writing
 fields_for_cursor = ["Origin_Lat", "Origin_Long", "Destin_Lat", "Destin_Long", "Esri_Time", "Esri_Distance"]
 
-# create an UpdateCursor for reading and writing
-cursorODs = arcpy.da.UpdateCursor(feature_class_name, fields_for_cursor)
+# your token or API key
+TOKEN = "your_token_or_api_key_goes_here"
 
 # start to prepare the REST API URL
 route_url = "https://route.arcgis.com/arcgis/rest/services/World/Route/NAServer/Route_World/solve"
-token = "&token=your_token_or_api_key_goes_here"
-return_format = "&f=pjson"
-
-# for each row, route between two points and write the results into the same row
-for row in cursorODs:
-    # read the origin and destination lats and longs
-    # the index values below are the same order as the "fields_for_cursor" list above
-    # with the new "arcpy.da" module, you refer to fields by index, not by name
-    origin_lat = row[0]
-    origin_lon = row[1]
-    destin_lat = row[2]
-    destin_lon = row[3]
-
-    # build the "stops" parameter values
-    stops = "?stops=" + str(origin_lon) + "," + str(origin_lat) + ";" + str(destin_lon) + "," + str(destin_lat)
-
-    # build the full REST API URL call
-    api_url = route_url + stops + token + return_format
-    #print(api_url)
-
-    # get the response from the REST request
-    response = requests.get(api_url)
-
-    # load the response into a Python dictionary
-    response_json = response.json()
-
-    # get the time and distance for the shortest route found
-    attribs = response_json["routes"]["features"][0]["attributes"]
-    travel_time_minutes = attribs["Total_TravelTime"]
-    travel_dist_miles = attribs["Total_Miles"]
-
-    # write the travel time and distance
-    row[4] = travel_time_minutes
-    row[5] = travel_dist_miles
-
-    # commit the edits to the row
-    cursorODs.updateRow(row)
-
-    # display the results to the notebook if you want
-    print(str(ctr) + "- min: " + str(travel_time_minutes) + "; miles:" + str(travel_dist_miles))
-    ctr+=1
-    
+
+# every query parameter but the "stops", used by both ways of solving
+# (the concurrent solver hands it to requests; the loop below builds the
+# "&...&..." part of the URL out of it)
+params = {"token": TOKEN, "f": "pjson"}
+
+if USE_CONCURRENT_SOLVER:
+    # solve the ODs not cached yet, MAX_IN_FLIGHT requests at a time, and
+    # write the results back a chunk of CHECKPOINT_ROWS rows at a time
+    cache = None
+    if ROUTE_CACHE_PATH:
+        cache = route_cache.RouteCache(ROUTE_CACHE_PATH, ROUTE_CACHE_DAYS, ROUTE_CACHE_MAX_ENTRIES)
+    scheduler = request_scheduler.RequestScheduler(MAX_REQUESTS_PER_SECOND, per_host=MAX_IN_FLIGHT,
+                                                   max_retries=MAX_RETRIES)
+    route_solver.solve_table(feature_class_name, fields_for_cursor[0:4], fields_for_cursor[4:6], route_url, params,
+                             ["Total_TravelTime", "Total_Miles"], MAX_IN_FLIGHT, cache, BATCH_PAIRS, scheduler,
+                             CHECKPOINT_PATH, CHECKPOINT_ROWS)
+    if cache is not None:
+        cache.close()
+
+else:
+    # create an UpdateCursor for reading and writing
+    cursorODs = arcpy.da.UpdateCursor(feature_class_name, fields_for_cursor)
+    ctr = 0
+
+    # for each row, route between two points and write the results into the same row
+    for row in cursorODs:
+        # read the origin and destination lats and longs
+        # the index values below are the same order as the "fields_for_cursor" list above
+        # with the new "arcpy.da" module, you refer to fields by index, not by name
+        origin_lat = row[0]
+        origin_lon = row[1]
+        destin_lat = row[2]
+        destin_lon = row[3]
+
+        # build the "stops" parameter values
+        stops = "?stops=" + str(origin_lon) + "," + str(origin_lat) + ";" + str(destin_lon) + "," + str(destin_lat)
+
+        # build the full REST API URL call
+        api_url = route_url + stops + "&" + urlencode(params)
+        #print(api_url)
+
+        # get the response from the REST request
+        response = requests.get(api_url)
+
+        # load the response into a Python dictionary
+        response_json = response.json()
+
+        # get the time and distance for the shortest route found
+        attribs = response_json["routes"]["features"][0]["attributes"]
+        travel_time_minutes = attribs["Total_TravelTime"]
+        travel_dist_miles = attribs["Total_Miles"]
+
+        # write the travel time and distance
+        row[4] = travel_time_minutes
+        row[5] = travel_dist_miles
+
+        # commit the edits to the row
+        cursorODs.updateRow(row)
+
+        # display the results to the notebook if you want
+        print(str(ctr) + "- min: " + str(travel_time_minutes) + "; miles:" + str(travel_dist_miles))
+        ctr+=1
+
+    del cursorODs
+
 # finish up
 print("DONE")
-del cursorODs
 
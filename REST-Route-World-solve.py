@@ -1,58 +1,108 @@
 import arcpy
 import requests
 import json
+from urllib.parse import urlencode
+import route_solver   # these three are in the same folder as this script
+import route_cache
+import request_scheduler
 
 # set this value between 1-5 to control the topHierarchyLevel
 hier = "1"
 
-# FGDB and cursor built on the FC
+# your token or API key
+TOKEN = "xxxxx"
+
+# True to solve many ODs at once (see route_solver.py), False to solve
+# them one at a time in the cursor loop below
+USE_CONCURRENT_SOLVER = False
+# how many requests may be in flight at once
+MAX_IN_FLIGHT = 16
+# how many ODs to solve in each request (at most 75); None to send
+# one request per OD
+BATCH_PAIRS = 50
+# solved routes are kept in this SQLite file, so reruns and repeated ODs
+# aren't solved (and paid for) again; None to turn the cache off
+ROUTE_CACHE_PATH = r'C:\mapdata\NSroutes\data\route_cache.sqlite'
+# cached routes older than this many days are solved again
+ROUTE_CACHE_DAYS = 30
+# past this many routes, the least recently used are dropped
+ROUTE_CACHE_MAX_ENTRIES = 1000000
+# at most this many requests per second (None for no limit), and how
+# many times a throttled or failed request is retried before giving up
+MAX_REQUESTS_PER_SECOND = 10
+MAX_RETRIES = 6
+# the ODs are solved and written this many rows at a time, and the last
+# OBJECTID written is kept in this file; if a run dies partway, run the
+# script again and it carries on after that row (delete the file to
+# start over from the first row)
+CHECKPOINT_ROWS = 5000
+CHECKPOINT_PATH = r'C:\mapdata\NSroutes\data\ods_hierarchies_' + hier + '_checkpoint.json'
+
+# FGDB and the FC's fields; the first 4 are read, the last 2 are written
 arcpy.env.workspace = r'C:\mapdata\NSroutes\data\routes_data.gdb'
-cursorODs = arcpy.da.UpdateCursor("ods_hierarchies", ["Origin_Lat", "Origin_Long", "Destin_Lat", "Destin_Long", "Miles_TopH_"+hier, "Mins_TopH_"+hier])
+fc_name = "ods_hierarchies"
+fields_for_cursor = ["Origin_Lat", "Origin_Long", "Destin_Lat", "Destin_Long", "Miles_TopH_"+hier, "Mins_TopH_"+hier]
 
 # start building the REST API URL; all but the "stops"
 route_url = "https://route.arcgis.com/arcgis/rest/services/World/Route/NAServer/Route_World/solve"
-use_hier = "&useHierarchy=true"
-impedance = "&impedanceAttributeName=Miles"
-accum = "&accumulateAttributeNames=Minutes"
-directions = "&returnDirections=false"
-output_lines = "&outputLines=esriNAOutputLineNone"
-overrides = "&overrides=%7BtopHierarchyLevel=" + hier + "%7D" # ie, overrides={topHierarchyLevel=1}
-token = "&token=xxxxx" #your token or API Key goes here
-return_format = "&f=pjson"
-
-# cursor thru each record in the FC
-ctr = 0
-for row in cursorODs:
-
-    # read the origin and destination coordinates
-    origin_lat = row[0]
-    origin_lon = row[1]
-    destin_lat = row[2]
-    destin_lon = row[3]
-
-    # build the "stops" part of the REST URL
-    stops = "?stops=" + str(origin_lon) + "," + str(origin_lat) + ";" + str(destin_lon) + "," + str(destin_lat)
-
-    # build the REST URL
-    api_url = route_url + stops + use_hier + impedance + accum + directions + output_lines + overrides + token + return_format
-
-    # make the REST call, get results, convert to a Python dictionary
-    response = requests.get(api_url)
-    response_json = response.json()
-
-    # parse the JSON to grab the shortest path's mileage (and time, if you want it too)
-    attribs = response_json["routes"]["features"][0]["attributes"]
-    travel_distance_miles = int(attribs["Total_Miles"])
-    travel_time_minutes = int(attribs["Total_Minutes"])
-
-    # write the shortest path's miles and minutes into the FC
-    row[4] = travel_distance_miles
-    row[5] = travel_time_minutes
-    cursorODs.updateRow(row)
-
-    # just so that you see it running
-    print(str(ctr) + "- min: " + str(travel_time_minutes) + "; miles:" + str(travel_distance_miles))
-    ctr+=1
-  
+
+# every query parameter but the "stops", used by both ways of solving
+# (the concurrent solver hands it to requests; the loop below builds the
+# "&...&..." part of the URL out of it)
+params = {"useHierarchy": "true", "impedanceAttributeName": "Miles", "accumulateAttributeNames": "Minutes",
+          "returnDirections": "false", "outputLines": "esriNAOutputLineNone",
+          "overrides": "{topHierarchyLevel=" + hier + "}", "token": TOKEN, "f": "pjson"}
+
+if USE_CONCURRENT_SOLVER:
+    # solve the ODs not cached yet, MAX_IN_FLIGHT requests at a time, and
+    # write the results back a chunk of CHECKPOINT_ROWS rows at a time
+    cache = None
+    if ROUTE_CACHE_PATH:
+        cache = route_cache.RouteCache(ROUTE_CACHE_PATH, ROUTE_CACHE_DAYS, ROUTE_CACHE_MAX_ENTRIES)
+    scheduler = request_scheduler.RequestScheduler(MAX_REQUESTS_PER_SECOND, per_host=MAX_IN_FLIGHT,
+                                                   max_retries=MAX_RETRIES)
+    route_solver.solve_table(fc_name, fields_for_cursor[0:4], fields_for_cursor[4:6], route_url, params,
+                             ["Total_Miles", "Total_Minutes"], MAX_IN_FLIGHT, cache, BATCH_PAIRS, scheduler,
+                             CHECKPOINT_PATH, CHECKPOINT_ROWS, convert=int)
+    if cache is not None:
+        cache.close()
+
+else:
+    # cursor thru each record in the FC
+    cursorODs = arcpy.da.UpdateCursor(fc_name, fields_for_cursor)
+    ctr = 0
+    for row in cursorODs:
+
+        # read the origin and destination coordinates
+        origin_lat = row[0]
+        origin_lon = row[1]
+        destin_lat = row[2]
+        destin_lon = row[3]
+
+        # build the "stops" part of the REST URL
+        stops = "?stops=" + str(origin_lon) + "," + str(origin_lat) + ";" + str(destin_lon) + "," + str(destin_lat)
+
+        # build the REST URL
+        api_url = route_url + stops + "&" + urlencode(params)
+
+        # make the REST call, get results, convert to a Python dictionary
+        response = requests.get(api_url)
+        response_json = response.json()
+
+        # parse the JSON to grab the shortest path's mileage (and time, if you want it too)
+        attribs = response_json["routes"]["features"][0]["attributes"]
+        travel_distance_miles = int(attribs["Total_Miles"])
+        travel_time_minutes = int(attribs["Total_Minutes"])
+
+        # write the shortest path's miles and minutes into the FC
+        row[4] = travel_distance_miles
+        row[5] = travel_time_minutes
+        cursorODs.updateRow(row)
+
+        # just so that you see it running
+        print(str(ctr) + "- min: " + str(travel_time_minutes) + "; miles:" + str(travel_distance_miles))
+        ctr+=1
+
+    del cursorODs
+
 print("DONE")
-del cursorODs
@@ -0,0 +1,563 @@
+#------START OF MODULE--------------------------
+
+# The part of arcpy the scripts use, on NumPy and GDAL/OGR
+#
+# measure_track_curvature.py, create_calibration_points.py and
+# export_DX.py need ArcGIS Pro only for their geometry and cursors.
+# With this module in arcpy's place they run on any machine with GDAL's
+# Python bindings (osgeo), Linux workers included:
+#
+#   import arcpy_lite as arcpy
+#   arcpy.env.workspace = '/data/RR_Track.gdb'
+#   with arcpy.da.SearchCursor('TRK_CTL_routes', ['OID@', 'SHAPE@']) as cursor:
+#       for oid, pline in cursor:
+#           ...
+#
+# The geometry (Point, PointGeometry, Polyline, SpatialReference,
+# AsShape) is geometry_backend.py. Here are the cursors and the few
+# tools around them, reading and writing features through OGR:
+#
+#   da          SearchCursor, InsertCursor, UpdateCursor,
+#               NumPyArrayToFeatureClass
+#   management  CreateFeatureclass, CreateTable, Append, Delete
+#   env         workspace (names without a path are looked up in it)
+#   Describe, Exists, ListFields, AddFieldDelimiters
+#
+# Cursor fields can be 'OID@', 'SHAPE@', 'SHAPE@JSON', 'SHAPE@XY',
+# 'SHAPE@WKB', the OID field's name, or any other field's name.
+# Geometries go in and out of OGR as ISO WKB, so Z and M come through.
+#
+# File geodatabases are read and written with the OpenFileGDB driver
+# (writing needs GDAL 3.6 or later), GeoPackages with GPKG, and
+# shapefiles too. 'memory/name' paths are held in an OGR memory
+# datasource for as long as the process runs. Inserts and updates are
+# committed every COMMIT_ROWS rows where the datasource has real
+# transactions (GeoPackage), which is what makes bulk writes there fast.
+#
+# NOTE: a file geodatabase allows one writer, so every cursor that writes
+# to a datasource shares one handle to it. Like arcpy, CreateFeatureclass
+# fails on an existing feature class unless env.overwriteOutput is True.
+
+import os
+import re
+import shutil
+import types
+
+from osgeo import ogr, osr
+
+import coordinate_projection
+from geometry_backend import (SpatialReference, Point, Array, Geometry, PointGeometry,
+                              Polyline, Polygon, Multipoint, AsShape, FromWKB)
+
+ogr.UseExceptions()
+osr.UseExceptions()
+
+# rows written between commits
+COMMIT_ROWS = 10000
+
+# the OGR driver of each kind of datasource, by extension
+DRIVERS = {'.gdb': 'OpenFileGDB', '.gpkg': 'GPKG', '.sqlite': 'SQLite', '.shp': 'ESRI Shapefile'}
+
+# the OGR geometry type of each CreateFeatureclass geometry_type
+GEOMETRY_TYPES = {'POINT': ogr.wkbPoint, 'MULTIPOINT': ogr.wkbMultiPoint,
+                  'POLYLINE': ogr.wkbMultiLineString, 'POLYGON': ogr.wkbMultiPolygon}
+
+# arcpy's shape type of each (flattened) OGR geometry type
+SHAPE_TYPES = {ogr.wkbPoint: 'Point', ogr.wkbMultiPoint: 'Multipoint',
+               ogr.wkbLineString: 'Polyline', ogr.wkbMultiLineString: 'Polyline',
+               ogr.wkbPolygon: 'Polygon', ogr.wkbMultiPolygon: 'Polygon'}
+
+# arcpy's field type of each OGR field type (and subtype)
+FIELD_TYPES = {ogr.OFTInteger: 'Integer', ogr.OFTInteger64: 'BigInteger', ogr.OFTReal: 'Double',
+               ogr.OFTString: 'String', ogr.OFTDate: 'Date', ogr.OFTDateTime: 'Date',
+               ogr.OFTBinary: 'Blob'}
+FIELD_SUBTYPES = {ogr.OFSTInt16: 'SmallInteger', ogr.OFSTFloat32: 'Single'}
+
+_MEMORY = 'memory'
+
+# datasources open for writing, by path (one handle each, see NOTE above)
+_datasources = {}
+
+
+#-----------------------------------------------
+
+# the environment settings the scripts use
+class _Env:
+
+    def __init__(self):
+        self.workspace = None
+        self.overwriteOutput = False
+
+env = _Env()
+
+#-----------------------------------------------
+
+# split a feature class path into (datasource, layer name)
+# ...the layer is the last part after the .gdb/.gpkg (feature datasets
+# ...are flattened by OGR); a bare name is looked up in env.workspace
+def _split(path, relative=True):
+    path = str(path).replace('\\', '/').rstrip('/')
+    if path.lower() == _MEMORY or path.lower().startswith(_MEMORY + '/'):
+        return _MEMORY, path[len(_MEMORY) + 1:] or None
+    parts = path.split('/')
+    for i, part in enumerate(parts):
+        ext = os.path.splitext(part)[1].lower()
+        if ext == '.shp':
+            return path, os.path.splitext(part)[0]
+        if ext in DRIVERS:
+            return '/'.join(parts[:i + 1]), parts[-1] if i + 1 < len(parts) else None
+    if relative and env.workspace:
+        return _split(str(env.workspace).replace('\\', '/').rstrip('/') + '/' + path, False)
+    raise ValueError('not a feature class path: ' + path)
+
+# the shared (writable) handle to a datasource, opened or created as needed
+def _datasource(source, create=False):
+    if source not in _datasources:
+        if source == _MEMORY:
+            driver = ogr.GetDriverByName('Memory') or ogr.GetDriverByName('MEM')
+            ds = driver.CreateDataSource(_MEMORY)
+        elif os.path.exists(source):
+            ds = ogr.Open(source, 1)
+        elif create:
+            ds = ogr.GetDriverByName(DRIVERS[os.path.splitext(source)[1].lower()]).CreateDataSource(source)
+        else:
+            raise ValueError('datasource does not exist: ' + source)
+        _datasources[source] = ds
+    return _datasources[source]
+
+# a layer of a datasource, or a ValueError
+def _layer(ds, name, path):
+    layer = ds.GetLayerByName(name) if name else (ds.GetLayer(0) if ds.GetLayerCount() == 1 else None)
+    if layer is None:
+        raise ValueError('feature class does not exist: ' + str(path))
+    return layer
+
+#-----------------------------------------------
+
+# an OGR spatial reference from a SpatialReference or wkid (x, y order)
+def _to_osr(spatial_reference):
+    if spatial_reference is None:
+        return None
+    srs = osr.SpatialReference()
+    srs.SetFromUserInput(coordinate_projection.authority_name(SpatialReference(spatial_reference).factoryCode))
+    srs.SetAxisMappingStrategy(osr.OAMS_TRADITIONAL_GIS_ORDER)
+    return srs
+
+# the SpatialReference of an OGR spatial reference, or None
+# ...file geodatabases hold ESRI WKT without a code, so it's matched
+def _from_osr(srs):
+    if srs is None:
+        return None
+    code = srs.GetAuthorityCode(None)
+    if code is None:
+        for match, confidence in srs.FindMatches() or []:
+            if confidence >= 70 and match.GetAuthorityCode(None):
+                code = match.GetAuthorityCode(None)
+                break
+    return SpatialReference(int(code)) if code else None
+
+#-----------------------------------------------
+
+# what the cursors share: the layer, and how to get and set each field
+class _Cursor:
+
+    def __init__(self, in_table, field_names, where_clause=None, spatial_reference=None,
+                 sql_clause=(None, None), shared=True):
+        source, name = _split(in_table)
+        self._ds = _datasource(source) if shared or source == _MEMORY else ogr.Open(source, 0)
+        self._layer = _layer(self._ds, name, in_table)
+        self._source = self._layer
+        self._result_set = None
+        self._defn = self._layer.GetLayerDefn()
+        self._geom_type = self._layer.GetGeomType()
+        self._sr = _from_osr(self._layer.GetSpatialRef())
+        self._sr_out = SpatialReference(spatial_reference) if spatial_reference is not None else None
+        if self._sr_out == self._sr or self._sr is None:
+            self._sr_out = None
+        self._feature = None
+        self._pending = 0
+        self._transaction = False
+
+        fid_column = (self._layer.GetFIDColumn() or 'OBJECTID').upper()
+        if isinstance(field_names, str):
+            if field_names == '*':
+                field_names = (['OID@'] + [self._defn.GetFieldDefn(i).GetName()
+                                           for i in range(self._defn.GetFieldCount())] + ['SHAPE@'])
+            else:
+                field_names = [field_names]
+        self.fields = tuple(field_names)
+        self._getters = []
+        for field in field_names:
+            token = field.upper()
+            if token == 'OID@' or token == fid_column:
+                self._getters.append(('oid', None))
+            elif token in ('SHAPE@', 'SHAPE@JSON', 'SHAPE@XY', 'SHAPE@WKB'):
+                self._getters.append((token, None))
+            else:
+                index = self._defn.GetFieldIndex(field)
+                if index < 0:
+                    raise ValueError('no field ' + field + ' in ' + str(in_table))
+                self._getters.append(('field', index))
+
+        # ORDER BY the OID is how OGR reads anyway; anything else is run as SQL
+        prefix, postfix = sql_clause or (None, None)
+        if prefix:
+            raise ValueError('sql_clause prefixes are not supported')
+        order = re.match(r'\s*ORDER\s+BY\s+"?([\w@]+)"?\s*(ASC)?\s*$', postfix or '', re.I)
+        if postfix and not (order and order.group(1).upper() in (fid_column, 'OID@', 'FID')):
+            sql = 'SELECT * FROM "' + self._layer.GetName() + '"'
+            if where_clause:
+                sql += ' WHERE ' + where_clause
+            self._result_set = self._ds.ExecuteSQL(sql + ' ' + postfix)
+            self._source = self._result_set
+        else:
+            self._layer.SetAttributeFilter(where_clause)
+            self._layer.ResetReading()
+
+    # the value of each field of a feature, as arcpy gives them
+    def _row(self, feature):
+        geom = None
+        values = []
+        for kind, index in self._getters:
+            if kind == 'field':
+                values.append(feature.GetField(index))
+            elif kind == 'oid':
+                values.append(feature.GetFID())
+            else:
+                if geom is None:
+                    geom = self._read_geometry(feature)
+                if geom is False:
+                    values.append(None)
+                elif kind == 'SHAPE@':
+                    values.append(geom)
+                elif kind == 'SHAPE@JSON':
+                    values.append(geom.JSON)
+                elif kind == 'SHAPE@WKB':
+                    values.append(geom.WKB)
+                else:
+                    values.append(_xy(geom))
+        return values
+
+    # a feature's shape as a geometry_backend geometry (False if it has none)
+    def _read_geometry(self, feature):
+        ref = feature.GetGeometryRef()
+        if ref is None or ref.IsEmpty():
+            return False
+        geom = FromWKB(bytes(ref.ExportToIsoWkb()), self._sr)
+        if self._sr_out is not None:
+            geom = geom.projectAs(self._sr_out)
+        return geom
+
+    # set a feature's fields (and shape) from a row
+    def _fill(self, feature, row):
+        for (kind, index), value in zip(self._getters, row):
+            if kind == 'oid':
+                continue
+            if kind == 'field':
+                if value is None:
+                    feature.SetFieldNull(index)
+                else:
+                    feature.SetField(index, value.item() if hasattr(value, 'item') else value)
+            else:
+                feature.SetGeometry(self._ogr_geometry(kind, value))
+
+    # an OGR geometry of the layer's type from a cursor value
+    # ...a geometry, Esri JSON, WKB, or an (x, y) pair for 'SHAPE@XY'
+    def _ogr_geometry(self, kind, value):
+        if value is None:
+            return None
+        if kind == 'SHAPE@XY':
+            value = PointGeometry(Point(value[0], value[1]), self._sr)
+        elif isinstance(value, (bytes, bytearray)):
+            value = FromWKB(value, self._sr)
+        elif not isinstance(value, Geometry):
+            value = AsShape(value, True)
+        if self._sr is not None and value.spatialReference not in (None, self._sr):
+            value = value.projectAs(self._sr)
+        geom = ogr.CreateGeometryFromWkb(value.WKB)
+        if self._geom_type != ogr.wkbUnknown:
+            geom = ogr.ForceTo(geom, self._geom_type)
+        return geom
+
+    # start a transaction, where the datasource has real ones
+    def _begin(self):
+        if self._ds.TestCapability(ogr.ODsCTransactions):
+            self._ds.StartTransaction()
+            self._transaction = True
+
+    # count one more row written, committing every COMMIT_ROWS
+    def _written(self):
+        self._pending += 1
+        if self._transaction and self._pending >= COMMIT_ROWS:
+            self._ds.CommitTransaction()
+            self._ds.StartTransaction()
+            self._pending = 0
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        self._feature = self._source.GetNextFeature()
+        if self._feature is None:
+            raise StopIteration
+        return self._row(self._feature)
+
+    next = __next__
+
+    def reset(self):
+        self._source.ResetReading()
+
+    # commit what's been written and let go of the layer
+    def close(self):
+        if self._ds is None:
+            return
+        if self._transaction:
+            self._ds.CommitTransaction()
+            self._transaction = False
+        if self._result_set is not None:
+            self._ds.ReleaseResultSet(self._result_set)
+            self._result_set = None
+        else:
+            self._layer.SetAttributeFilter(None)
+        if self._pending:
+            self._layer.SyncToDisk()
+        self._ds = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __del__(self):
+        try:
+            self.close()
+        except Exception:
+            pass
+
+# the x, y of a shape's centroid (a point's own x, y)
+def _xy(geom):
+    centroid = geom.centroid
+    return centroid.X, centroid.Y
+
+#-----------------------------------------------
+
+# rows of a feature class, as tuples
+# ...reads through a handle of its own, so it never disturbs a writer
+class SearchCursor(_Cursor):
+
+    def __init__(self, in_table, field_names, where_clause=None, spatial_reference=None,
+                 explode_to_points=False, sql_clause=(None, None)):
+        _Cursor.__init__(self, in_table, field_names, where_clause, spatial_reference, sql_clause, shared=False)
+
+    def __next__(self):
+        return tuple(_Cursor.__next__(self))
+
+    next = __next__
+
+# new rows into a feature class; insertRow returns the new OID
+class InsertCursor(_Cursor):
+
+    def __init__(self, in_table, field_names):
+        _Cursor.__init__(self, in_table, field_names)
+        self._begin()
+
+    def insertRow(self, row):
+        feature = ogr.Feature(self._defn)
+        self._fill(feature, row)
+        self._layer.CreateFeature(feature)
+        self._written()
+        return feature.GetFID()
+
+# rows of a feature class, as lists, to change or delete as they're read
+class UpdateCursor(_Cursor):
+
+    def __init__(self, in_table, field_names, where_clause=None, spatial_reference=None,
+                 explode_to_points=False, sql_clause=(None, None)):
+        _Cursor.__init__(self, in_table, field_names, where_clause, spatial_reference, sql_clause)
+        self._begin()
+
+    def updateRow(self, row):
+        self._fill(self._feature, row)
+        self._layer.SetFeature(self._feature)
+        self._written()
+
+    def deleteRow(self):
+        self._layer.DeleteFeature(self._feature.GetFID())
+        self._written()
+
+#-----------------------------------------------
+
+# a new point feature class from a structured array
+# ...shape_fields are the array's x, y (and z) fields; the other fields
+# ...become text, double or long integer fields
+def NumPyArrayToFeatureClass(in_array, out_table, shape_fields, spatial_reference=None):
+    source, name = _split(out_table)
+    ds = _datasource(source, create=True)
+    geom_type = ogr.wkbPoint25D if len(shape_fields) == 3 else ogr.wkbPoint
+    layer = ds.CreateLayer(name, _to_osr(spatial_reference), geom_type)
+    fields = [f for f in in_array.dtype.names if f not in shape_fields]
+    for field in fields:
+        kind = in_array.dtype[field].kind
+        if kind == 'f':
+            defn = ogr.FieldDefn(field, ogr.OFTReal)
+        elif kind in 'iub':
+            defn = ogr.FieldDefn(field, ogr.OFTInteger64)
+        else:
+            defn = ogr.FieldDefn(field, ogr.OFTString)
+            if kind in 'US':
+                defn.SetWidth(in_array.dtype[field].itemsize // (4 if kind == 'U' else 1))
+        layer.CreateField(defn)
+
+    defn = layer.GetLayerDefn()
+    shape_cols = [in_array.dtype.names.index(f) for f in shape_fields]
+    field_cols = [in_array.dtype.names.index(f) for f in fields]
+    transaction = ds.TestCapability(ogr.ODsCTransactions)
+    if transaction:
+        ds.StartTransaction()
+    for row in in_array.tolist():
+        feature = ogr.Feature(defn)
+        point = ogr.Geometry(geom_type)
+        point.AddPoint(*[row[c] for c in shape_cols])
+        feature.SetGeometry(point)
+        for i, c in enumerate(field_cols):
+            feature.SetField(i, row[c])
+        layer.CreateFeature(feature)
+    if transaction:
+        ds.CommitTransaction()
+    return out_table
+
+da = types.SimpleNamespace(SearchCursor=SearchCursor, InsertCursor=InsertCursor, UpdateCursor=UpdateCursor,
+                           NumPyArrayToFeatureClass=NumPyArrayToFeatureClass)
+
+#-----------------------------------------------
+
+# a new, empty feature class, with the fields of 'template' if there is one
+# ...has_m and has_z are 'ENABLED' or 'DISABLED', as arcpy's are
+def CreateFeatureclass(out_path, out_name, geometry_type='POLYGON', template=None,
+                       has_m='DISABLED', has_z='DISABLED', spatial_reference=None):
+    path = str(out_path).replace('\\', '/').rstrip('/') + '/' + out_name
+    source, name = _split(path)
+    ds = _datasource(source, create=True)
+    if ds.GetLayerByName(name) is not None:
+        if not env.overwriteOutput:
+            raise ValueError('feature class already exists: ' + path)
+        Delete(path)
+
+    template_layer = None
+    if template:
+        template_source, template_name = _split(template)
+        template_layer = _layer(_datasource(template_source), template_name, template)
+    if spatial_reference is None and template_layer is not None:
+        srs = template_layer.GetSpatialRef()
+    else:
+        srs = _to_osr(spatial_reference)
+
+    geom_type = ogr.GT_SetModifier(GEOMETRY_TYPES[geometry_type.upper()],
+                                   str(has_z).upper() == 'ENABLED', str(has_m).upper() == 'ENABLED')
+    layer = ds.CreateLayer(name, srs, geom_type)
+    _copy_fields(template_layer, layer)
+    return path
+
+# a new, empty table (no geometry), with the fields of 'template' if there is one
+def CreateTable(out_path, out_name, template=None):
+    path = str(out_path).replace('\\', '/').rstrip('/') + '/' + out_name
+    source, name = _split(path)
+    ds = _datasource(source, create=True)
+    if ds.GetLayerByName(name) is not None:
+        if not env.overwriteOutput:
+            raise ValueError('table already exists: ' + path)
+        Delete(path)
+    layer = ds.CreateLayer(name, None, ogr.wkbNone)
+    if template:
+        template_source, template_name = _split(template)
+        _copy_fields(_layer(_datasource(template_source), template_name, template), layer)
+    return path
+
+# add the fields of a template layer (if there is one) to a new layer
+def _copy_fields(template_layer, layer):
+    if template_layer is not None:
+        template_defn = template_layer.GetLayerDefn()
+        for i in range(template_defn.GetFieldCount()):
+            layer.CreateField(template_defn.GetFieldDefn(i))
+
+# append the features of one or more feature classes to another
+# ...fields are matched by name; fields the target doesn't have are dropped
+def Append(inputs, target, schema_type='TEST'):
+    target_fields = _field_names(target)
+    for source in ([inputs] if isinstance(inputs, str) else inputs):
+        fields = [f for f in _field_names(source) if f.upper() in target_fields]
+        with SearchCursor(source, ['SHAPE@'] + fields) as cursorREAD:
+            with InsertCursor(target, ['SHAPE@'] + fields) as cursorWRITE:
+                for row in cursorREAD:
+                    cursorWRITE.insertRow(row)
+    return target
+
+# delete a feature class (or a whole datasource)
+def Delete(in_data):
+    source, name = _split(in_data)
+    if name is None:
+        _datasources.pop(source, None)
+        if os.path.isdir(source):
+            shutil.rmtree(source)
+        elif os.path.exists(source):
+            os.remove(source)
+        return in_data
+    ds = _datasource(source)
+    for i in range(ds.GetLayerCount()):
+        if ds.GetLayer(i).GetName() == name:
+            ds.DeleteLayer(i)
+            break
+    return in_data
+
+management = types.SimpleNamespace(CreateFeatureclass=CreateFeatureclass, CreateTable=CreateTable, Append=Append,
+                                   Delete=Delete)
+
+#-----------------------------------------------
+
+# the upper-case names of a feature class's (non-OID) fields
+def _field_names(path):
+    source, name = _split(path)
+    defn = _layer(_datasource(source), name, path).GetLayerDefn()
+    return [defn.GetFieldDefn(i).GetName().upper() for i in range(defn.GetFieldCount())]
+
+# whether a feature class (or datasource) exists
+def Exists(path):
+    try:
+        source, name = _split(path)
+    except ValueError:
+        return False
+    if source == _MEMORY:
+        return source in _datasources and (name is None or _datasources[source].GetLayerByName(name) is not None)
+    if not os.path.exists(source):
+        return False
+    return name is None or _datasource(source).GetLayerByName(name) is not None
+
+# what the scripts ask Describe for about a feature class
+def Describe(path):
+    source, name = _split(path)
+    layer = _layer(_datasource(source), name, path)
+    geom_type = layer.GetGeomType()
+    return types.SimpleNamespace(name=layer.GetName(), catalogPath=str(path), dataType='FeatureClass',
+                                 spatialReference=_from_osr(layer.GetSpatialRef()),
+                                 OIDFieldName=layer.GetFIDColumn() or 'OBJECTID',
+                                 shapeType=SHAPE_TYPES.get(ogr.GT_Flatten(geom_type)),
+                                 hasZ=bool(ogr.GT_HasZ(geom_type)), hasM=bool(ogr.GT_HasM(geom_type)))
+
+# the (non-OID, non-shape) fields of a feature class, with the name,
+# type and length arcpy gives them
+def ListFields(dataset):
+    source, name = _split(dataset)
+    defn = _layer(_datasource(source), name, dataset).GetLayerDefn()
+    fields = []
+    for i in range(defn.GetFieldCount()):
+        fd = defn.GetFieldDefn(i)
+        field_type = FIELD_SUBTYPES.get(fd.GetSubType(), FIELD_TYPES.get(fd.GetType(), 'String'))
+        fields.append(types.SimpleNamespace(name=fd.GetName(), type=field_type, length=fd.GetWidth()))
+    return fields
+
+# a field name quoted for a where clause (double quotes in a GDB or GPKG)
+def AddFieldDelimiters(datasource, field):
+    return '"' + field + '"'
+
+#------END OF MODULE----------------------------
@@ -0,0 +1,207 @@
+#------START OF MODULE--------------------------
+
+# Hash-join attachment copying for copy-attachments.py
+#
+# The original copy runs two SelectLayerByAttribute calls and opens two
+# SearchCursors for every output feature, and a new InsertCursor for
+# every attachment. Here each table is read once:
+#
+#   1. the input and output feature classes are read into dicts keyed
+#      on the link field (e.g. 'boroname'), giving a map from each
+#      input OBJECTID to the output OBJECTID(s) it links to
+#   2. the input attachments table is read in one pass, and every
+#      attachment whose REL_OBJECTID is in that map is written through
+#      a single InsertCursor, once per linked output feature
+#
+# Only the OBJECTIDs and link values are held in memory, never the
+# attachment BLOBs, so memory stays small on tables with hundreds of
+# thousands of photos. No selection layers are created.
+#
+# copy_attachments_checked() does the same join but also checks each
+# DATA_SIZE against the bytes actually copied, and reports throughput.
+#
+# Given a manifest (see open_manifest), the checked copy is also
+# incremental: the manifest records which input attachment (by its
+# ATTACHMENTID) has been written to which output feature, and an
+# attachment already written there is skipped. Reruns only copy what's
+# new, and a crashed run picks up where it left off without writing
+# duplicates. Two attachments with the same name and bytes on one
+# feature are still two attachments, and both are copied.
+
+import collections
+import hashlib
+import sqlite3
+import time
+import arcpy
+
+# manifest rows are committed this often
+MANIFEST_COMMIT_ROWS = 1000
+
+
+#-----------------------------------------------
+
+# map each input OBJECTID to the output OBJECTIDs that share its link value
+# ...features with a null link value are never matched, just as the
+# ...original "boroname = '...'" selection never matched them
+def join_index(fcIN, fcOUT, link_field):
+    out_oids = collections.defaultdict(list)
+    with arcpy.da.SearchCursor(fcOUT, ['OID@', link_field]) as cursor:
+        for oid, link in cursor:
+            if link is not None:
+                out_oids[link].append(oid)
+
+    in_to_out = {}
+    with arcpy.da.SearchCursor(fcIN, ['OID@', link_field]) as cursor:
+        for oid, link in cursor:
+            if link in out_oids:
+                in_to_out[oid] = out_oids[link]
+    return in_to_out
+
+#-----------------------------------------------
+
+# copy every matched attachment in one pass over the input table
+# ...fields starts with 'REL_OBJECTID' and is the same for both tables
+# ...returns the number of attachment rows written
+def copy_attachments(tblAttIN, tblAttOUT, fields, in_to_out):
+    written = 0
+    with arcpy.da.SearchCursor(tblAttIN, fields) as cursorREAD, \
+         arcpy.da.InsertCursor(tblAttOUT, fields) as cursorWRITE:
+        for row in cursorREAD:
+            for out_oid in in_to_out.get(row[0], ()):
+                cursorWRITE.insertRow((out_oid,) + tuple(row[1:]))
+                written += 1
+    return written
+
+#-----------------------------------------------
+
+# SHA-256 of a BLOB (None for a null BLOB)
+def blob_digest(blob):
+    if blob is None:
+        return None
+    return hashlib.sha256(memoryview(blob)).hexdigest()
+
+#-----------------------------------------------
+
+# open (or create) the SQLite manifest of attachments already written
+# ...one row per written attachment: the ATTACHMENTID of the input row,
+# ...the output REL_OBJECTID it was written to, and the OBJECTID of the
+# ...row in the output table
+def open_manifest(path):
+    conn = sqlite3.connect(path)
+    conn.execute('CREATE TABLE IF NOT EXISTS copied ('
+                 'attachment_id INTEGER NOT NULL, rel_objectid INTEGER NOT NULL, '
+                 'out_oid INTEGER NOT NULL, PRIMARY KEY (attachment_id, rel_objectid))')
+    conn.commit()
+    return conn
+
+# bring the manifest in line with what's really in the output table
+# ...entries whose output row is gone (deleted by hand, or lost in a
+# ...crash) are dropped
+# ...output rows the manifest doesn't know (written after its last
+# ...commit, the window a crash leaves behind) can't be traced back to
+# ...an input attachment from the output table alone, so they're
+# ...returned as {(REL_OBJECTID, ATT_NAME, digest of DATA): [OBJECTID,
+# ......]} for the copy to match up against the input attachments
+# ...returns (dropped, unrecorded)
+def reconcile_manifest(conn, tblAttOUT):
+    out_oids = set()
+    with arcpy.da.SearchCursor(tblAttOUT, ['OID@']) as cursor:
+        for (oid,) in cursor:
+            out_oids.add(oid)
+
+    recorded = set(oid for (oid,) in conn.execute('SELECT out_oid FROM copied'))
+    gone = recorded - out_oids
+    conn.executemany('DELETE FROM copied WHERE out_oid = ?', [(oid,) for oid in gone])
+    conn.commit()
+
+    missing = out_oids - recorded
+    unrecorded = collections.defaultdict(list)
+    if missing:
+        oid_field = arcpy.Describe(tblAttOUT).OIDFieldName
+        where = arcpy.AddFieldDelimiters(tblAttOUT, oid_field) + ' >= ' + str(min(missing))
+        fields = ['OID@', 'REL_OBJECTID', 'ATT_NAME', 'DATA']
+        with arcpy.da.SearchCursor(tblAttOUT, fields, where) as cursor:
+            for oid, rel_oid, att_name, blob in cursor:
+                if oid in missing:
+                    unrecorded[(rel_oid, att_name or '', blob_digest(blob) or '')].append(oid)
+    return len(gone), unrecorded
+
+#-----------------------------------------------
+
+# copy every matched attachment, as copy_attachments() does, checking
+# each DATA_SIZE against its BLOB
+#
+# Each BLOB is read whole (as copy_attachments() reads it too), so this
+# doesn't use any less memory; what it adds is the size check, the
+# throughput stats and the manifest.
+#
+# 'manifest' is an open_manifest() connection, or None to copy everything.
+# With a manifest, the output table is reconciled against it first, and
+# attachments already written are skipped.
+#
+# fields must be ['REL_OBJECTID', 'CONTENT_TYPE', 'ATT_NAME', 'DATA_SIZE', 'DATA'].
+# Returns a dict of stats: rows, bytes, seconds, mb_per_s, skipped, and
+# size_mismatches (the input OBJECTIDs whose DATA_SIZE was wrong; the
+# copy is written with the true size).
+def copy_attachments_checked(tblAttIN, tblAttOUT, fields, in_to_out, manifest=None):
+    idx_name = fields.index('ATT_NAME')
+    idx_size = fields.index('DATA_SIZE')
+    idx_data = fields.index('DATA')
+    stats = {'rows': 0, 'bytes': 0, 'seconds': 0.0, 'mb_per_s': 0.0,
+             'skipped': 0, 'size_mismatches': []}
+    started = time.perf_counter()
+    unrecorded = {}
+    if manifest is not None:
+        unrecorded = reconcile_manifest(manifest, tblAttOUT)[1]
+    uncommitted = 0
+
+    with arcpy.da.SearchCursor(tblAttIN, ['OID@'] + fields) as cursorREAD, \
+         arcpy.da.InsertCursor(tblAttOUT, fields) as cursorWRITE:
+        for row in cursorREAD:
+            in_oid, row = row[0], row[1:]
+            if row[0] not in in_to_out:
+                continue
+            blob = row[idx_data]
+            copied = memoryview(blob).nbytes if blob is not None else 0
+            if row[idx_size] != copied:
+                stats['size_mismatches'].append(in_oid)
+            values = list(row)
+            values[idx_size] = copied
+
+            # write it to every output feature it links to
+            # ...unless the manifest says that feature already has it
+            for out_oid in in_to_out[row[0]]:
+                new_oid = None
+                if manifest is not None:
+                    if manifest.execute('SELECT 1 FROM copied WHERE attachment_id = ? AND rel_objectid = ?',
+                                        (in_oid, out_oid)).fetchone():
+                        stats['skipped'] += 1
+                        continue
+                    # (a row a crashed run wrote but never recorded)
+                    if unrecorded:
+                        left = unrecorded.get((out_oid, row[idx_name] or '', blob_digest(blob) or ''))
+                        if left:
+                            new_oid = left.pop()
+                            stats['skipped'] += 1
+                if new_oid is None:
+                    values[0] = out_oid
+                    new_oid = cursorWRITE.insertRow(values)
+                    stats['rows'] += 1
+                    stats['bytes'] += copied
+                if manifest is not None:
+                    manifest.execute('INSERT OR IGNORE INTO copied VALUES (?, ?, ?)', (in_oid, out_oid, new_oid))
+                    uncommitted += 1
+                    if uncommitted >= MANIFEST_COMMIT_ROWS:
+                        manifest.commit()
+                        uncommitted = 0
+            # drop this BLOB before the cursor fetches the next one
+            del blob, values
+
+    if manifest is not None:
+        manifest.commit()
+    stats['seconds'] = time.perf_counter() - started
+    if stats['seconds'] > 0:
+        stats['mb_per_s'] = stats['bytes'] / (1024 * 1024) / stats['seconds']
+    return stats
+
+#------END OF MODULE----------------------------
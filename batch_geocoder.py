@@ -0,0 +1,243 @@
+#------START OF MODULE--------------------------
+
+# Batch geocoding for geocode-then-find-congress.py
+#
+# Geocodes a whole file of addresses with the World Geocoding Service's
+# geocodeAddresses operation, 'batch_size' addresses per request and a
+# few requests in flight at once, instead of one findAddressCandidates
+# call per address:
+#
+#   records = read_addresses('addresses.csv', 'Address', 'ID')
+#   for row_id, address, result in geocode_stream(records, params):
+#       ...
+#
+# The input is read a row at a time (CSV) or a record batch at a time
+# (Parquet), and the results come back in input order as each batch of
+# requests finishes, so write_results() can write them out as they
+# arrive. At most 'window' batches are held at once, however big the
+# input is.
+#
+# Results are remembered by normalized address (upper case, punctuation
+# and extra spaces dropped), so an address that repeats in the file is
+# only sent once. The memo is an LRU of at most MEMO_ENTRIES addresses.
+#
+# NOTE: geocodeAddresses results must be stored ('forStorage': 'true'),
+# which is billed as such. Parquet input and output need pyarrow.
+
+import collections
+import csv
+import json
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+import request_scheduler
+
+# the World Geocoding Service batch operation
+GEOCODE_ADDRESSES_URL = 'https://geocode.arcgis.com/arcgis/rest/services/World/GeocodeServer/geocodeAddresses'
+
+# addresses per request (the service allows up to 1000, suggests 150)
+BATCH_SIZE = 150
+
+# requests in flight at once
+CONCURRENCY = 4
+
+# addresses remembered, most recently used first
+MEMO_ENTRIES = 1000000
+
+# the columns written for each address
+RESULT_FIELDS = ['id', 'address', 'x', 'y', 'score', 'match_addr', 'status']
+
+# rows between progress messages
+REPORT_ROWS = 10000
+
+
+#-----------------------------------------------
+
+# the key an address is remembered by
+def normalize_address(address):
+    return ' '.join(re.sub(r'[^\w#/-]+', ' ', str(address).upper()).split())
+
+# yield (row_id, address) for every row of a CSV or Parquet file
+# ...row_id is the id_field's value, or the row number if there's none
+def read_addresses(path, address_field, id_field=None):
+    if os.path.splitext(path)[1].lower() in ('.parquet', '.pq'):
+        import pyarrow.parquet as pq
+        columns = [address_field] + ([id_field] if id_field else [])
+        n = 0
+        for batch in pq.ParquetFile(path).iter_batches(columns=columns):
+            data = batch.to_pydict()
+            for i, address in enumerate(data[address_field]):
+                yield (data[id_field][i] if id_field else n), address
+                n += 1
+    else:
+        with open(path, 'r', newline='', encoding='utf-8-sig') as fileIN:
+            for n, row in enumerate(csv.DictReader(fileIN)):
+                yield (row[id_field] if id_field else n), row[address_field]
+
+#-----------------------------------------------
+
+# the result of one geocodeAddresses location, or None if it didn't match
+def location_result(location):
+    attribs = location.get('attributes', {})
+    point = location.get('location') or {}
+    if attribs.get('Status', 'U') == 'U' or point.get('x') is None:
+        return None
+    return {'x': point['x'], 'y': point['y'], 'score': location.get('score', attribs.get('Score')),
+            'match_addr': location.get('address', attribs.get('Match_addr')),
+            'status': attribs.get('Status')}
+
+# geocode one batch of addresses, returns {normalized address: result}
+# ...a failed request leaves its addresses out, so they come back as None
+def geocode_batch(scheduler, session, url, params, batch):
+    records = [{'attributes': {'OBJECTID': i, 'SingleLine': address}}
+               for i, (key, address) in enumerate(batch)]
+    data = dict(params, addresses=json.dumps({'records': records}))
+    response = scheduler.post_json(session, url, data)
+    if 'error' in response:
+        print('geocode batch failed: ' + str(response['error']))
+    results = {}
+    for location in response.get('locations', []):
+        i = location.get('attributes', {}).get('ResultID')
+        if i is not None and 0 <= i < len(batch):
+            results[batch[i][0]] = location_result(location)
+    return results
+
+#-----------------------------------------------
+
+# geocode a stream of (row_id, address), yielding (row_id, address, result)
+# ...in input order; result is a dict of RESULT_FIELDS values, or None
+# ...params holds the token, 'f' and 'forStorage' (and any other options)
+# ...window is the most batches in flight or waiting to be yielded
+# ...session is an optional requests.Session to send with (one is made
+# ...and closed otherwise)
+def geocode_stream(records, params, url=GEOCODE_ADDRESSES_URL, batch_size=BATCH_SIZE,
+                   concurrency=CONCURRENCY, scheduler=None, window=None, session=None):
+    scheduler = scheduler or request_scheduler.RequestScheduler(per_host=concurrency)
+    window = window or 2 * concurrency
+    memo = collections.OrderedDict()
+    in_flight = {}          # normalized address -> future of the batch sending it
+    queue = collections.deque()
+    stats = {'rows': 0, 'sent': 0, 'memo_hits': 0, 'matched': 0}
+
+    # the rows of one chunk of input, plus the request for its new addresses
+    # ...a memo hit's result is taken now, and a repeat of an address still
+    # ...in flight keeps the future sending it, so neither depends on the
+    # ...memo still holding the address when the chunk is drained
+    def submit(executor, rows):
+        batch = []
+        known = {}          # normalized address -> result from the memo
+        pending = {}        # normalized address -> future of the batch sending it
+        new_keys = set()
+        for row_id, address, key in rows:
+            if key in known or key in pending or key in new_keys:
+                stats['memo_hits'] += 1
+            elif key in memo:
+                memo.move_to_end(key)
+                known[key] = memo[key]
+                stats['memo_hits'] += 1
+            elif key in in_flight:
+                pending[key] = in_flight[key]
+                stats['memo_hits'] += 1
+            else:
+                new_keys.add(key)
+                batch.append((key, address))
+        future = None
+        if batch:
+            future = executor.submit(geocode_batch, scheduler, session, url, params, batch)
+            for key, address in batch:
+                in_flight[key] = future
+                pending[key] = future
+            stats['sent'] += len(batch)
+        queue.append((rows, batch, future, known, pending))
+
+    # yield the oldest chunk's results, once its request is back
+    def drain():
+        rows, batch, future, known, pending = queue.popleft()
+        results = future.result() if future is not None else {}
+        for key, address in batch:
+            memo[key] = results.get(key)
+            in_flight.pop(key, None)
+        while len(memo) > MEMO_ENTRIES:
+            memo.popitem(last=False)
+        for row_id, address, key in rows:
+            result = known[key] if key in known else pending[key].result().get(key)
+            stats['rows'] += 1
+            if result is not None:
+                stats['matched'] += 1
+            if stats['rows'] % REPORT_ROWS == 0:
+                print(str(stats['rows']) + ' addresses geocoded')
+            yield row_id, address, result
+
+    own_session = session is None
+    if own_session:
+        session = requests.Session()
+    try:
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            rows = []
+            for row_id, address in records:
+                rows.append((row_id, address, normalize_address(address)))
+                if len(rows) == batch_size:
+                    submit(executor, rows)
+                    rows = []
+                    if len(queue) >= window:
+                        yield from drain()
+            if rows:
+                submit(executor, rows)
+            while queue:
+                yield from drain()
+    finally:
+        if own_session:
+            session.close()
+    print(str(stats['rows']) + ' addresses, ' + str(stats['matched']) + ' matched; '
+          + str(stats['sent']) + ' sent to the service, ' + str(stats['memo_hits']) + ' repeats not sent')
+
+#-----------------------------------------------
+
+# write geocoded rows to a CSV or Parquet file as they arrive
+# ...rows is what geocode_stream() yields; extra_fields are more result
+# ...keys to write as text columns (e.g. the district fields added by
+# ...district_index.assign_districts); returns the number written
+def write_results(rows, path, chunk_rows=BATCH_SIZE * 10, extra_fields=()):
+    fields = RESULT_FIELDS + list(extra_fields)
+    written = 0
+
+    def row_values(row_id, address, result):
+        result = result or {}
+        return [row_id, address] + [result.get(field) for field in fields[2:]]
+
+    if os.path.splitext(path)[1].lower() in ('.parquet', '.pq'):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        types = {'x': pa.float64(), 'y': pa.float64(), 'score': pa.float64()}
+        schema = pa.schema([(field, types.get(field, pa.string())) for field in fields])
+
+        def table(batch):
+            columns = [list(column) for column in zip(*batch)]
+            for i, field in enumerate(fields):
+                if field not in types:
+                    columns[i] = [None if v is None else str(v) for v in columns[i]]
+            return pa.Table.from_arrays([pa.array(c, schema.field(i).type) for i, c in enumerate(columns)],
+                                        schema=schema)
+
+        with pq.ParquetWriter(path, schema) as writer:
+            batch = []
+            for row in rows:
+                batch.append(row_values(*row))
+                written += 1
+                if len(batch) == chunk_rows:
+                    writer.write_table(table(batch))
+                    batch = []
+            if batch:
+                writer.write_table(table(batch))
+    else:
+        with open(path, 'w', newline='', encoding='utf-8') as fileOUT:
+            writer = csv.writer(fileOUT)
+            writer.writerow(fields)
+            for row in rows:
+                writer.writerow(row_values(*row))
+                written += 1
+    return written
+
+#------END OF MODULE----------------------------
@@ -0,0 +1,262 @@
+########
+#
+# Script: "benchmark_rest.py"
+#
+# THROUGHPUT OF THE REST CLIENTS AGAINST THE LOCAL STAND-IN SERVICES
+#
+# Description:
+#
+# Starts mock_services.py on a background thread, then runs the same
+# made-up workload through each way the scripts can talk to the World
+# Route and World Geocoding services:
+#
+#   route serial         one requests.get per OD, one after another
+#                        (the original REST-API-example.py loop)
+#   route concurrent     route_solver.solve_ods, MAX_IN_FLIGHT at a time
+#   route batched        ... plus BATCH_PAIRS ODs per request
+#   route scheduled      ... plus the retrying request scheduler
+#   route cached         ... over a route cache warmed by an untimed run
+#   geocode serial       one findAddressCandidates per address
+#   geocode batch        batch_geocoder.geocode_stream
+#
+# and prints, for each: the requests sent, requests/sec, the p50 and
+# p99 request latency seen by the client, and end-to-end rows/sec.
+#
+# No credits are used and no network is needed, so the numbers can be
+# compared from one change to the next. The workload, and the mock
+# services' jitter and failures, are seeded with SEED, so they're the
+# same every run (the mock is reseeded before each mode). No arcpy needed.
+#
+########
+
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# in the same folder as this script
+import mock_services
+import route_solver
+import route_cache
+import request_scheduler
+import batch_geocoder
+
+
+#### SETTINGS
+
+# ODs (or addresses) per run; the serial modes wait for every request
+# one at a time, so they get fewer rows
+ROWS = 2000
+SERIAL_ROWS = 200
+
+# share of the rows that repeat an earlier row (so caches have work to do)
+REPEAT_SHARE = 0.2
+
+# the mock services' behaviour (see mock_services.py)
+LATENCY = 0.08
+JITTER = 0.03
+PER_ITEM = 0.002
+THROTTLE_RATE = 0.0
+ERROR_RATE = 0.0
+JSON_ERROR_RATE = 0.0
+
+# client settings
+MAX_IN_FLIGHT = 16
+BATCH_PAIRS = 50
+GEOCODE_BATCH_SIZE = 150
+
+# the modes to run (None for all of them)
+MODES = None
+
+# also write the results to this JSON file (None for just printing them)
+OUTPUT_JSON = None
+
+SEED = 42
+
+
+#-----------------------------------------------
+
+# a session that records how long each request takes
+# ...its pool holds MAX_IN_FLIGHT connections, as route_solver.make_session's does
+class TimedSession(requests.Session):
+
+    def __init__(self):
+        requests.Session.__init__(self)
+        self.latencies = []
+        self.lock = threading.Lock()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=MAX_IN_FLIGHT)
+        self.mount('http://', adapter)
+        self.mount('https://', adapter)
+
+    def request(self, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return requests.Session.request(self, *args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - start
+            with self.lock:
+                self.latencies.append(elapsed)
+
+#-----------------------------------------------
+
+# the made-up workload: ODs as (origin_lat, origin_lon, destin_lat, destin_lon)
+# ...and addresses, each with REPEAT_SHARE of repeats
+def make_ods(n, rng):
+    ods = []
+    for _ in range(n):
+        if ods and rng.random() < REPEAT_SHARE:
+            ods.append(rng.choice(ods))
+        else:
+            ods.append((rng.uniform(25, 49), rng.uniform(-124, -67), rng.uniform(25, 49), rng.uniform(-124, -67)))
+    return ods
+
+def make_addresses(n, rng):
+    addresses = []
+    for _ in range(n):
+        if addresses and rng.random() < REPEAT_SHARE:
+            addresses.append(rng.choice(addresses))
+        else:
+            addresses.append(str(rng.randint(1, 9999)) + ' ' + rng.choice(['Main', 'Oak', 'Elm', 'Park', 'Pine'])
+                             + ' St, Town ' + str(rng.randint(1, 500)))
+    return addresses
+
+#-----------------------------------------------
+
+# one GET on a new connection, as requests.get() does, timed into 'session'
+def _get_once(session, url, params):
+    with TimedSession() as once:
+        once.get(url, params=params).json()
+    session.latencies.extend(once.latencies)
+
+# each mode: runs 'rows' of the workload through one client, using 'session'
+def route_serial(base_url, ods, session):
+    url = mock_services.route_url(base_url)
+    for od in ods:
+        _get_once(session, url, {'stops': route_solver.stops_param(*od), 'f': 'pjson'})
+
+def route_concurrent(base_url, ods, session):
+    route_solver.solve_ods(ods, mock_services.route_url(base_url), {'f': 'pjson'},
+                           ['Total_TravelTime', 'Total_Miles'], MAX_IN_FLIGHT, session)
+
+def route_batched(base_url, ods, session):
+    route_solver.solve_ods(ods, mock_services.route_url(base_url), {'f': 'pjson'},
+                           ['Total_TravelTime', 'Total_Miles'], MAX_IN_FLIGHT, session, batch_pairs=BATCH_PAIRS)
+
+def route_scheduled(base_url, ods, session):
+    scheduler = request_scheduler.RequestScheduler(per_host=MAX_IN_FLIGHT, base_delay=0.1)
+    route_solver.solve_ods(ods, mock_services.route_url(base_url), {'f': 'pjson'},
+                           ['Total_TravelTime', 'Total_Miles'], MAX_IN_FLIGHT, session,
+                           batch_pairs=BATCH_PAIRS, scheduler=scheduler)
+    scheduler.report()
+
+# fill a route cache with a cold run (before the timer starts), for route_cached
+def warm_route_cache(base_url, ods):
+    path = os.path.join(tempfile.mkdtemp(), 'route_cache.sqlite')
+    cache = route_cache.RouteCache(path)
+    route_solver.solve_ods(ods, mock_services.route_url(base_url), {'f': 'pjson'}, ['Total_Miles'],
+                           MAX_IN_FLIGHT, cache=cache, batch_pairs=BATCH_PAIRS)
+    return {'cache': cache}
+
+def route_cached(base_url, ods, session, cache):
+    route_solver.solve_ods(ods, mock_services.route_url(base_url), {'f': 'pjson'}, ['Total_Miles'],
+                           MAX_IN_FLIGHT, session, cache=cache, batch_pairs=BATCH_PAIRS)
+    cache.close()
+
+def geocode_serial(base_url, addresses, session):
+    url = mock_services.candidates_url(base_url)
+    for address in addresses:
+        _get_once(session, url, {'SingleLine': address, 'f': 'json'})
+
+def geocode_batch(base_url, addresses, session):
+    records = enumerate(addresses)
+    for row in batch_geocoder.geocode_stream(records, {'f': 'json', 'forStorage': 'true'},
+                                             mock_services.geocode_addresses_url(base_url),
+                                             GEOCODE_BATCH_SIZE, 4, session=session):
+        pass
+
+# (name, function, workload, serial?, setup): the workload is a key of
+# the workloads dict, and a serial mode only gets SERIAL_ROWS of it;
+# setup(base_url, rows), if there is one, runs before the timer starts
+# and returns more keyword arguments for the function
+ALL_MODES = [('route serial', route_serial, 'ods', True, None),
+             ('route concurrent', route_concurrent, 'ods', False, None),
+             ('route batched', route_batched, 'ods', False, None),
+             ('route scheduled', route_scheduled, 'ods', False, None),
+             ('route cached', route_cached, 'ods', False, warm_route_cache),
+             ('geocode serial', geocode_serial, 'addresses', True, None),
+             ('geocode batch', geocode_batch, 'addresses', False, None)]
+
+#-----------------------------------------------
+
+# the p-th percentile (0-100) of a list of numbers, or None
+def percentile(values, p):
+    if not values:
+        return None
+    values = sorted(values)
+    k = (len(values) - 1) * p / 100.0
+    f = int(k)
+    c = min(f + 1, len(values) - 1)
+    return values[f] + (values[c] - values[f]) * (k - f)
+
+# run one mode, returning its numbers as a dict
+# ...only the function is timed, not its setup
+def run_mode(name, function, base_url, rows, setup=None):
+    kwargs = setup(base_url, rows) if setup is not None else {}
+    session = TimedSession()
+    start = time.perf_counter()
+    function(base_url, rows, session, **kwargs)
+    seconds = time.perf_counter() - start
+    session.close()
+    latencies = session.latencies
+    return {'mode': name, 'rows': len(rows), 'requests': len(latencies), 'seconds': seconds,
+            'requests_per_s': len(latencies) / seconds if seconds else None,
+            'p50_ms': None if not latencies else 1000 * percentile(latencies, 50),
+            'p99_ms': None if not latencies else 1000 * percentile(latencies, 99),
+            'rows_per_s': len(rows) / seconds if seconds else None}
+
+# a number for the table, or '-'
+def _cell(value, fmt='%.1f'):
+    return '-' if value is None else fmt % value
+
+def print_table(results):
+    print('')
+    print('%-16s %7s %9s %9s %9s %9s %10s' % ('mode', 'rows', 'requests', 'req/s', 'p50 ms', 'p99 ms', 'rows/s'))
+    for r in results:
+        print('%-16s %7d %9d %9s %9s %9s %10s' % (r['mode'], r['rows'], r['requests'], _cell(r['requests_per_s']),
+                                                  _cell(r['p50_ms']), _cell(r['p99_ms']), _cell(r['rows_per_s'])))
+
+
+if __name__ == '__main__':
+    rng = random.Random(SEED)
+    workloads = {'ods': make_ods(ROWS, rng), 'addresses': make_addresses(ROWS, rng)}
+    server, base_url = mock_services.start_server(0, LATENCY, JITTER, PER_ITEM, THROTTLE_RATE,
+                                                  ERROR_RATE, JSON_ERROR_RATE, seed=SEED)
+    settings = {'rows': ROWS, 'serial_rows': SERIAL_ROWS, 'repeat_share': REPEAT_SHARE, 'latency': LATENCY,
+                'jitter': JITTER, 'per_item': PER_ITEM, 'throttle_rate': THROTTLE_RATE, 'error_rate': ERROR_RATE,
+                'json_error_rate': JSON_ERROR_RATE, 'max_in_flight': MAX_IN_FLIGHT, 'batch_pairs': BATCH_PAIRS,
+                'geocode_batch_size': GEOCODE_BATCH_SIZE, 'seed': SEED}
+    print('mock services on ' + base_url + ', ' + json.dumps(settings))
+
+    results = []
+    try:
+        for name, function, workload, serial, setup in ALL_MODES:
+            if MODES is not None and name not in MODES:
+                continue
+            rows = workloads[workload][:SERIAL_ROWS] if serial else workloads[workload]
+            print('\n-- ' + name)
+            server.reseed(SEED)
+            results.append(run_mode(name, function, base_url, rows, setup))
+    finally:
+        server.shutdown()
+
+    print_table(results)
+    if OUTPUT_JSON:
+        with open(OUTPUT_JSON, 'w') as fileOUT:
+            json.dump({'settings': settings, 'results': results}, fileOUT, indent=2)
+
+#------END OF SCRIPT----
@@ -0,0 +1,63 @@
+########
+#
+# Script: "build_measure_index.py"
+#
+# BUILD THE MEMORY-MAPPED MEASURE INDEX OVER THE ROUTES AND CURVE POINTS
+#
+# Description:
+#
+# Builds the folder of arrays measure_index.MeasureIndex opens: every
+# route's segments, read from the routes FC as SHAPE@JSON, and every
+# route's curve points. Once built, a process answers milepost -> XY,
+# XY -> nearest curve point or milepost, and milepost range -> curve
+# points lookups straight from the memory-mapped files, without opening
+# the FGDB (see measure_index.py).
+#
+# The routes FC, route id field, spatial references and curve point
+# interval are those of measure_track_curvature.py, so the index sees
+# the same vertex arrays the curvature script reads.
+#
+# Prep:
+#
+# Set STATIONS_PATH to the COLUMNAR_FOLDER of a curvature run to index
+# the curve points it wrote, or leave it None to compute them again
+# here with the NumPy engine.
+#
+########
+
+#### SETTINGS
+
+# (these modules are in the same folder as this script)
+import columnar_output
+import measure_index
+import measure_track_curvature as curvature
+import telemetry
+
+# the index folder to build (an older index there is replaced)
+INDEX_FOLDER = 'C:/mapdata/Curvature/data/measure_index'
+
+# Arrow/Parquet curve point files of a curvature run, or None to compute them
+STATIONS_PATH = None
+
+# where to write the stage timings and counters at the end of the run
+# (JSON, Prometheus text), or None (see telemetry.py)
+TELEMETRY_JSON = None
+TELEMETRY_PROMETHEUS = None
+
+
+#-----------------------------------------------
+
+if __name__ == '__main__':
+
+    # every route in the FC, in OBJECTID order, as the curvature script reads them
+    cursorREAD = curvature.arcpy.da.SearchCursor(curvature.fcIN, [curvature.ROUTE_ID_FIELD, 'SHAPE@JSON'],
+                                                 sql_clause=(None, 'ORDER BY OBJECTID'))
+    routes = ((row[0], row[1]) for row in telemetry.timed_iter('cursor_read', cursorREAD))
+
+    stations = columnar_output.read_arrays(STATIONS_PATH) if STATIONS_PATH else None
+    measure_index.build_index(routes, INDEX_FOLDER, curvature.settings, stations)
+    del cursorREAD
+
+    telemetry.export(TELEMETRY_JSON, TELEMETRY_PROMETHEUS)
+
+#------END OF SCRIPT----
@@ -0,0 +1,213 @@
+#------START OF MODULE--------------------------
+
+# Bulk calibration point writer for create_calibration_points.py
+#
+# Instead of one insertRow() per vertex, every route's vertices go into
+# a NumPy structured array (X, Y, Z, RouteName, RouteId, Measure). The
+# arrays are gathered into fixed-size chunks, and each chunk is bulk
+# loaded: NumPyArrayToFeatureClass into the memory workspace, then one
+# Append into the calibration points feature class.
+#
+# NumPyArrayToFeatureClass can set X, Y and Z but not M, so the points
+# come out without M: their measures are only in the Measure field
+# (which is what the LRS Network reads from its Calibration_Points).
+# Use the insertRow path if the points themselves need their M values.
+#
+# The RouteName and RouteId columns take the type and width of the
+# output feature class's own fields (see target_dtype), so long IDs
+# aren't cut short and numeric IDs stay numbers.
+#
+# Optional thinning keeps only the vertices the LRS needs: Generate
+# Routes interpolates measures linearly between calibration points, so a
+# vertex whose M already lies on the line between its neighbours (within
+# a tolerance) adds nothing. The first and last vertex of every part, and
+# every vertex where the measures turn around (stop increasing or stop
+# decreasing), are always kept.
+
+import numpy as np
+import geometry_arrays
+import telemetry
+
+# in-memory feature class each chunk is loaded through
+CHUNK_FC = 'memory/calibration_points_chunk'
+
+# the NumPy type of each numeric arcpy field type
+FIELD_DTYPES = {'SmallInteger': 'i2', 'Integer': 'i4', 'BigInteger': 'i8',
+                'Single': 'f4', 'Double': 'f8'}
+
+
+#-----------------------------------------------
+
+# the structured array layout of the calibration points
+# ...name_type and id_type are the NumPy types of RouteName and RouteId
+def calibration_dtype(name_type='U64', id_type='U64'):
+    return np.dtype([('X', 'f8'), ('Y', 'f8'), ('Z', 'f8'),
+                     ('RouteName', name_type),
+                     ('RouteId', id_type),
+                     ('Measure', 'f8')])
+
+# the NumPy type of an arcpy field: its numeric type, or text as wide
+# as the field's length
+def field_dtype(field):
+    if field.type in FIELD_DTYPES:
+        return FIELD_DTYPES[field.type]
+    if field.type in ('GUID', 'GlobalID'):
+        return 'U38'
+    return 'U' + str(field.length or 255)
+
+# the calibration point layout matching the RouteName and RouteId
+# fields of the output feature class
+# ...text_only keeps both as text (still as wide as the fields), for
+# ...the columnar files, whose schema has them as strings
+def target_dtype(fcOUT, arcpy_module=None, text_only=False):
+    if arcpy_module is None:
+        import arcpy as arcpy_module
+    fields = dict((f.name.upper(), f) for f in arcpy_module.ListFields(fcOUT))
+    types = []
+    for name in ('ROUTENAME', 'ROUTEID'):
+        dt = field_dtype(fields[name]) if name in fields else 'U64'
+        if text_only and not dt.startswith('U'):
+            dt = 'U32'
+        types.append(dt)
+    return calibration_dtype(*types)
+
+#-----------------------------------------------
+
+# which vertices of one part to keep, by measure
+# ...s is the distance along the part and m the measure of each vertex;
+# ...a vertex is dropped when its measure is within 'tolerance' of the
+# ...straight line (in s, m) between the vertices kept either side of it
+def thin_part(s, m, tolerance):
+    n = len(m)
+    keep = np.zeros(n, dtype=bool)
+    if n == 0:
+        return keep
+    keep[0] = keep[-1] = True
+
+    # turning points of the measures always stay
+    # ...a vertex turns when the last segment before it that changes M
+    # ...and the first one after it go in opposite directions
+    dm = np.sign(np.diff(m))
+    if len(dm) > 1:
+        idx = np.arange(len(dm))
+        last = np.maximum.accumulate(np.where(dm != 0, idx, 0))
+        first = np.minimum.accumulate(np.where(dm != 0, idx, len(dm) - 1)[::-1])[::-1]
+        turn = np.nonzero(dm[last[:-1]] * dm[first[1:]] < 0)[0] + 1
+        keep[turn] = True
+
+    # Douglas-Peucker in (s, m) between every pair of kept vertices
+    anchors = np.nonzero(keep)[0]
+    stack = list(zip(anchors[:-1], anchors[1:]))
+    while stack:
+        i, j = stack.pop()
+        if j - i < 2:
+            continue
+        seg_s = s[i:j + 1]
+        if s[j] > s[i]:
+            line = m[i] + (m[j] - m[i]) * (seg_s - s[i]) / (s[j] - s[i])
+        else:
+            line = np.full(len(seg_s), m[i])
+        err = np.abs(m[i:j + 1] - line)
+        k = int(np.argmax(err))
+        if err[k] > tolerance:
+            keep[i + k] = True
+            stack.append((i, i + k))
+            stack.append((i + k, j))
+    return keep
+
+# which vertices of a whole geometry to keep (see thin_part)
+# ...vertices with a null measure are always kept
+def thin_vertices(coords, offsets, tolerance):
+    keep = np.ones(len(coords), dtype=bool)
+    for j in range(len(offsets) - 1):
+        a, b = offsets[j], offsets[j + 1]
+        part = coords[a:b]
+        m = part[:, 3]
+        if b - a < 3 or np.isnan(m).any():
+            continue
+        seg = np.hypot(np.diff(part[:, 0]), np.diff(part[:, 1]))
+        s = np.concatenate(([0.0], np.cumsum(seg)))
+        keep[a:b] = thin_part(s, m, tolerance)
+    return keep
+
+#-----------------------------------------------
+
+# the calibration points of one route, as a structured array
+# ...shape_json is the route's SHAPE@JSON
+# ...thin_tolerance is a measure tolerance, or None to keep every vertex
+# ...project is an optional function taking x, y arrays and returning them
+# ...in the output spatial reference (see coordinate_projection.py)
+def route_points(shape_json, route_name, route_id, dtype,
+                 thin_tolerance=None, project=None):
+    coords, offsets, hasZ, hasM = geometry_arrays.from_esri_json(shape_json)[:4]
+    if thin_tolerance is not None and hasM:
+        coords = coords[thin_vertices(coords, offsets, thin_tolerance)]
+
+    points = np.zeros(len(coords), dtype=dtype)
+    if project is not None and len(coords):
+        points['X'], points['Y'] = project(coords[:, 0], coords[:, 1])
+    else:
+        points['X'] = coords[:, 0]
+        points['Y'] = coords[:, 1]
+    points['Z'] = np.nan_to_num(coords[:, 2]) if hasZ else 0
+    points['RouteName'] = route_name
+    points['RouteId'] = _fill_value(route_id, dtype['RouteId'])
+    points['Measure'] = coords[:, 3]
+    return points
+
+# the value a route's ID is written as in a column of type 'dt'
+# ...a null ID is '' as text and NaN as a float; an integer column
+# ...has no null, so a null ID there is an error rather than a 0
+def _fill_value(value, dt):
+    if value is not None:
+        return value
+    if dt.kind == 'U':
+        return ''
+    if dt.kind == 'f':
+        return np.nan
+    raise ValueError('null RouteId in an integer field; use the insertRow path')
+
+#-----------------------------------------------
+
+# regroup a stream of structured arrays into chunks of 'chunk_rows' rows
+# (the last chunk may be shorter)
+def chunked(arrays, chunk_rows):
+    pending = []
+    count = 0
+    for arr in arrays:
+        while len(arr):
+            take = arr[:chunk_rows - count]
+            arr = arr[len(take):]
+            pending.append(take)
+            count += len(take)
+            if count == chunk_rows:
+                yield np.concatenate(pending)
+                pending = []
+                count = 0
+    if count:
+        yield np.concatenate(pending)
+
+#-----------------------------------------------
+
+# bulk load chunks of calibration points into a feature class
+# ...arcpy_module is arcpy (the default) or arcpy_lite
+# ...shape_fields are the chunks' x, y (and z) fields; any structured
+# ...arrays of points can be loaded this way (see load_columnar_outputs.py)
+# ...returns the number of points written
+def write_chunks(chunks, fcOUT, spatial_reference, arcpy_module=None, shape_fields=('X', 'Y', 'Z')):
+    if arcpy_module is None:
+        import arcpy as arcpy_module
+    arcpy = arcpy_module
+    progress = telemetry.Progress('points written')
+    for chunk in chunks:
+        with telemetry.timer('insert'):
+            if arcpy.Exists(CHUNK_FC):
+                arcpy.management.Delete(CHUNK_FC)
+            arcpy.da.NumPyArrayToFeatureClass(chunk, CHUNK_FC, tuple(shape_fields), spatial_reference)
+            arcpy.management.Append(CHUNK_FC, fcOUT, 'NO_TEST')
+        progress.update(len(chunk))
+    if arcpy.Exists(CHUNK_FC):
+        arcpy.management.Delete(CHUNK_FC)
+    return progress.finish()
+
+#------END OF MODULE----------------------------
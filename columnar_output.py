@@ -0,0 +1,222 @@
+#------START OF MODULE--------------------------
+
+# Arrow/Parquet files for the curvature and calibration outputs
+#
+# Instead of inserting every curve point or calibration point into the
+# FGDB as it's computed (one writer, one row at a time), the scripts can
+# write their results to columnar files with a fixed schema, and
+# load_columnar_outputs.py bulk loads them into the FGDB afterwards:
+#
+#   stations      RouteId, milepost, X, Y, lambda, phi,
+#                 curve_percent_actual, curve_percent_absolute,
+#                 curve_direction
+#   calibration   X, Y, Z, RouteName, RouteId, Measure
+#   curve_events  RouteId, curve_direction, begin_milepost,
+#                 end_milepost, station_count, length_feet,
+#                 max_degree, mean_degree, spiral_in_feet,
+#                 spiral_out_feet (see curve_events.py)
+#
+# Extra columns can follow a kind's own (the curvature engine's extra
+# chord fields, say): see extra_columns().
+#
+# A file ending .parquet (or .pq) is Parquet, one row group per chunk
+# written. A file ending .arrow (or .feather) is the Arrow IPC file
+# format, which can be memory-mapped and read without copying:
+#
+#   import pyarrow as pa
+#   table = pa.ipc.open_file(pa.memory_map(path)).read_all()
+#
+# (or pyarrow.parquet.read_table(folder, memory_map=True) for Parquet).
+#
+# The curvature workers each write their own routes' files, one file per
+# route named by its index, so there's no lock to wait for and a folder
+# of them reads back in route order. Every file is written under a
+# temporary name and renamed once it's complete, so a reader never sees
+# a half-written one.
+#
+# NOTE: needs pyarrow.
+
+import glob
+import os
+import numpy as np
+
+# the columns of each kind of output, in order, with their Arrow types
+SCHEMAS = {'stations': [('RouteId', 'string'), ('milepost', 'float64'),
+                        ('X', 'float64'), ('Y', 'float64'),
+                        ('lambda', 'float64'), ('phi', 'float64'),
+                        ('curve_percent_actual', 'float64'),
+                        ('curve_percent_absolute', 'float64'),
+                        ('curve_direction', 'string')],
+           'calibration': [('X', 'float64'), ('Y', 'float64'), ('Z', 'float64'),
+                           ('RouteName', 'string'), ('RouteId', 'string'),
+                           ('Measure', 'float64')],
+           'curve_events': [('RouteId', 'string'), ('curve_direction', 'string'),
+                            ('begin_milepost', 'float64'), ('end_milepost', 'float64'),
+                            ('station_count', 'int64'), ('length_feet', 'float64'),
+                            ('max_degree', 'float64'), ('mean_degree', 'float64'),
+                            ('spiral_in_feet', 'float64'), ('spiral_out_feet', 'float64')]}
+
+# file extensions of each format
+PARQUET_EXTENSIONS = ('.parquet', '.pq')
+ARROW_EXTENSIONS = ('.arrow', '.feather')
+
+# the names of the shape columns with_shape_columns() adds
+SHAPE_COLUMNS = ('SHAPE_X', 'SHAPE_Y', 'SHAPE_Z')
+
+
+#-----------------------------------------------
+
+# the Arrow schema of a kind of output, plus any extra (name, type) columns
+def schema(kind, columns=()):
+    import pyarrow as pa
+    return pa.schema([(name, getattr(pa, type_name)()) for name, type_name in SCHEMAS[kind] + list(columns)])
+
+# the (name, type) columns of an array's fields that a kind doesn't have
+def extra_columns(dtype, kind):
+    known = set(name for name, _ in SCHEMAS[kind])
+    return [(name, 'string' if dtype[name].kind == 'U' else 'float64')
+            for name in dtype.names if name not in known]
+
+def _is_arrow(path):
+    return os.path.splitext(path)[1].lower() in ARROW_EXTENSIONS
+
+# an Arrow table of a structured array, in the columns of a kind of output
+# ...extra holds values for columns the array doesn't have, e.g.
+# ...{'RouteId': route_id}; any other missing column is null
+def to_table(arr, kind, extra=None, columns=()):
+    import pyarrow as pa
+    sch = schema(kind, columns)
+    names = arr.dtype.names or ()
+    columns = []
+    for field in sch:
+        if field.name in names:
+            values = arr[field.name]
+        else:
+            values = np.full(len(arr), (extra or {}).get(field.name), dtype=object)
+        columns.append(pa.array(values, type=field.type))
+    return pa.Table.from_arrays(columns, schema=sch)
+
+#-----------------------------------------------
+
+# writes structured arrays to one Parquet or Arrow file, a chunk at a time
+# ...the file only appears under its name once close() has run
+# ...columns are any extra (name, type) columns after the kind's own
+class ColumnarWriter:
+
+    def __init__(self, path, kind, columns=()):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        self.path = path
+        self.kind = kind
+        self.columns = list(columns)
+        self.rows = 0
+        self._tmp = path + '.tmp'
+        if _is_arrow(path):
+            self._sink = pa.OSFile(self._tmp, 'wb')
+            self._writer = pa.ipc.new_file(self._sink, schema(kind, self.columns))
+        else:
+            self._sink = None
+            self._writer = pq.ParquetWriter(self._tmp, schema(kind, self.columns))
+
+    def write(self, arr, extra=None):
+        if len(arr):
+            self._writer.write_table(to_table(arr, self.kind, extra, self.columns))
+            self.rows += len(arr)
+
+    def close(self):
+        self._writer.close()
+        if self._sink is not None:
+            self._sink.close()
+        os.replace(self._tmp, self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self._writer.close()
+            if self._sink is not None:
+                self._sink.close()
+            os.remove(self._tmp)
+
+# write a stream of structured arrays to one file, returns the rows written
+def write_arrays(arrays, path, kind, extra=None, columns=()):
+    with ColumnarWriter(path, kind, columns) as writer:
+        for arr in arrays:
+            writer.write(arr, extra)
+    return writer.rows
+
+#-----------------------------------------------
+
+# the file of one route's stations in a folder
+# ...fmt is 'parquet' or 'arrow'
+def route_path(folder, route_index, fmt='parquet'):
+    return os.path.join(folder, 'stations-%09d.%s' % (route_index, fmt))
+
+# make a folder for route files, emptied of any from an earlier run
+def prepare_folder(folder):
+    os.makedirs(folder, exist_ok=True)
+    for path in glob.glob(os.path.join(folder, 'stations-*')):
+        os.remove(path)
+
+# the output files at 'path': the file itself, or a folder's files in name order
+def output_files(path):
+    if not os.path.isdir(path):
+        return [path]
+    return sorted(p for p in glob.glob(os.path.join(path, '*'))
+                  if os.path.splitext(p)[1].lower() in PARQUET_EXTENSIONS + ARROW_EXTENSIONS)
+
+#-----------------------------------------------
+
+# a structured array of an Arrow record batch
+# ...numbers become float64 or int64 (a null number is NaN), text a
+# ...fixed-width unicode field as wide as its longest value
+def batch_array(batch):
+    import pyarrow as pa
+    columns = []
+    for name, column in zip(batch.schema.names, batch.columns):
+        if pa.types.is_string(column.type) or pa.types.is_large_string(column.type):
+            values = np.array(['' if v is None else v for v in column.to_pylist()], dtype=str)
+        elif pa.types.is_integer(column.type) and not column.null_count:
+            values = column.to_numpy().astype('i8')
+        else:
+            values = column.to_numpy(zero_copy_only=False).astype('f8')
+        columns.append((name, values))
+    arr = np.zeros(batch.num_rows, dtype=[(name, values.dtype) for name, values in columns])
+    for name, values in columns:
+        arr[name] = values
+    return arr
+
+# yield the rows at 'path' (a file or a folder of them) as structured
+# arrays of at most 'batch_rows' rows
+# ...Arrow files are memory-mapped and come back as they were written
+def read_arrays(path, batch_rows=100000):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    for f in output_files(path):
+        if _is_arrow(f):
+            reader = pa.ipc.open_file(pa.memory_map(f, 'r'))
+            for i in range(reader.num_record_batches):
+                yield batch_array(reader.get_batch(i))
+        else:
+            for batch in pq.ParquetFile(f).iter_batches(batch_size=batch_rows):
+                yield batch_array(batch)
+
+#-----------------------------------------------
+
+# add copies of the x, y (and z) columns to each array, as SHAPE_COLUMNS
+# ...NumPyArrayToFeatureClass turns its shape fields into the shape, not
+# ...into fields, so loading from copies keeps the originals as fields
+def with_shape_columns(arrays, shape_fields):
+    for arr in arrays:
+        names = SHAPE_COLUMNS[:len(shape_fields)]
+        out = np.zeros(len(arr), dtype=arr.dtype.descr + [(name, 'f8') for name in names])
+        for name in arr.dtype.names:
+            out[name] = arr[name]
+        for name, field in zip(names, shape_fields):
+            out[name] = arr[field]
+        yield out
+
+#------END OF MODULE----------------------------
@@ -0,0 +1,265 @@
+#------START OF MODULE--------------------------
+
+# Batched coordinate transformations
+#
+# Projecting one PointGeometry at a time with projectAs() builds and
+# tears down a projection engine round trip for every point. This module
+# transforms whole x, y arrays in one call instead, and keeps the
+# transformer objects around so they are only set up once.
+#
+#   tf = get_transformer(102005, 4326, "NAD_1983_To_WGS_1984_4")
+#   lon, lat = tf(x, y)
+#
+# Transformers are cached by (from wkid, to wkid, transformation, backend),
+# and every call is timed into telemetry's 'projection' stage.
+# Three backends, tried in this order unless one is asked for:
+#
+#   'numpy'   pure NumPy, no arcpy or pyproj needed; covers 102005
+#             (USA Contiguous Equidistant Conic, NAD83) <-> 4326 with
+#             NAD_1983_To_WGS_1984_4, and 102005 <-> 4269
+#   'pyproj'  any pair PROJ knows about, if pyproj is installed
+#   'arcpy'   any pair, through a single Multipoint.projectAs() call
+#
+# NOTE: 102005 is an equidistant conic, not an Albers equal area
+# (that's 102003), so the NumPy path implements the ellipsoidal
+# equidistant conic from Snyder, "Map Projections: A Working Manual",
+# pp. 111-115.
+
+import json
+import numpy as np
+
+import telemetry
+
+# cached transformer functions
+_transformers = {}
+
+
+#-----------------------------------------------
+
+# GRS80 (NAD83) and WGS84 ellipsoids: semi-major axis, flattening
+GRS80 = (6378137.0, 1 / 298.257222101)
+WGS84 = (6378137.0, 1 / 298.257223563)
+
+# USA_Contiguous_Equidistant_Conic (ESRI:102005) parameters
+EQDC_102005 = {'central_meridian': -96.0, 'standard_parallel_1': 33.0,
+               'standard_parallel_2': 45.0, 'latitude_of_origin': 39.0,
+               'false_easting': 0.0, 'false_northing': 0.0}
+
+# NAD_1983_To_WGS_1984_4 (EPSG:1308), coordinate frame rotation
+# ...translations in meters, rotations in radians, scale in ppm
+NAD_1983_TO_WGS_1984_4 = (-0.9738, 1.9453, 0.5486,
+                          -1.3357e-07, -4.872e-08, -5.507e-08, 0.0)
+
+#-----------------------------------------------
+
+# meridional arc length from the equator to latitude phi (radians)
+def _meridian_arc(phi, a, e2):
+    e4 = e2 * e2
+    e6 = e4 * e2
+    return a * ((1 - e2 / 4 - 3 * e4 / 64 - 5 * e6 / 256) * phi
+                - (3 * e2 / 8 + 3 * e4 / 32 + 45 * e6 / 1024) * np.sin(2 * phi)
+                + (15 * e4 / 256 + 45 * e6 / 1024) * np.sin(4 * phi)
+                - (35 * e6 / 3072) * np.sin(6 * phi))
+
+# latitude (radians) of a meridional arc length
+def _footpoint_latitude(arc, a, e2):
+    e4 = e2 * e2
+    e6 = e4 * e2
+    mu = arc / (a * (1 - e2 / 4 - 3 * e4 / 64 - 5 * e6 / 256))
+    e1 = (1 - np.sqrt(1 - e2)) / (1 + np.sqrt(1 - e2))
+    return (mu + (3 * e1 / 2 - 27 * e1 ** 3 / 32) * np.sin(2 * mu)
+            + (21 * e1 ** 2 / 16 - 55 * e1 ** 4 / 32) * np.sin(4 * mu)
+            + (151 * e1 ** 3 / 96) * np.sin(6 * mu)
+            + (1097 * e1 ** 4 / 512) * np.sin(8 * mu))
+
+# the constants n, G and rho0 of an equidistant conic
+def _eqdc_constants(params, a, e2):
+    phi1 = np.radians(params['standard_parallel_1'])
+    phi2 = np.radians(params['standard_parallel_2'])
+    phi0 = np.radians(params['latitude_of_origin'])
+    m1 = np.cos(phi1) / np.sqrt(1 - e2 * np.sin(phi1) ** 2)
+    m2 = np.cos(phi2) / np.sqrt(1 - e2 * np.sin(phi2) ** 2)
+    arc1 = _meridian_arc(phi1, a, e2)
+    arc2 = _meridian_arc(phi2, a, e2)
+    n = a * (m1 - m2) / (arc2 - arc1)
+    G = m1 / n + arc1 / a
+    rho0 = a * G - _meridian_arc(phi0, a, e2)
+    return n, G, rho0
+
+#-----------------------------------------------
+
+# equidistant conic, geographic degrees to projected meters
+def eqdc_forward(lon, lat, params=EQDC_102005, ellipsoid=GRS80):
+    a, f = ellipsoid
+    e2 = f * (2 - f)
+    n, G, rho0 = _eqdc_constants(params, a, e2)
+    rho = a * G - _meridian_arc(np.radians(lat), a, e2)
+    theta = n * np.radians(np.asarray(lon) - params['central_meridian'])
+    x = rho * np.sin(theta) + params['false_easting']
+    y = rho0 - rho * np.cos(theta) + params['false_northing']
+    return x, y
+
+# equidistant conic, projected meters to geographic degrees
+def eqdc_inverse(x, y, params=EQDC_102005, ellipsoid=GRS80):
+    a, f = ellipsoid
+    e2 = f * (2 - f)
+    n, G, rho0 = _eqdc_constants(params, a, e2)
+    dx = np.asarray(x) - params['false_easting']
+    dy = rho0 - (np.asarray(y) - params['false_northing'])
+    sign = np.sign(n)
+    rho = sign * np.hypot(dx, dy)
+    theta = np.arctan2(sign * dx, sign * dy)
+    lat = _footpoint_latitude(a * G - rho, a, e2)
+    lon = np.degrees(theta / n) + params['central_meridian']
+    return lon, np.degrees(lat)
+
+#-----------------------------------------------
+
+# geographic degrees (height 0) to geocentric meters
+def _to_geocentric(lon, lat, ellipsoid):
+    a, f = ellipsoid
+    e2 = f * (2 - f)
+    lam = np.radians(lon)
+    phi = np.radians(lat)
+    N = a / np.sqrt(1 - e2 * np.sin(phi) ** 2)
+    return (N * np.cos(phi) * np.cos(lam),
+            N * np.cos(phi) * np.sin(lam),
+            N * (1 - e2) * np.sin(phi))
+
+# geocentric meters to geographic degrees (the height is dropped)
+def _from_geocentric(X, Y, Z, ellipsoid):
+    a, f = ellipsoid
+    e2 = f * (2 - f)
+    p = np.hypot(X, Y)
+    phi = np.arctan2(Z, p * (1 - e2))
+    for _ in range(4):
+        N = a / np.sqrt(1 - e2 * np.sin(phi) ** 2)
+        h = p / np.cos(phi) - N
+        phi = np.arctan2(Z, p * (1 - e2 * N / (N + h)))
+    return np.degrees(np.arctan2(Y, X)), np.degrees(phi)
+
+# seven-parameter coordinate frame transformation between datums
+# ...inverse=True runs it backwards (the parameters are small enough
+# ...that negating them is exact to well under a millimeter)
+def helmert(lon, lat, params, from_ellipsoid, to_ellipsoid, inverse=False):
+    tx, ty, tz, rx, ry, rz, ds = params
+    if inverse:
+        tx, ty, tz, rx, ry, rz, ds = -tx, -ty, -tz, -rx, -ry, -rz, -ds
+    X, Y, Z = _to_geocentric(lon, lat, from_ellipsoid)
+    s = 1 + ds * 1e-6
+    X2 = tx + s * (X + rz * Y - ry * Z)
+    Y2 = ty + s * (-rz * X + Y + rx * Z)
+    Z2 = tz + s * (ry * X - rx * Y + Z)
+    return _from_geocentric(X2, Y2, Z2, to_ellipsoid)
+
+#-----------------------------------------------
+
+# the pure NumPy transformers, keyed by (from wkid, to wkid, transformation)
+def _numpy_transformer(from_wkid, to_wkid, transformation):
+    gt = (transformation or '').upper()
+    if (from_wkid, to_wkid) == (102005, 4269) and not gt:
+        return lambda x, y: eqdc_inverse(x, y)
+    if (from_wkid, to_wkid) == (4269, 102005) and not gt:
+        return lambda x, y: eqdc_forward(x, y)
+    if gt != 'NAD_1983_TO_WGS_1984_4':
+        return None
+    if (from_wkid, to_wkid) == (102005, 4326):
+        return lambda x, y: helmert(*eqdc_inverse(x, y), NAD_1983_TO_WGS_1984_4, GRS80, WGS84)
+    if (from_wkid, to_wkid) == (4326, 102005):
+        return lambda x, y: eqdc_forward(*helmert(x, y, NAD_1983_TO_WGS_1984_4,
+                                                  WGS84, GRS80, inverse=True))
+    return None
+
+# EPSG codes of the ESRI NAD83 -> WGS84 transformations
+_EPSG_CODES = {'NAD_1983_To_WGS_1984_1': 1188,
+               'NAD_1983_To_WGS_1984_4': 1308,
+               'NAD_1983_To_WGS_1984_5': 1515}
+
+# a pyproj transformer, always in x/y (lon/lat) axis order
+# ...a named transformation is applied explicitly between the two
+# ...geographic coordinate systems, since PROJ would otherwise pick
+# ...its own (it treats _4 as superseded)
+def _pyproj_transformer(from_wkid, to_wkid, transformation):
+    import pyproj
+    from pyproj.crs import CoordinateOperation
+    from_crs = pyproj.CRS.from_user_input(authority_name(from_wkid))
+    to_crs = pyproj.CRS.from_user_input(authority_name(to_wkid))
+    if not transformation:
+        tf = pyproj.Transformer.from_crs(from_crs, to_crs, always_xy=True)
+        return lambda x, y: tf.transform(np.asarray(x), np.asarray(y))
+    if transformation not in _EPSG_CODES:
+        return None
+
+    # the datum step works in latitude, longitude order, NAD83 -> WGS84
+    op = CoordinateOperation.from_epsg(_EPSG_CODES[transformation])
+    datum = pyproj.Transformer.from_pipeline(op.to_proj4())
+    direction = 'FORWARD' if 'WGS 84' in to_crs.geodetic_crs.name else 'INVERSE'
+    to_geo = pyproj.Transformer.from_crs(from_crs, from_crs.geodetic_crs, always_xy=True)
+    from_geo = pyproj.Transformer.from_crs(to_crs.geodetic_crs, to_crs, always_xy=True)
+    def transform(x, y):
+        lon, lat = to_geo.transform(np.asarray(x), np.asarray(y))
+        lat, lon = datum.transform(lat, lon, direction=direction)
+        return from_geo.transform(lon, lat)
+    return transform
+
+# arcpy, one Multipoint.projectAs() call for the whole array
+def _arcpy_transformer(from_wkid, to_wkid, transformation):
+    import arcpy
+    sr_from = arcpy.SpatialReference(from_wkid)
+    sr_to = arcpy.SpatialReference(to_wkid)
+    def transform(x, y):
+        x = np.asarray(x, dtype='f8')
+        y = np.asarray(y, dtype='f8')
+        if len(x) == 0:
+            return x, y
+        mp = arcpy.AsShape({"points": np.column_stack((x, y)).tolist(),
+                            "spatialReference": {"wkid": from_wkid}}, True)
+        if transformation:
+            mp_out = mp.projectAs(sr_to, transformation)
+        else:
+            mp_out = mp.projectAs(sr_to)
+        pts = np.array(json.loads(mp_out.JSON)['points'], dtype='f8')
+        return pts[:, 0], pts[:, 1]
+    return transform
+
+# 'ESRI:102005' or 'EPSG:4326', from a wkid
+def authority_name(wkid):
+    esri = wkid >= 100000 or 53000 <= wkid < 60000
+    return ('ESRI:' if esri else 'EPSG:') + str(wkid)
+
+_BACKENDS = {'numpy': _numpy_transformer,
+             'pyproj': _pyproj_transformer,
+             'arcpy': _arcpy_transformer}
+
+#-----------------------------------------------
+
+# get a cached function that transforms x, y arrays between two wkids
+# ...backend is 'numpy', 'pyproj', 'arcpy', or None to use the first
+# ...one that can do the job
+def get_transformer(from_wkid, to_wkid, transformation=None, backend=None):
+    key = (from_wkid, to_wkid, transformation, backend)
+    if key in _transformers:
+        return _transformers[key]
+
+    tf = None
+    for name in ([backend] if backend else ['numpy', 'pyproj', 'arcpy']):
+        try:
+            tf = _BACKENDS[name](from_wkid, to_wkid, transformation)
+        except ImportError:
+            tf = None
+        if tf is not None:
+            break
+    if tf is None:
+        raise ValueError('no transformer from ' + str(from_wkid) + ' to ' + str(to_wkid) +
+                         ' using ' + str(transformation))
+
+    tf = telemetry.timed('projection', tf)
+    _transformers[key] = tf
+    return tf
+
+# transform x, y arrays in one call, e.g.
+#   lon, lat = project_xy(x, y, 102005, 4326, "NAD_1983_To_WGS_1984_4")
+def project_xy(x, y, from_wkid, to_wkid, transformation=None, backend=None):
+    return get_transformer(from_wkid, to_wkid, transformation, backend)(x, y)
+
+#------END OF MODULE----------------------------
@@ -1,4 +1,5 @@
 import arcpy
+import attachment_copy
 
 ### Script copies file attachments from one feature class to another
 ### using values in related fields that have a 1-1 relationship.
@@ -14,6 +15,7 @@ arcpy.env.workspace = fgdb_name
 # **** IMPORTANT ****
 #If you're going to run this script more than once, be sure to first delete
 # all of the records out of the output attachments table
+# (unless INCREMENTAL is True, below, which only copies what isn't there yet)
 #
 #Also, when you run this script, you may see some strange behavior, like the
 # features in the map might disappear. The script creates all kinds of new view
@@ -26,9 +28,29 @@ arcpy.env.workspace = fgdb_name
 # output fc. If you choose the Explore tool, you can click on any of the points to 
 # find that both of the layers have all the correct attachment images in the popup.
 
+#USE_JOIN (below) copies the attachments with a one-pass hash join instead
+# (see attachment_copy.py). It reads each table once, writes through a single
+# InsertCursor, and creates no view layers, so none of the clean-up above
+# is needed in that mode.
+
 #If you have any questions or comments about this, contact Jim Barry at Esri
 # jbarry@esri.com
 
+#True to copy with the one-pass hash join, False for the original
+# select-per-feature loop
+USE_JOIN = False
+
+#In join mode, True to check each attachment's DATA_SIZE against its BLOB and
+# report the throughput (see copy_attachments_checked in attachment_copy.py)
+CHECK_BLOBS = False
+
+#With CHECK_BLOBS, True to copy incrementally: every input attachment copied
+# is recorded (by its ATTACHMENTID) in a SQLite manifest next to the fgdb, and
+# attachments the output features already have are skipped. Safe to rerun, and
+# resumes after a crash.
+INCREMENTAL = False
+MANIFEST_PATH = fgdb_name + '.attachments_manifest.sqlite'
+
 #fcIN is the feature class that contains the photo attachments you want copied over
 fcIN = fgdb_path + 'boros_1'
 fcFldsIN = ['OBJECTID', 'boroname']
@@ -55,64 +77,89 @@ tblAttFldsOUT = ['REL_OBJECTID', 'CONTENT_TYPE', 'ATT_NAME', 'DATA_SIZE', 'DATA'
 #The [DATA] field is a BLOB that contains a raw binary representation of the
 # attached image.
 
-#SearchCursor for the input feature class
-searchcursorFcIN = arcpy.da.SearchCursor(fcIN, fcFldsIN)
+if USE_JOIN:
+
+    #map each input feature's OBJECTID to the output feature(s) with the same boroname
+    dictInToOut = attachment_copy.join_index(fcIN, fcOUT, fcFldsIN[1])
 
-#SearchCursor for the input feature class' attachment table
-searchcursorTblAttIN = arcpy.da.SearchCursor(tblAttIN, tblAttFldsIN)
+    #copy every matched attachment from the input table into the output table
+    if CHECK_BLOBS:
+        connManifest = attachment_copy.open_manifest(MANIFEST_PATH) if INCREMENTAL else None
+        dictStats = attachment_copy.copy_attachments_checked(tblAttIN, tblAttOUT, tblAttFldsOUT, dictInToOut,
+                                                             connManifest)
+        if connManifest is not None:
+            connManifest.close()
+        print(str(dictStats['rows']) + ' attachments copied, ' + \
+              str(dictStats['skipped']) + ' already there, ' + \
+              str(round(dictStats['bytes'] / (1024 * 1024), 1)) + ' MB at ' + \
+              str(round(dictStats['mb_per_s'], 1)) + ' MB/s')
+        if dictStats['size_mismatches']:
+            print('DATA_SIZE did not match the BLOB for input attachments: ' + \
+                  str(dictStats['size_mismatches']))
+    else:
+        intWritten = attachment_copy.copy_attachments(tblAttIN, tblAttOUT, tblAttFldsOUT, dictInToOut)
+        print(str(intWritten) + ' attachments copied')
 
-#SearchCursor for the output feature class
-searchcursorFcOUT = arcpy.da.SearchCursor(fcOUT, fcFldsOUT)
+else:
 
-#This outermost loop is looping through the OUTPUT feature class.
-#For every feature, we're going to find the attachment associated with it
-# and copy it over
-for row in searchcursorFcOUT:
+    #SearchCursor for the input feature class
+    searchcursorFcIN = arcpy.da.SearchCursor(fcIN, fcFldsIN)
+
+    #SearchCursor for the input feature class' attachment table
+    searchcursorTblAttIN = arcpy.da.SearchCursor(tblAttIN, tblAttFldsIN)
+
+    #SearchCursor for the output feature class
+    searchcursorFcOUT = arcpy.da.SearchCursor(fcOUT, fcFldsOUT)
+
+    #This outermost loop is looping through the OUTPUT feature class.
+    #For every feature, we're going to find the attachment associated with it
+    # and copy it over
+    for row in searchcursorFcOUT:
     
-    #get the objectid of the output feature class record
-    # this value we will be writing into the output attachments table, so that each of the 
-    # features in the output fc will know which row in its attachments table stores its image
-    intOutOBJECTID = row[0]
-    #get the value from the output feature class that we will search for
-    strOutLinkName = row[1]
+        #get the objectid of the output feature class record
+        # this value we will be writing into the output attachments table, so that each of the 
+        # features in the output fc will know which row in its attachments table stores its image
+        intOutOBJECTID = row[0]
+        #get the value from the output feature class that we will search for
+        strOutLinkName = row[1]
     
-    #use the value from the output fc to find the associated record in the input fc
-    selFcIN = arcpy.management.SelectLayerByAttribute(fcIN, 'NEW_SELECTION', "boroname = '" + strOutLinkName + "'")
-    #the only field we need in this search result is the OBJECTID
-    scFcIN = arcpy.da.SearchCursor(selFcIN, ["OBJECTID"])
+        #use the value from the output fc to find the associated record in the input fc
+        selFcIN = arcpy.management.SelectLayerByAttribute(fcIN, 'NEW_SELECTION', "boroname = '" + strOutLinkName + "'")
+        #the only field we need in this search result is the OBJECTID
+        scFcIN = arcpy.da.SearchCursor(selFcIN, ["OBJECTID"])
     
-    #Optimally 'scFcIN' should only have one record in it
-    for rowScFcIN in scFcIN:
+        #Optimally 'scFcIN' should only have one record in it
+        for rowScFcIN in scFcIN:
         
-        #get the OBJECTID of the associate feature in the input fc 
-        selOIDFcIN = rowScFcIN[0]
+            #get the OBJECTID of the associate feature in the input fc 
+            selOIDFcIN = rowScFcIN[0]
         
-        #using that OBJECTID, find the associated record in the input attachments table
-        selTblAttIN = arcpy.management.SelectLayerByAttribute(tblAttIN, "NEW_SELECTION", "REL_OBJECTID = " + str(selOIDFcIN))
-        #from this search result, we need all the attachment table fields from the input attachments table
-        # that we'll need for copying values over into the output attachments table 
-        scTblAttIN = arcpy.da.SearchCursor(selTblAttIN, ["CONTENT_TYPE", "ATT_NAME", "DATA_SIZE", "DATA"])
-
-        #Optimally 'scTblAttIN' should only have one record in it
-        for rowScTblAttIN in scTblAttIN:
+            #using that OBJECTID, find the associated record in the input attachments table
+            selTblAttIN = arcpy.management.SelectLayerByAttribute(tblAttIN, "NEW_SELECTION", "REL_OBJECTID = " + str(selOIDFcIN))
+            #from this search result, we need all the attachment table fields from the input attachments table
+            # that we'll need for copying values over into the output attachments table 
+            scTblAttIN = arcpy.da.SearchCursor(selTblAttIN, ["CONTENT_TYPE", "ATT_NAME", "DATA_SIZE", "DATA"])
+
+            #Optimally 'scTblAttIN' should only have one record in it
+            for rowScTblAttIN in scTblAttIN:
             
-            #get all the values from the input attachments table that we'll write into the output attachments table
-            strCONTENT_TYPE = rowScTblAttIN[0]
-            strATT_NAME = rowScTblAttIN[1]
-            intDATA_SIZE = rowScTblAttIN[2]
-            blobDATA = rowScTblAttIN[3]
+                #get all the values from the input attachments table that we'll write into the output attachments table
+                strCONTENT_TYPE = rowScTblAttIN[0]
+                strATT_NAME = rowScTblAttIN[1]
+                intDATA_SIZE = rowScTblAttIN[2]
+                blobDATA = rowScTblAttIN[3]
             
-            #create an insert cursor for the output attachments table
-            insertcursorTblAttOUT = arcpy.da.InsertCursor(tblAttOUT, tblAttFldsOUT)
+                #create an insert cursor for the output attachments table
+                insertcursorTblAttOUT = arcpy.da.InsertCursor(tblAttOUT, tblAttFldsOUT)
             
-            #write a new row into the output attachments table and write field values into it,
-            # including the 'blobData' which is a binary representation of the attached image
-            insertcursorTblAttOUT.insertRow([intOutOBJECTID, strCONTENT_TYPE, strATT_NAME, intDATA_SIZE, blobDATA]) 
+                #write a new row into the output attachments table and write field values into it,
+                # including the 'blobData' which is a binary representation of the attached image
+                insertcursorTblAttOUT.insertRow([intOutOBJECTID, strCONTENT_TYPE, strATT_NAME, intDATA_SIZE, blobDATA]) 
             
-            #delete the InsertCursor
-            del insertcursorTblAttOUT    
+                #delete the InsertCursor
+                del insertcursorTblAttOUT    
 
-# delete all the SearchCursors
-del searchcursorFcIN
-del searchcursorTblAttIN
-del searchcursorFcOUT
+    # delete all the SearchCursors
+    del searchcursorFcIN
+    del searchcursorTblAttIN
+    del searchcursorFcOUT
@@ -44,8 +44,24 @@
 #
 ########
 
-# following line not needed if you're running this script in ArcGIS Pro
-# import arcpy 
+# where geometry and cursors come from: 'arcpy', or 'lite' to run without
+# ...ArcGIS Pro, through arcpy_lite.py (NumPy and GDAL/OGR, GDAL 3.6+ to
+# ...write to an FGDB, or use a GeoPackage)
+GEOMETRY_BACKEND = 'arcpy'
+
+# arcpy is already imported if you're running this script in ArcGIS Pro
+if GEOMETRY_BACKEND == 'arcpy':
+    import arcpy
+else:
+    import arcpy_lite as arcpy
+
+# reads the route vertices as arrays, and writes them in bulk
+# (these modules are in the same folder as this script)
+import geometry_arrays
+import calibration_writer
+import columnar_output
+import coordinate_projection
+import telemetry
 
 
 #### STEP 1
@@ -63,7 +79,8 @@ data_path = 'C:/mapdata/data/' # just a sample
 fcIN = data_path + 'name_of_your.gdb/tracks_routes'
 # fields from input routes feature class that we need... 
 #  ...to bring over to the output calibration point feature class
-fieldsIN = ['SHAPE@', 'RouteName', 'RouteId']
+# (the shape is read as JSON, so its vertices can go straight into arrays)
+fieldsIN = ['SHAPE@JSON', 'RouteName', 'RouteId']
 
 
 #### STEP 3
@@ -74,41 +91,119 @@ fieldsIN = ['SHAPE@', 'RouteName', 'RouteId']
 # --be sure this new PointZM feature class is empty
 fcOUT = data_path + 'name_of_your.gdb/calib_points'
 # fields that the calibration points feature class will need
-fieldsOUT = ['SHAPE@', 'RouteName', 'RouteId', 'Measure']
+# (the points are written as JSON, so no Point object is made per vertex)
+fieldsOUT = ['SHAPE@JSON', 'RouteName', 'RouteId', 'Measure']
+
+
+
+#### STEP 4
+
+## HOW TO WRITE THE CALIBRATION POINTS
+
+# True to gather the points into chunks and bulk load each chunk
+# ...(see calibration_writer.py), False to insert them one at a time
+# ...NOTE: the bulk loaded points have no M (the measures are only in
+# ...the Measure field), so the PointZM output keeps its M values only
+# ...with False
+USE_BULK_WRITER = False
+CHUNK_ROWS = 100000
+
+# True to keep only the vertices the LRS needs: where the measures
+# ...stop following a straight line (within MEASURE_TOLERANCE, in
+# ...measure units), where they turn around, and the ends of each part
+THIN_VERTICES = False
+MEASURE_TOLERANCE = 0.0001
+
+# a .parquet or .arrow file to write the bulk writer's points to instead
+# ...of the output feature class (see columnar_output.py), or None; load
+# ...it into fcOUT later with load_columnar_outputs.py
+COLUMNAR_PATH = None
+
+# if the output feature class is in a different spatial reference than
+# ...the routes, the points are projected in bulk using this transformation
+TRANSFORMATION = None
+
+# where to write the stage timings and counters at the end of the run
+# ...(JSON, and the Prometheus text format), and a file to profile the
+# ...run to (.prof, or .html for pyinstrument); None for none of them
+# ...(see telemetry.py)
+TELEMETRY_JSON = None
+TELEMETRY_PROMETHEUS = None
+PROFILE_PATH = None
 
 #
 
-# the InsertCursor we need for writing calibration points into
-# ...the output PointZ feature class
-cursorWRITE = arcpy.da.InsertCursor(fcOUT, fieldsOUT)
+profiler = telemetry.Profile(PROFILE_PATH).start()
 
 # the SearchCursor we need for reading vertices and attributes out 
 # ...of the input PolylineM (or PolylineZM) routes feature class
 cursorREAD = arcpy.da.SearchCursor(fcIN, fieldsIN)
 #with arcpy.da.SearchCursor(fcIN, fieldsIN) as cursorREAD:
+
+if USE_BULK_WRITER:
+
+    # project the points only if the two feature classes don't match
+    # ...a custom spatial reference has a factoryCode of 0, so those are
+    # ...compared in full
+    srIN = arcpy.Describe(fcIN).spatialReference
+    srOUT = arcpy.Describe(fcOUT).spatialReference
+    project = None
+    if srIN.factoryCode and srOUT.factoryCode:
+        same_sr = srIN.factoryCode == srOUT.factoryCode
+    else:
+        same_sr = srIN.exportToString() == srOUT.exportToString()
+    if not same_sr:
+        if not (srIN.factoryCode and srOUT.factoryCode):
+            raise ValueError('the routes and calibration points are in different spatial references, '
+                             'and one of them is custom; project one to match the other first')
+        project = coordinate_projection.get_transformer(srIN.factoryCode, srOUT.factoryCode, TRANSFORMATION)
+
+    # every route's points as one structured array, in fixed-size chunks
+    # ...with RouteName and RouteId typed and sized as fcOUT's fields
+    dtype = calibration_writer.target_dtype(fcOUT, arcpy, text_only=bool(COLUMNAR_PATH))
+    routes = (calibration_writer.route_points(row[0], 'route - ' + str(recno), row[2], dtype,
+                                              MEASURE_TOLERANCE if THIN_VERTICES else None, project)
+              for recno, row in enumerate(telemetry.timed_iter('cursor_read', cursorREAD)))
+    chunks = calibration_writer.chunked(routes, CHUNK_ROWS)
+    if COLUMNAR_PATH:
+        # (still in fcOUT's spatial reference, ready to load into it)
+        written = columnar_output.write_arrays(chunks, COLUMNAR_PATH, 'calibration')
+        print(str(written) + ' calibration points written to ' + COLUMNAR_PATH)
+    else:
+        calibration_writer.write_chunks(chunks, fcOUT, srOUT, arcpy)
+
+else:
+
+    # the InsertCursor we need for writing calibration points into
+    # ...the output PointZ feature class
+    cursorWRITE = arcpy.da.InsertCursor(fcOUT, fieldsOUT)
+
+    recno = 0
     
-recno = 0
-    
-# for each feature record in the input PolylineZM feature class
-for row in cursorREAD:
+    # for each feature record in the input PolylineZM feature class
+    for row in telemetry.timed_iter('cursor_read', cursorREAD):
         
-    # get route name and id
-    strRouteName = 'route - ' + str(recno)
-    strRouteId = row[2]
+        # get route name and id
+        strRouteName = 'route - ' + str(recno)
+        strRouteId = row[2]
         
-    #loop thru each vertex of each part
-    pline = row[0]
-    for part in pline:
-        for pnt in part:
-            # read out the M value, so that it can be written.. 
-            # ...into the output 'Measure' column
-            m = pnt.M  
-            # write each point to the output calibration point feature class
-            cursorWRITE.insertRow([pnt, strRouteName, strRouteId, m])
+        #read every vertex of every part into one XYZM array
+        coords, offsets, hasZ, hasM = geometry_arrays.from_esri_json(row[0])[:4]
+        # read out the M values, so that they can be written.. 
+        # ...into the output 'Measure' column (a NaN M is written as null)
+        measures = [None if m != m else m for m in coords[:, 3].tolist()]
+        points = geometry_arrays.point_json(coords, hasZ, hasM)
+        with telemetry.timer('insert'):
+            for pnt, m in zip(points, measures):
+                # write each point to the output calibration point feature class
+                cursorWRITE.insertRow([pnt, strRouteName, strRouteId, m])
         
-    recno += 1
+        recno += 1
+
+    del cursorWRITE
 
 # report back and clean up
+profiler.stop()
+telemetry.export(TELEMETRY_JSON, TELEMETRY_PROMETHEUS)
 print('ALL DONE')
 del cursorREAD
-del cursorWRITE
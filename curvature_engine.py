@@ -0,0 +1,439 @@
+#------START OF MODULE--------------------------
+
+# NumPy curvature engine for measure_track_curvature.py
+#
+# The original station loop walks each route 50' at a time and, for
+# every station, calls positionAlongLine three times, projectAs three
+# times and angleAndDistanceTo twice. This module does the same work
+# with arrays:
+#
+#   1. pull the projected (102005) vertex array of a route once
+#   2. densify it at CURVE_POINT_INTERVAL_METERS by interpolating on
+#      cumulative length (what positionAlongLine does for one point)
+#   3. unproject every station in one call (the caller supplies this,
+#      so the engine itself does not need arcpy)
+#   4. compute geodesic bearings, bearing_delta, curve_direction and
+#      milepost for every station in one array pass
+#
+# Extra chord lengths (62' and 200', say) can be measured in the same
+# pass: each station's bearing delta over a chord is from the chord's
+# start, half a chord back, through the station to half a chord on.
+# The densified stations and projected vertices are shared, and the
+# chord ends of every chord are unprojected together in one call.
+#
+# adaptive_stations() does the same, but skips the stations of long
+# tangents: a station whose three-point window lies on a run of
+# (nearly) collinear vertices can only be STRAIGHT, so only the first
+# and last station of each such run are kept, as a STRAIGHT span with a
+# curve of 0. Every other station is computed exactly as above.
+#
+# Tolerance against the per-station loop: station X/Y agree to well
+# under a millimeter, bearings to better than 1e-6 degrees (the loop
+# rounds them to 1e-5), and mileposts to 1e-9 miles. curve_direction
+# can therefore only differ for a station whose bearing_delta sits
+# within 1e-5 degrees of CURVE_TOLERANCE_PERCENT or of zero.
+
+import json
+import numpy as np
+
+# curve tolerance, a curve percent less than this is considered "STRAIGHT"
+CURVE_TOLERANCE_PERCENT = 0.5
+
+# measurement constants: feet, meters, miles
+CURVE_LENGTH_INTERVAL_FEET = 100  # 100' per USDOT FRA PTC
+CURVE_POINT_INTERVAL_FEET = CURVE_LENGTH_INTERVAL_FEET / 2
+CURVE_POINT_INTERVAL_METERS = CURVE_POINT_INTERVAL_FEET * 0.3048
+CURVE_POINT_INTERVAL_MILES = CURVE_POINT_INTERVAL_FEET * 0.0001893932
+METERS_PER_FOOT = 0.3048
+
+# adaptive spacing: a tangent is a run of vertices whose segments' grid
+# bearings all stay within this many degrees of each other
+TANGENT_TOLERANCE_DEGREES = 0.05
+
+# WGS84 ellipsoid, used for the geodesic bearings
+WGS84_A = 6378137.0
+WGS84_F = 1 / 298.257223563
+WGS84_E2 = WGS84_F * (2 - WGS84_F)
+
+# the rows the engine hands back, one per station, in the same
+# order as the 'curve_points' fields (minus the shape)
+STATION_DTYPE = np.dtype([
+    ('X', 'f8'), ('Y', 'f8'),
+    ('lambda', 'f8'), ('phi', 'f8'),
+    ('milepost', 'f8'),
+    ('curve_percent_actual', 'f8'),
+    ('curve_percent_absolute', 'f8'),
+    ('curve_direction', 'U8'),
+])
+
+
+#-----------------------------------------------
+
+# the extra fields of each extra chord length (feet), e.g. for 62':
+# curve_percent_actual_62, curve_percent_absolute_62, curve_direction_62
+def chord_fields(chords):
+    fields = []
+    for chord in chords:
+        tag = ('%g' % chord).replace('.', '_')
+        fields += ['curve_percent_actual_' + tag, 'curve_percent_absolute_' + tag, 'curve_direction_' + tag]
+    return fields
+
+# STATION_DTYPE, plus the extra fields of any extra chord lengths
+def station_dtype(chords=()):
+    if not chords:
+        return STATION_DTYPE
+    return np.dtype(STATION_DTYPE.descr + [(name, 'U8' if name.startswith('curve_direction') else 'f8')
+                                           for name in chord_fields(chords)])
+
+#-----------------------------------------------
+
+# read the vertices of a polyline into one (n, 2) array per part
+# ...uses the geometry's JSON so there is one call per route,
+# ...not one Point object per vertex
+def polyline_parts(pline):
+    paths = json.loads(pline.JSON)['paths']
+    return [np.array([v[:2] for v in path], dtype='f8') for path in paths]
+
+#-----------------------------------------------
+
+# cumulative length along a list of parts
+# ...returns the x, y, and distance-along-line of every vertex, with
+# ...the parts laid end to end (the jump between parts adds no length)
+# ...zero-length segments are dropped, and so is a part's first vertex
+# ...when it sits on the last vertex of the part before; where there's
+# ...a gap between parts, both ends of the jump are kept at the same
+# ...distance, so the distances never decrease
+def cumulative_length(parts):
+    xs, ys, ss = [], [], []
+    offset = 0.0
+    last = None
+    for part in parts:
+        if len(part) == 0:
+            continue
+        seg = np.hypot(np.diff(part[:, 0]), np.diff(part[:, 1]))
+        keep = np.concatenate(([True], seg > 0))
+        s = offset + np.concatenate(([0.0], np.cumsum(seg)))
+        if last is not None and part[0, 0] == last[0] and part[0, 1] == last[1]:
+            keep[0] = False
+        xs.append(part[keep, 0])
+        ys.append(part[keep, 1])
+        ss.append(s[keep])
+        offset = s[-1]
+        last = part[-1]
+    if not ss:
+        return np.zeros(0), np.zeros(0), np.zeros(0)
+    return np.concatenate(xs), np.concatenate(ys), np.concatenate(ss)
+
+# the length of a line from its cumulative_length() distances
+def line_length(s):
+    return float(s[-1]) if len(s) else 0.0
+
+#-----------------------------------------------
+
+# distances along the line of every station the loop would visit
+# ...station k sits at k * interval; a base station is only measured
+# ...while its end station is still short of the line's length, the
+# ...same test as 'while endpt_len < pline_P_len'
+def station_distances(line_len, interval=CURVE_POINT_INTERVAL_METERS):
+    line_len = round(line_len, 5)
+    count = int(line_len // interval) + 2
+    dist = np.round(np.arange(count) * interval, 5)
+    # keep every station up to and including the last end point
+    # ...(none at all on a line of zero length)
+    inside = np.nonzero(dist < line_len)[0]
+    if len(inside) == 0:
+        return dist[:0]
+    return dist[:inside[-1] + 1]
+
+#-----------------------------------------------
+
+# how many base stations a line of this length has
+def station_count(line_len, interval=CURVE_POINT_INTERVAL_METERS):
+    return max(len(station_distances(line_len, interval)) - 2, 0)
+
+#-----------------------------------------------
+
+# positionAlongLine for a whole array of distances
+def positions_along_line(x, y, s, dist):
+    return np.interp(dist, s, x), np.interp(dist, s, y)
+
+#-----------------------------------------------
+
+# forward geodesic azimuth from (lon1, lat1) to (lon2, lat2), in degrees,
+# -180 to 180 from north, the same convention as angleAndDistanceTo
+# ...stations are only 50' apart, so the Gauss mid-latitude formulas
+# ...are exact to far better than the 1e-5 degree rounding we apply
+def geodesic_azimuth(lon1, lat1, lon2, lat2):
+    phi1 = np.radians(lat1)
+    phi2 = np.radians(lat2)
+    dphi = phi2 - phi1
+    dlam = np.radians(lon2 - lon1)
+    phim = (phi1 + phi2) / 2
+    sinm = np.sin(phim)
+    w = 1 - WGS84_E2 * sinm ** 2
+    n = WGS84_A / np.sqrt(w)
+    m = WGS84_A * (1 - WGS84_E2) / (w * np.sqrt(w))
+    az_mid = np.arctan2(dlam * n * np.cos(phim), dphi * m)
+    az1 = az_mid - dlam * sinm / 2
+    az1 = (az1 + np.pi) % (2 * np.pi) - np.pi
+    return np.degrees(az1)
+
+#-----------------------------------------------
+
+# normalize bearings to 0-360 degrees, same as normalize_bearing()
+def normalize_bearings(angle):
+    az = np.where(angle < 0, 180 + (180 - np.abs(angle)), angle)
+    return np.where(az >= 360, 0, az)
+
+#-----------------------------------------------
+
+# label each bearing delta RIGHT, LEFT, or STRAIGHT
+def curve_directions(curve_percent_actual, curve_percent_absolute,
+                     tolerance=CURVE_TOLERANCE_PERCENT):
+    direction = np.full(curve_percent_actual.shape, 'UNKNOWN', dtype='U8')
+    direction[curve_percent_actual > 0] = 'RIGHT'
+    direction[curve_percent_actual < 0] = 'LEFT'
+    direction[curve_percent_absolute < tolerance] = 'STRAIGHT'
+    return direction
+
+#-----------------------------------------------
+
+# mileposts of the base stations
+# ...the loop adds CURVE_POINT_INTERVAL_MILES and rounds to 5 places at
+# ...every step, so after the first step each station adds the rounded
+# ...interval; doing the same here keeps the mileposts identical
+def station_mileposts(first_measure, count,
+                      interval_miles=CURVE_POINT_INTERVAL_MILES):
+    if count == 0:
+        return np.empty(0)
+    first = round(first_measure + interval_miles, 5)
+    return np.round(first + np.arange(count) * round(interval_miles, 5), 5)
+
+#-----------------------------------------------
+
+# fill in the extra chord fields of some stations
+# ...d is each station's distance along the line and lon, lat its
+# ...unprojected point; a chord that would run off either end of the
+# ...line is NaN and 'UNKNOWN'
+# ...known_d, known_lon, known_lat are points already unprojected
+# ...(ascending distances): a chord end on one of them reuses it
+# ...the STRAIGHT tolerance grows with the chord, as the bearing delta
+# ...of a curve does (it's given for a chord of two intervals)
+def chord_curvature(stations, x, y, s, d, lon, lat, unproject, chords,
+                    interval=CURVE_POINT_INTERVAL_METERS,
+                    tolerance=CURVE_TOLERANCE_PERCENT,
+                    known_d=(), known_lon=(), known_lat=()):
+    line_len = round(s[-1], 5)
+    halves = [chord * METERS_PER_FOOT / 2 for chord in chords]
+    ends = np.array([np.round(d - half, 5) for half in halves] + [np.round(d + half, 5) for half in halves])
+
+    # every other chord end of every chord, unprojected in one call
+    unique, inverse = np.unique(ends, return_inverse=True)
+    known_d = np.asarray(known_d, dtype='f8')
+    at = np.minimum(np.searchsorted(known_d, unique), max(len(known_d) - 1, 0))
+    known = (known_d[at] == unique) if len(known_d) else np.zeros(len(unique), dtype=bool)
+    ulon = np.empty(len(unique))
+    ulat = np.empty(len(unique))
+    ulon[known] = np.asarray(known_lon)[at[known]]
+    ulat[known] = np.asarray(known_lat)[at[known]]
+    ux, uy = positions_along_line(x, y, s, unique[~known])
+    new_lon, new_lat = unproject(ux, uy)
+    ulon[~known] = np.asarray(new_lon, dtype='f8')
+    ulat[~known] = np.asarray(new_lat, dtype='f8')
+    end_lon = ulon[inverse].reshape(ends.shape)
+    end_lat = ulat[inverse].reshape(ends.shape)
+
+    names = chord_fields(chords)
+    n = len(chords)
+    for i, half in enumerate(halves):
+        valid = (ends[i] >= 0) & (ends[n + i] < line_len)
+        bearing1 = normalize_bearings(np.round(geodesic_azimuth(end_lon[i], end_lat[i], lon, lat), 5))
+        bearing2 = normalize_bearings(np.round(geodesic_azimuth(lon, lat, end_lon[n + i], end_lat[n + i]), 5))
+        bearing_delta = np.where(valid, bearing2 - bearing1, np.nan)
+        stations[names[3 * i]] = np.round(bearing_delta, 5)
+        stations[names[3 * i + 1]] = np.abs(bearing_delta)
+        stations[names[3 * i + 2]] = curve_directions(stations[names[3 * i]], stations[names[3 * i + 1]],
+                                                      tolerance * half / interval)
+
+#-----------------------------------------------
+
+# compute every curve station of one route
+#
+# parts_P        projected (102005) vertex arrays, from polyline_parts()
+# first_measure  M of the route's first vertex (the first milepost)
+# unproject      function taking projected x, y arrays and returning
+#                lon, lat arrays in 4326
+#
+# window         (first, stop) to compute just base stations first to
+#                stop - 1 (see station_count()), or None for all of them;
+#                each one is computed exactly as it would be in a full run
+# chords         extra chord lengths (feet) to measure too, see chord_fields()
+#
+# returns a STATION_DTYPE array of the base stations, the same rows
+# the loop writes after the route's first point (station_dtype(chords)
+# with extra chords)
+def compute_stations(parts_P, first_measure, unproject,
+                     interval=CURVE_POINT_INTERVAL_METERS,
+                     interval_miles=CURVE_POINT_INTERVAL_MILES,
+                     tolerance=CURVE_TOLERANCE_PERCENT,
+                     window=None, chords=()):
+    x, y, s = cumulative_length(parts_P)
+    dist = station_distances(line_length(s), interval)
+    count = max(len(dist) - 2, 0)
+    first, stop = window if window is not None else (0, count)
+    first = max(first, 0)
+    stop = min(stop, count)
+    mileposts = station_mileposts(first_measure, stop, interval_miles)[first:]
+    count = max(stop - first, 0)
+    stations = np.zeros(count, dtype=station_dtype(chords))
+    if count == 0:
+        return stations
+
+    # base station k sits at dist[k + 1], between dist[k] and dist[k + 2]
+    dist = dist[first:stop + 2]
+
+    # every station point, projected and unprojected
+    sx, sy = positions_along_line(x, y, s, dist)
+    lon, lat = unproject(sx, sy)
+    lon = np.asarray(lon, dtype='f8')
+    lat = np.asarray(lat, dtype='f8')
+
+    # bearing from each station to the next one
+    bearing = normalize_bearings(
+        np.round(geodesic_azimuth(lon[:-1], lat[:-1], lon[1:], lat[1:]), 5))
+    bearing_delta = bearing[1:] - bearing[:-1]
+
+    stations['X'] = sx[1:-1]
+    stations['Y'] = sy[1:-1]
+    stations['lambda'] = lon[1:-1]
+    stations['phi'] = lat[1:-1]
+    stations['milepost'] = mileposts
+    stations['curve_percent_actual'] = np.round(bearing_delta, 5)
+    stations['curve_percent_absolute'] = np.abs(bearing_delta)
+    stations['curve_direction'] = curve_directions(
+        stations['curve_percent_actual'], stations['curve_percent_absolute'], tolerance)
+    if chords:
+        chord_curvature(stations, x, y, s, dist[1:-1], lon[1:-1], lat[1:-1], unproject, chords,
+                        interval, tolerance, dist, lon, lat)
+    return stations
+
+#-----------------------------------------------
+
+# the tangents of a line, as (start, end) distances along it
+# ...runs of segments whose grid bearings all stay within 'tolerance'
+# ...degrees of each other; x, y, s are from cumulative_length()
+def tangent_spans(x, y, s, tolerance=TANGENT_TOLERANCE_DEGREES):
+    bearing = np.degrees(np.unwrap(np.arctan2(np.diff(y), np.diff(x)))).tolist()
+    starts, ends = [], []
+    first = 0
+    low = high = bearing[0] if bearing else 0.0
+    for i, b in enumerate(bearing):
+        if max(high, b) - min(low, b) > tolerance:
+            starts.append(s[first])
+            ends.append(s[i])
+            first = i
+            low = high = b
+        else:
+            low, high = min(low, b), max(high, b)
+    starts.append(s[first])
+    ends.append(s[-1])
+    return np.array(starts), np.array(ends)
+
+# compute the curve stations of one route, skipping long tangents
+# ...takes the same arguments as compute_stations(), plus the tangent
+# ...tolerance, which must stay well under the curve tolerance
+# ...returns the stations compute_stations() would (the same rows, to
+# ...the bit) except on tangents, where each run of skipped stations
+# ...leaves just its first and last station, STRAIGHT with a curve of 0
+def adaptive_stations(parts_P, first_measure, unproject,
+                      interval=CURVE_POINT_INTERVAL_METERS,
+                      interval_miles=CURVE_POINT_INTERVAL_MILES,
+                      tolerance=CURVE_TOLERANCE_PERCENT,
+                      tangent_tolerance=TANGENT_TOLERANCE_DEGREES,
+                      chords=()):
+    x, y, s = cumulative_length(parts_P)
+    dist = station_distances(line_length(s), interval)
+    count = max(len(dist) - 2, 0)
+    if count == 0:
+        return np.zeros(0, dtype=station_dtype(chords))
+
+    # base station k is skipped when dist[k] to dist[k + 2] (and its
+    # longest extra chord) is on one tangent
+    reach = max([chord * METERS_PER_FOOT / 2 for chord in chords] + [interval])
+    window_from = np.minimum(dist[:count], dist[1:-1] - reach)
+    window_to = np.maximum(dist[2:], dist[1:-1] + reach)
+    starts, ends = tangent_spans(x, y, s, tangent_tolerance)
+    span = np.searchsorted(starts, window_from, 'right') - 1
+    skip = (span >= 0) & (window_from >= starts[np.maximum(span, 0)]) & (window_to <= ends[np.maximum(span, 0)])
+
+    # the first and last station of each run of skipped stations stay
+    edge = np.zeros(count + 2, dtype=bool)
+    edge[1:-1] = skip
+    change = np.diff(edge.astype('i1'))
+    keep_skipped = np.zeros(count, dtype=bool)
+    keep_skipped[np.nonzero(change == 1)[0]] = True
+    keep_skipped[np.nonzero(change == -1)[0] - 1] = True
+    measured = np.nonzero(~skip)[0]
+    kept = np.nonzero(~skip | keep_skipped)[0]
+
+    # just the station points that are needed, projected and unprojected
+    needed = np.zeros(len(dist), dtype=bool)
+    for offset in (0, 1, 2):
+        needed[measured + offset] = True
+    needed[kept + 1] = True
+    index = np.nonzero(needed)[0]
+    sx = np.full(len(dist), np.nan)
+    sy = np.full(len(dist), np.nan)
+    lon = np.full(len(dist), np.nan)
+    lat = np.full(len(dist), np.nan)
+    sx[index], sy[index] = positions_along_line(x, y, s, dist[index])
+    lon_needed, lat_needed = unproject(sx[index], sy[index])
+    lon[index] = np.asarray(lon_needed, dtype='f8')
+    lat[index] = np.asarray(lat_needed, dtype='f8')
+
+    # bearings either side of each measured station
+    bearing1 = normalize_bearings(np.round(geodesic_azimuth(lon[measured], lat[measured],
+                                                            lon[measured + 1], lat[measured + 1]), 5))
+    bearing2 = normalize_bearings(np.round(geodesic_azimuth(lon[measured + 1], lat[measured + 1],
+                                                            lon[measured + 2], lat[measured + 2]), 5))
+    bearing_delta = np.zeros(count)
+    bearing_delta[measured] = bearing2 - bearing1
+
+    stations = np.zeros(len(kept), dtype=station_dtype(chords))
+    stations['X'] = sx[kept + 1]
+    stations['Y'] = sy[kept + 1]
+    stations['lambda'] = lon[kept + 1]
+    stations['phi'] = lat[kept + 1]
+    stations['milepost'] = station_mileposts(first_measure, count, interval_miles)[kept]
+    stations['curve_percent_actual'] = np.round(bearing_delta[kept], 5)
+    stations['curve_percent_absolute'] = np.abs(bearing_delta[kept])
+    stations['curve_direction'] = curve_directions(
+        stations['curve_percent_actual'], stations['curve_percent_absolute'], tolerance)
+
+    # the extra chords of the measured stations; the spans are STRAIGHT on all of them
+    if chords:
+        rows = np.isin(kept, measured)
+        measured_rows = np.zeros(rows.sum(), dtype=stations.dtype)
+        chord_curvature(measured_rows, x, y, s, dist[kept[rows] + 1], lon[kept[rows] + 1],
+                        lat[kept[rows] + 1], unproject, chords, interval, tolerance,
+                        dist[index], lon[index], lat[index])
+        for name in chord_fields(chords):
+            if name.startswith('curve_direction'):
+                stations[name] = 'STRAIGHT'
+            stations[name][rows] = measured_rows[name]
+    return stations
+
+#-----------------------------------------------
+
+# turn station records into 'curve_points' insert rows
+# ...the shape goes in as a (lon, lat) tuple, so open the InsertCursor
+# ...with 'SHAPE@XY' rather than 'SHAPE@'
+# ...an extra chord's NaN (it ran off the line) goes in as a null
+def station_rows(stations):
+    chords = len(stations.dtype.names) > len(STATION_DTYPE.names)
+    for st in stations.tolist():
+        if chords:
+            st = tuple(None if v != v else v for v in st)
+        yield ((st[2], st[3]),) + st
+
+#------END OF MODULE----------------------------
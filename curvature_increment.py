@@ -0,0 +1,213 @@
+#------START OF MODULE--------------------------
+
+# Incremental curvature refresh for measure_track_curvature.py
+#
+# A full run recreates curve_points and measures every route again,
+# even when only a few track segments were realigned. With INCREMENTAL
+# set, the script keeps a manifest next to the FGDB: every route's
+# fingerprint (a SHA-1 of its vertices, M values and parts) and a
+# digest of every vertex. On the next run each route is compared with
+# its manifest entry:
+#
+#   same fingerprint     nothing to do
+#   vertices changed     the changed stretch of the route is found by
+#                        matching vertex digests from both ends, and
+#                        only the curve points whose three-point window
+#                        (the station before, the base station and the
+#                        station after) touches it are recomputed and
+#                        replaced: a two-station margin either side
+#   length changed       every curve point from the change to the end
+#                        of the route moves, so those are all replaced
+#   first vertex, new    the whole route is replaced
+#   route gone           its curve points are deleted
+#
+# A vertex's digest covers its x, y, M and its distance along the
+# (projected) route, so a matching stretch at the end of a route is
+# also in the same place along it. Mileposts only depend on the first
+# vertex's M, so a curve point kept from the last run keeps its milepost.
+#
+# Changing any of the settings (wkids, transformation, interval,
+# tolerance, adaptive spacing or extra chords) invalidates the whole
+# manifest, and the next run is a full one. With adaptive spacing, a
+# changed route has all of its curve points replaced.
+
+import hashlib
+import json
+import os
+import numpy as np
+
+import curvature_engine
+import geometry_arrays
+import telemetry
+
+# the settings a manifest was made with; any change means a full run
+SETTINGS_KEYS = ('wkid_D', 'wkid_P', 'transformation', 'interval_meters', 'interval_miles', 'tolerance',
+                 'adaptive', 'tangent_tolerance', 'chords')
+
+# where a milepost is matched to a curve_points row (they're rounded to 5 places)
+MILEPOST_SLACK = 0.000005
+
+# the manifest entry of a route with a null or empty shape
+EMPTY_ENTRY = ('', np.zeros(0, dtype='u8'), 0.0)
+
+# constants of the vertex digest (64-bit multiply-xorshift mixing)
+_MIX = (np.uint64(0x9E3779B97F4A7C15), np.uint64(0xC2B2AE3D27D4EB4F),
+        np.uint64(0x165667B19E3779F9), np.uint64(0xD6E8FEB86659FD93))
+
+
+#-----------------------------------------------
+
+# distance along the route of every vertex, parts laid end to end
+# ...the same distances curvature_engine.cumulative_length() gives the
+# ...vertices it keeps
+def vertex_distances(parts_P):
+    ss = []
+    offset = 0.0
+    for part in parts_P:
+        seg = np.hypot(np.diff(part[:, 0]), np.diff(part[:, 1]))
+        s = offset + np.concatenate(([0.0], np.cumsum(seg)))
+        ss.append(s)
+        offset = s[-1] if len(s) else offset
+    return np.concatenate(ss) if ss else np.zeros(0)
+
+# a 64-bit digest of every vertex: its x, y, M and distance along the route
+def vertex_digests(coords, distances):
+    h = np.zeros(len(coords), dtype='u8')
+    columns = (coords[:, 0], coords[:, 1], coords[:, 3], distances)
+    with np.errstate(over='ignore'):
+        for column, mix in zip(columns, _MIX):
+            h = (h ^ np.ascontiguousarray(column, dtype='f8').view('u8')) * mix
+            h ^= h >> np.uint64(31)
+    return h
+
+# a route's manifest entry, (fingerprint, vertex digests, line length),
+# and the distance along the route of each vertex
+# ...shape_json is the route's SHAPE@JSON, parts_P its projected parts
+def route_digest(shape_json, parts_P):
+    coords, offsets = geometry_arrays.from_esri_json(shape_json)[:2]
+    sha = hashlib.sha1(np.ascontiguousarray(coords).tobytes())
+    sha.update(offsets.tobytes())
+    distances = vertex_distances(parts_P)
+    length = float(distances[-1]) if len(distances) else 0.0
+    return (sha.hexdigest(), vertex_digests(coords, distances), length), distances
+
+#-----------------------------------------------
+
+# which base stations of a route need computing again
+# ...previous and current are manifest entries (previous is None for a
+# ...new route), distances the distance along the route of each vertex
+# ...returns None if nothing changed, or (first, stop, whole), where base
+# ...stations first to stop - 1 are replaced (stop is the route's station
+# ...count when the window runs to its end), and whole is True when every
+# ...curve point of the route goes, its first one too
+def changed_window(previous, current, distances, interval):
+    count = curvature_engine.station_count(current[2], interval)
+    if previous is None:
+        return 0, count, True
+    if previous[0] == current[0]:
+        return None
+    old, new = previous[1], current[1]
+
+    # vertices matching at the start, then at the end (not overlapping them)
+    n = min(len(old), len(new))
+    differ = np.nonzero(old[:n] != new[:n])[0]
+    head = differ[0] if len(differ) else n
+    if head == 0:
+        return 0, count, True
+    differ = np.nonzero(old[::-1][:n - head] != new[::-1][:n - head])[0]
+    tail = differ[0] if len(differ) else n - head
+
+    # the stretch of the route that changed runs from the last matching
+    # head vertex to the first matching tail vertex (a tail whose distances
+    # moved never matches, so with no tail it runs to the end)
+    changed_from = distances[head - 1]
+    changed_to = distances[len(distances) - tail] if tail else np.inf
+
+    # base station k's window runs from dist[k] to dist[k + 2]
+    dist = curvature_engine.station_distances(current[2], interval)
+    first = int(np.searchsorted(dist, changed_from, 'right')) - 2
+    stop = count if tail == 0 else int(np.searchsorted(dist, changed_to, 'right'))
+    return max(first, 0), min(max(stop, 0), count), False
+
+# the mileposts of the rows a window replaces, (from, to)
+# ...to is None when the window runs to the end of the route, so that
+# ...rows past the end of a route that got shorter go too; from is None
+# ...when every row of the route goes
+def window_mileposts(window, first_measure, count, interval_miles):
+    first, stop, whole = window
+    if whole:
+        return None, None
+    mileposts = curvature_engine.station_mileposts(first_measure, max(first, stop) + 1, interval_miles)
+    return mileposts[first], (mileposts[stop - 1] if stop < count else None)
+
+#-----------------------------------------------
+
+# the settings that matter to a manifest
+def settings_key(settings):
+    return json.dumps([settings.get(key) for key in SETTINGS_KEYS])
+
+# read a manifest, as {route_id: (fingerprint, vertex digests, line length)}
+# ...empty if there isn't one, or it was made with other settings
+def load_manifest(path, settings):
+    if not path or not os.path.exists(path):
+        return {}
+    with np.load(path) as npz:
+        if str(npz['settings']) != settings_key(settings):
+            return {}
+        start = npz['vertex_start']
+        digests = npz['vertex_digests']
+        return dict((str(route_id), (str(fingerprint), digests[start[i]:start[i + 1]], float(length)))
+                    for i, (route_id, fingerprint, length)
+                    in enumerate(zip(npz['route_ids'], npz['fingerprints'], npz['lengths'])))
+
+# write a manifest, under a temporary name first
+def save_manifest(path, entries, settings):
+    route_ids = list(entries)
+    start = np.zeros(len(route_ids) + 1, dtype='i8')
+    start[1:] = np.cumsum([len(entries[route_id][1]) for route_id in route_ids])
+    digests = [entries[route_id][1] for route_id in route_ids]
+    with open(path + '.tmp', 'wb') as fileOUT:
+        np.savez(fileOUT, settings=np.array(settings_key(settings)),
+                 route_ids=np.array(route_ids, dtype=str),
+                 fingerprints=np.array([entries[route_id][0] for route_id in route_ids], dtype=str),
+                 lengths=np.array([entries[route_id][2] for route_id in route_ids], dtype='f8'),
+                 vertex_start=start,
+                 vertex_digests=np.concatenate(digests) if digests else np.zeros(0, dtype='u8'))
+    os.replace(path + '.tmp', path)
+
+#-----------------------------------------------
+
+# the where clause of a route's curve_points rows, from milepost
+# mp_from to mp_to (either None for open-ended)
+def rows_clause(arcpy_module, fc, route_id_field, route_id, mp_from=None, mp_to=None):
+    clause = arcpy_module.AddFieldDelimiters(fc, route_id_field) + " = '" + str(route_id).replace("'", "''") + "'"
+    milepost = arcpy_module.AddFieldDelimiters(fc, 'milepost')
+    if mp_from is not None:
+        clause += ' AND ' + milepost + ' >= ' + repr(float(mp_from) - MILEPOST_SLACK)
+    if mp_to is not None:
+        clause += ' AND ' + milepost + ' <= ' + repr(float(mp_to) + MILEPOST_SLACK)
+    return clause
+
+# delete a route's curve_points rows, returns how many
+def delete_rows(arcpy_module, fc, route_id_field, route_id, mp_from=None, mp_to=None):
+    deleted = 0
+    clause = rows_clause(arcpy_module, fc, route_id_field, route_id, mp_from, mp_to)
+    with telemetry.timer('delete'), arcpy_module.da.UpdateCursor(fc, ['OID@'], clause) as cursor:
+        for _ in cursor:
+            cursor.deleteRow()
+            deleted += 1
+    return deleted
+
+# replace the curve_points rows of one refreshed route
+# ...mileposts are window_mileposts()', stations the rows computed for
+# ...the window (led by the route's first curve point when it's whole)
+# ...fields are the InsertCursor's, with the route id field last
+# ...returns (rows deleted, rows inserted)
+def replace_rows(arcpy_module, fc, fields, route_id_field, route_id, mileposts, stations):
+    deleted = delete_rows(arcpy_module, fc, route_id_field, route_id, mileposts[0], mileposts[1])
+    with telemetry.timer('insert'), arcpy_module.da.InsertCursor(fc, fields) as cursor:
+        for to_insert in curvature_engine.station_rows(stations):
+            cursor.insertRow(to_insert + (route_id,))
+    return deleted, len(stations)
+
+#------END OF MODULE----------------------------
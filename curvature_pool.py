@@ -0,0 +1,235 @@
+#------START OF MODULE--------------------------
+
+# Multi-route curvature runs for measure_track_curvature.py
+#
+# Each route is handed to a worker process as its SHAPE@JSON string.
+# The worker projects its vertex arrays (see coordinate_projection.py),
+# computes its stations with curvature_engine, and hands back one
+# STATION_DTYPE array per route (the route's first point followed by
+# every measured station). The workers never build arcpy geometries.
+#
+# Only the process that calls run_routes() ever writes to the FGDB. A
+# file geodatabase allows a single writer, so the workers never open a
+# cursor; the caller drains the results into one InsertCursor. With
+# write_route() instead, each worker writes its routes' stations to
+# their own Arrow/Parquet files (see columnar_output.py) and only hands
+# back a row count. With refresh_route(), each worker only computes the
+# curve points of its route that changed since the last run (see
+# curvature_increment.py).
+#
+# Results come back in the order the routes were submitted, however
+# the workers happen to finish. At most 'window' routes are in flight
+# at once, so memory stays bounded on a large network. Each worker's
+# telemetry (its stage timers and counters) comes back with its route
+# and is merged into the calling process's (see telemetry.py).
+#
+# NOTE: worker processes re-import the script that starts the pool
+# (Windows has no fork), so that script must start the pool from
+# under an  if __name__ == '__main__':  guard.
+
+import collections
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import columnar_output
+import coordinate_projection
+import curvature_engine
+import curvature_increment
+import telemetry
+
+# per-process settings, filled in by init_worker()
+_settings = {}
+
+
+#-----------------------------------------------
+
+# set up a process to compute routes
+# ...settings is a plain dict so that it pickles: the wkids of the
+# ...unprojected and projected spatial references, the transformation,
+# ...the projection backend (None for the first one available), the
+# ...interval and tolerance constants of the script, 'adaptive' and
+# ...'tangent_tolerance' for adaptive spacing, 'chords' for any extra
+# ...chord lengths (feet), and for
+# ...write_route() the 'output_folder' and 'output_format' of the files
+def init_worker(settings):
+    _settings.clear()
+    _settings.update(settings)
+    backend = settings.get('projection_backend')
+    _settings['project'] = coordinate_projection.get_transformer(
+        settings['wkid_D'], settings['wkid_P'], settings['transformation'], backend)
+    _settings['unproject'] = coordinate_projection.get_transformer(
+        settings['wkid_P'], settings['wkid_D'], settings['transformation'], backend)
+
+#-----------------------------------------------
+
+# a route's parts, unprojected and projected, and its first curve point
+# ...the first curve point is the route's first vertex with a curve of 0
+# ...and 'STRAIGHT'
+# ...None for a null or empty shape (no parts, or no vertices in them)
+# ...a route without M values raises ValueError: its mileposts come
+# ...from the first vertex's M
+def _route_parts(shape_json):
+    if shape_json is None:
+        return None
+    shape = json.loads(shape_json)
+    paths = [path for path in shape.get('paths') or [] if path]
+    if not paths:
+        return None
+    if not shape.get('hasM'):
+        raise ValueError('route has no M values, so no mileposts: ' + shape_json[:80])
+    m_col = 3 if shape.get('hasZ') else 2
+
+    # the route's vertices, unprojected and projected, one array per part
+    parts_D = [np.array(path, dtype='f8') for path in paths]
+    parts_P = []
+    for part in parts_D:
+        x, y = _settings['project'](part[:, 0], part[:, 1])
+        parts_P.append(np.column_stack((x, y)))
+    ptFirst_D = parts_D[0][0]
+    ptFirst_P = parts_P[0][0]
+
+    # (and on any extra chords too)
+    chords = _settings.get('chords', ())
+    first = np.zeros(1, dtype=curvature_engine.station_dtype(chords))
+    first[0] = (ptFirst_P[0], ptFirst_P[1], ptFirst_D[0], ptFirst_D[1], ptFirst_D[m_col],
+                0, 0, 'STRAIGHT') + tuple('STRAIGHT' if name.startswith('curve_direction') else 0
+                                          for name in curvature_engine.chord_fields(chords))
+    return parts_D, parts_P, first
+
+# the stations of a route with none (a null or empty shape)
+def _no_stations():
+    return np.zeros(0, dtype=curvature_engine.station_dtype(_settings.get('chords', ())))
+
+# the route's base stations (all of them, or a window of them)
+# ...with 'adaptive' set, long tangents are skipped (never windowed)
+def _route_stations(parts_P, first, window=None):
+    with telemetry.timer('geometry'):
+        if _settings.get('adaptive'):
+            return curvature_engine.adaptive_stations(parts_P, first['milepost'][0],
+                                                      _settings['unproject'],
+                                                      _settings['interval_meters'],
+                                                      _settings['interval_miles'],
+                                                      _settings['tolerance'],
+                                                      _settings['tangent_tolerance'],
+                                                      _settings.get('chords', ()))
+        return curvature_engine.compute_stations(parts_P, first['milepost'][0],
+                                                 _settings['unproject'],
+                                                 _settings['interval_meters'],
+                                                 _settings['interval_miles'],
+                                                 _settings['tolerance'],
+                                                 window, _settings.get('chords', ()))
+
+# compute every curve point of one route
+# ...job is (route_index, route_id, shape_json)
+# ...returns (route_index, route_id, stations), where the first station
+# ...is the route's first vertex with a curve of 0 and 'STRAIGHT' (no
+# ...stations at all for a null or empty shape)
+def compute_route(job):
+    route_index, route_id, shape_json = job
+    parts = _route_parts(shape_json)
+    telemetry.count('routes')
+    if parts is None:
+        return route_index, route_id, _no_stations()
+    _, parts_P, first = parts
+    stations = np.concatenate((first, _route_stations(parts_P, first)))
+    telemetry.count('curve_points', len(stations))
+    return route_index, route_id, stations
+
+# compute one route and write its stations to a file of their own
+# ...returns (route_index, route_id, rows written)
+def write_route(job):
+    route_index, route_id, stations = compute_route(job)
+    path = columnar_output.route_path(_settings['output_folder'], route_index,
+                                      _settings.get('output_format', 'parquet'))
+    with telemetry.timer('insert'):
+        rows = columnar_output.write_arrays([stations], path, 'stations', {'RouteId': route_id},
+                                            columnar_output.extra_columns(stations.dtype, 'stations'))
+    return route_index, route_id, rows
+
+# compute just the curve points of a route that changed since the last run
+# ...job is (route_index, route_id, shape_json, previous), previous being
+# ...the route's manifest entry from the last run, or None
+# ...returns (route_index, route_id, entry, window, mileposts, stations),
+# ...the route's new manifest entry, the window of base stations that
+# ...changed and the mileposts of the rows it replaces (both None if
+# ...nothing did, see curvature_increment.py), and the new rows
+# ...a null or empty shape has an entry with no vertices, and when it
+# ...changed, the window takes all of the route's curve points away
+def refresh_route(job):
+    route_index, route_id, shape_json, previous = job
+    parts = _route_parts(shape_json)
+    telemetry.count('routes')
+    if parts is None:
+        entry = curvature_increment.EMPTY_ENTRY
+        window = curvature_increment.changed_window(previous, entry, np.zeros(0), _settings['interval_meters'])
+        if window is None:
+            return route_index, route_id, entry, None, None, None
+        telemetry.count('routes_changed')
+        return route_index, route_id, entry, window, (None, None), _no_stations()
+    _, parts_P, first = parts
+    entry, distances = curvature_increment.route_digest(shape_json, parts_P)
+    window = curvature_increment.changed_window(previous, entry, distances, _settings['interval_meters'])
+    if window is None:
+        return route_index, route_id, entry, None, None, None
+    count = curvature_engine.station_count(entry[2], _settings['interval_meters'])
+    # adaptive rows don't line up with a window, so the whole route goes
+    if _settings.get('adaptive'):
+        window = (0, count, True)
+    mileposts = curvature_increment.window_mileposts(window, first['milepost'][0], count,
+                                                     _settings['interval_miles'])
+    stations = _route_stations(parts_P, first, window[:2])
+    if window[2]:
+        stations = np.concatenate((first, stations))
+    telemetry.count('routes_changed')
+    telemetry.count('curve_points', len(stations))
+    return route_index, route_id, entry, window, mileposts, stations
+
+#-----------------------------------------------
+
+# run one job in a worker, handing back what it returns and the
+# telemetry it took
+def _run_measured(function, job):
+    telemetry.reset()
+    return function(job), telemetry.snapshot()
+
+# the result of a job, once it's back, with its telemetry merged in
+def _collect(future):
+    with telemetry.timer('pool_wait'):
+        result, snap = future.result()
+    telemetry.merge(snap)
+    return result
+
+# compute many routes on a pool of worker processes
+# ...jobs is any iterable of (route_index, route_id, shape_json), read lazily
+# ...yields what 'function' returns for each job (compute_route's
+# ...(route_index, route_id, stations) by default), in the same order as jobs
+def run_routes(jobs, settings, workers=None, window=None, function=compute_route):
+    workers = workers or os.cpu_count() or 1
+    window = window or workers * 4
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker,
+                             initargs=(settings,)) as pool:
+        pending = collections.deque()
+        for job in jobs:
+            pending.append(pool.submit(_run_measured, function, job))
+            # hand back the oldest route before reading any further ahead
+            if len(pending) >= window:
+                yield _collect(pending.popleft())
+        while pending:
+            yield _collect(pending.popleft())
+
+#-----------------------------------------------
+
+# group an iterable of rows into lists of at most 'size' rows
+def batched(rows, size):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+#------END OF MODULE----------------------------
@@ -0,0 +1,192 @@
+#------START OF MODULE--------------------------
+
+# Curve events from a stream of curve points
+#
+# curve_points has a row every 50', labelled LEFT, RIGHT or STRAIGHT,
+# and a PTC consumer looking for the curves has to scan all of them.
+# This module merges each run of consecutive curve points of one route
+# with the same direction (LEFT or RIGHT, so at or above the curve
+# tolerance) into one curve event, a linear event on the route:
+#
+#   RouteId            the route
+#   curve_direction    LEFT or RIGHT
+#   begin_milepost     milepost of the first curve point of the run
+#   end_milepost       milepost of the last one
+#   station_count      curve points in the run
+#   length_feet        station_count curve point intervals
+#   max_degree         largest curve_percent_absolute in the run
+#   mean_degree        mean curve_percent_absolute
+#   spiral_in_feet     spiral hints: how far the curve takes to reach
+#   spiral_out_feet    SPIRAL_BODY_FRACTION of max_degree at its start,
+#                      and how far from its end it drops below that
+#                      (0 for a simple curve; long for a spiralled one)
+#
+# The curve points come in as a generator of structured arrays (the
+# curve_points fields plus RouteId, in route and milepost order), so
+# they can come straight from the curvature run (route_chunks() of the
+# pool's results), from its Arrow/Parquet files
+# (columnar_output.read_arrays()), or from curve_points itself
+# (cursor_chunks()). Only the run still open at the end of a chunk is
+# carried over to the next one, so memory stays bounded.
+#
+#   events = curve_events.segment(columnar_output.read_arrays(folder))
+#
+# Load the events into a table made from curve_events_template (see
+# segment_curve_events.py) and make a route event layer of it on the
+# routes, with RouteId, begin_milepost and end_milepost.
+
+import numpy as np
+
+import curvature_engine
+import telemetry
+
+# the share of a curve's max_degree that marks the end of its spirals
+SPIRAL_BODY_FRACTION = 0.9
+
+# curve point rows read from curve_points per chunk (cursor_chunks)
+CHUNK_ROWS = 100000
+
+# the fields of an event, after RouteId, in order
+EVENT_FIELDS = ['curve_direction', 'begin_milepost', 'end_milepost', 'station_count', 'length_feet',
+                'max_degree', 'mean_degree', 'spiral_in_feet', 'spiral_out_feet']
+
+# the curve_points fields an event is made from
+STATION_FIELDS = ['RouteId', 'milepost', 'curve_percent_absolute', 'curve_direction']
+
+# the directions that make a curve
+CURVE_DIRECTIONS = ('LEFT', 'RIGHT')
+
+
+#-----------------------------------------------
+
+# the dtype of the events of routes whose ids fit 'id_dtype'
+def event_dtype(id_dtype='U64'):
+    return np.dtype([('RouteId', id_dtype), ('curve_direction', 'U8'),
+                     ('begin_milepost', 'f8'), ('end_milepost', 'f8'),
+                     ('station_count', 'i8'), ('length_feet', 'f8'),
+                     ('max_degree', 'f8'), ('mean_degree', 'f8'),
+                     ('spiral_in_feet', 'f8'), ('spiral_out_feet', 'f8')])
+
+# the dtype of the curve points segment() works on
+def _station_dtype(id_dtype):
+    return np.dtype([('RouteId', id_dtype), ('milepost', 'f8'),
+                     ('curve_percent_absolute', 'f8'), ('curve_direction', 'U8')])
+
+# the event of one run of curve points
+def _event(rows, interval_feet):
+    degree = rows['curve_percent_absolute']
+    max_degree = degree.max()
+    body = np.nonzero(degree >= SPIRAL_BODY_FRACTION * max_degree)[0]
+    return (rows['RouteId'][0], rows['curve_direction'][0],
+            rows['milepost'][0], rows['milepost'][-1],
+            len(rows), len(rows) * interval_feet,
+            max_degree, degree.mean(),
+            body[0] * interval_feet, (len(rows) - 1 - body[-1]) * interval_feet)
+
+#-----------------------------------------------
+
+# yield an array of curve events for each chunk of curve points
+# ...chunks is an iterable of structured arrays with STATION_FIELDS, in
+# ...route and milepost order; a run still open at the end of a chunk
+# ...is finished in the next one, so a chunk's events may come later
+def segment(chunks, interval_feet=curvature_engine.CURVE_POINT_INTERVAL_FEET):
+    carry = None
+    for chunk in chunks:
+        if not len(chunk):
+            continue
+        id_dtype = chunk['RouteId'].dtype
+        if carry is not None and carry['RouteId'].dtype.itemsize > id_dtype.itemsize:
+            id_dtype = carry['RouteId'].dtype
+        rows = np.zeros(len(chunk), dtype=_station_dtype(id_dtype))
+        for name in STATION_FIELDS:
+            rows[name] = chunk[name]
+        if carry is not None:
+            rows = np.concatenate((carry.astype(rows.dtype), rows))
+            carry = None
+
+        # runs of one route and one direction
+        change = np.ones(len(rows), dtype=bool)
+        change[1:] = ((rows['RouteId'][1:] != rows['RouteId'][:-1]) |
+                      (rows['curve_direction'][1:] != rows['curve_direction'][:-1]))
+        starts = np.nonzero(change)[0]
+        stops = np.append(starts[1:], len(rows))
+
+        # the last run may go on in the next chunk
+        if rows['curve_direction'][starts[-1]] in CURVE_DIRECTIONS:
+            carry = rows[starts[-1]:]
+        starts, stops = starts[:-1], stops[:-1]
+
+        curves = np.isin(rows['curve_direction'][starts], CURVE_DIRECTIONS)
+        events = [_event(rows[a:b], interval_feet) for a, b in zip(starts[curves], stops[curves])]
+        if events:
+            yield np.array(events, dtype=event_dtype(rows['RouteId'].dtype))
+
+    if carry is not None:
+        yield np.array([_event(carry, interval_feet)], dtype=event_dtype(carry['RouteId'].dtype))
+
+#-----------------------------------------------
+
+# the curve point chunks of the pool's (route_index, route_id, stations)
+# results, one chunk per route
+def route_chunks(results):
+    for _, route_id, stations in results:
+        route_id = '' if route_id is None else str(route_id)
+        chunk = np.zeros(len(stations), dtype=_station_dtype('U' + str(max(len(route_id), 1))))
+        chunk['RouteId'] = route_id
+        for name in STATION_FIELDS[1:]:
+            chunk[name] = stations[name]
+        yield chunk
+
+# pass the pool's results through unchanged, handing each route's events
+# to write(events) on the way
+# ...so the curve points and their events come out of the one run
+def tap(results, write, interval_feet=curvature_engine.CURVE_POINT_INTERVAL_FEET):
+    for result in results:
+        for events in segment(route_chunks([result]), interval_feet):
+            write(events)
+        yield result
+
+# the curve point chunks of a curve_points feature class, in route and
+# milepost order
+# ...a single-route run writes curve_points without a route ID field;
+# ...then every curve point gets a RouteId of '' and the order is by
+# ...milepost alone
+def cursor_chunks(arcpy_module, fc, route_id_field='RouteId', chunk_rows=CHUNK_ROWS):
+    names = set(f.name.upper() for f in arcpy_module.ListFields(fc))
+    has_route_id = route_id_field.upper() in names
+    fields = STATION_FIELDS[1:]
+    order = 'ORDER BY milepost'
+    if has_route_id:
+        fields = [route_id_field] + fields
+        order = 'ORDER BY ' + route_id_field + ', milepost'
+    with arcpy_module.da.SearchCursor(fc, fields, sql_clause=(None, order)) as cursor:
+        rows = []
+        for row in telemetry.timed_iter('cursor_read', cursor):
+            rows.append(row if has_route_id else ('',) + tuple(row))
+            if len(rows) == chunk_rows:
+                yield _rows_chunk(rows)
+                rows = []
+        if rows:
+            yield _rows_chunk(rows)
+
+def _rows_chunk(rows):
+    route_ids = ['' if row[0] is None else str(row[0]) for row in rows]
+    chunk = np.zeros(len(rows), dtype=_station_dtype('U' + str(max(max(map(len, route_ids)), 1))))
+    chunk['RouteId'] = route_ids
+    chunk['milepost'] = [row[1] for row in rows]
+    chunk['curve_percent_absolute'] = [row[2] for row in rows]
+    chunk['curve_direction'] = [row[3] for row in rows]
+    return chunk
+
+#-----------------------------------------------
+
+# insert event arrays into a table through an InsertCursor opened with
+# ['RouteId'] + EVENT_FIELDS, returns how many
+def insert_events(cursor, events):
+    with telemetry.timer('insert'):
+        for event in events.tolist():
+            cursor.insertRow(event)
+    telemetry.count('curve_events', len(events))
+    return len(events)
+
+#------END OF MODULE----------------------------
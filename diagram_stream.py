@@ -0,0 +1,220 @@
+#------START OF MODULE--------------------------
+
+# Streaming reader for Export Diagram Content JSON files
+#
+# json.load() on a multi-gigabyte diagram export builds the whole
+# document as nested dicts and lists, several times the file's size.
+# This module reads the file a chunk at a time instead and yields the
+# records one by one:
+#
+#   ('spatialRef', {...})
+#   ('junction', {...})    one per item of the 'junctions' list
+#   ('edge', {...})        one per item of the 'edges' list
+#
+# in the order they appear in the file. Any other top-level value is
+# skipped, an item at a time if it's a list.
+#
+# load_diagram() feeds those records into a DiagramContent, which keeps
+# an OBJECTID index plus the geometry as flat arrays of doubles. Only
+# the index and the coordinates stay in memory, not the document.
+# junction() and edge_arrays() return None for an OBJECTID that isn't
+# in the diagram; export_DX.py skips those records and reports them.
+
+import json
+from array import array
+import numpy as np
+
+# characters read from the file per chunk
+CHUNK_CHARS = 1 << 20
+
+_decoder = json.JSONDecoder()
+_WHITESPACE = ' \t\n\r'
+
+
+#-----------------------------------------------
+
+# a text buffer over a file, refilled on demand
+class _Reader:
+
+    def __init__(self, fileIN, chunk_chars):
+        self.fileIN = fileIN
+        self.chunk_chars = chunk_chars
+        self.buf = ''
+        self.pos = 0
+        self.eof = False
+
+    # read another chunk, dropping what's already been consumed
+    def fill(self):
+        chunk = self.fileIN.read(self.chunk_chars)
+        if not chunk:
+            self.eof = True
+        self.buf = self.buf[self.pos:] + chunk
+        self.pos = 0
+        return bool(chunk)
+
+    # the next non-whitespace character, without consuming it
+    def peek(self):
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in _WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self.fill():
+                raise ValueError('unexpected end of diagram JSON')
+
+    # consume one expected character
+    def expect(self, chars):
+        ch = self.peek()
+        if ch not in chars:
+            raise ValueError('expected one of ' + repr(chars) + ' in diagram JSON, found ' + repr(ch))
+        self.pos += 1
+        return ch
+
+    # decode one complete JSON value, reading more of the file as needed
+    # ...a value cut off by the end of the buffer fails to decode, so the
+    # ...buffer is grown (doubling the read size) and the decode retried
+    def value(self):
+        self.peek()
+        want = self.chunk_chars
+        while True:
+            try:
+                obj, end = _decoder.raw_decode(self.buf, self.pos)
+                # a number at the very end of the buffer may be cut short
+                if end < len(self.buf) or self.eof:
+                    self.pos = end
+                    return obj
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            chunk = self.fileIN.read(want)
+            if not chunk:
+                self.eof = True
+            self.buf = self.buf[self.pos:] + chunk
+            self.pos = 0
+            want *= 2
+
+    # iterate the items of a JSON array, one decoded value at a time
+    def items(self):
+        self.expect('[')
+        if self.peek() == ']':
+            self.pos += 1
+            return
+        while True:
+            yield self.value()
+            if self.expect(',]') == ']':
+                return
+
+#-----------------------------------------------
+
+# yield the records of an Export Diagram Content file one at a time
+def iter_diagram(path, chunk_chars=CHUNK_CHARS):
+    kinds = {'junctions': 'junction', 'edges': 'edge'}
+    with open(path, 'r') as fileIN:
+        reader = _Reader(fileIN, chunk_chars)
+        reader.expect('{')
+        if reader.peek() == '}':
+            return
+        while True:
+            key = reader.value()
+            reader.expect(':')
+            if key in kinds and reader.peek() == '[':
+                for item in reader.items():
+                    yield kinds[key], item
+            elif key == 'spatialRef':
+                yield 'spatialRef', reader.value()
+            elif reader.peek() == '[':
+                for _ in reader.items():
+                    pass
+            else:
+                reader.value()
+            if reader.expect(',}') == '}':
+                return
+
+#-----------------------------------------------
+
+# null z and m values are kept as NaN, which is how arcpy reads them back
+def _nan_if_null(value):
+    return float('nan') if value is None else value
+
+#-----------------------------------------------
+
+# the junctions and edges of a diagram, indexed by OBJECTID
+#
+# junction_slot[oid]   slot of the junction; its x, y, z, m are
+#                      junction_xyzm[4 * slot : 4 * slot + 4]
+# edge_slot[oid]       slot of the edge; its paths are part_start indexes
+#                      edge_parts[slot] up to edge_parts[slot + 1]
+# part_start[j]        first vertex of path j; it runs to part_start[j + 1]
+# vertex_xyzm          x, y, z, m of every vertex, 4 doubles each
+# edge_flags[slot]     1 if the edge hasZ, plus 2 if it hasM
+class DiagramContent:
+
+    def __init__(self):
+        self.spatial_ref = None
+        self.junction_slot = {}
+        self.junction_xyzm = array('d')
+        self.edge_slot = {}
+        self.edge_parts = array('q', [0])
+        self.part_start = array('q', [0])
+        self.vertex_xyzm = array('d')
+        self.edge_flags = array('b')
+
+    # keep a junction's OBJECTID and x, y, z, m
+    # ...a missing z or m is stored as 0, a null one as NaN
+    def add_junction(self, junction):
+        geom = junction['geometry']
+        self.junction_slot[junction['attributes']['OBJECTID']] = len(self.junction_xyzm) // 4
+        self.junction_xyzm.extend((geom['x'], geom['y'],
+                                   _nan_if_null(geom.get('z', 0)), _nan_if_null(geom.get('m', 0))))
+
+    # keep an edge's OBJECTID and the x, y, z, m of every vertex of every path
+    # ...the vertices are lists, x and y first; z is [2] if the edge hasZ,
+    # ...and m is the last value if the edge hasM; otherwise they're 0
+    def add_edge(self, edge):
+        geom = edge['geometry']
+        hasZ = bool(geom.get('hasZ'))
+        hasM = bool(geom.get('hasM'))
+        self.edge_slot[edge['attributes']['OBJECTID']] = len(self.edge_flags)
+        self.edge_flags.append(int(hasZ) + 2 * int(hasM))
+        for path in geom['paths']:
+            for vertex in path:
+                z = vertex[2] if hasZ else 0
+                m = vertex[-1] if hasM else 0
+                self.vertex_xyzm.extend((vertex[0], vertex[1], _nan_if_null(z), _nan_if_null(m)))
+            self.part_start.append(len(self.vertex_xyzm) // 4)
+        self.edge_parts.append(len(self.part_start) - 1)
+
+    # (x, y, z, m) of a junction, or None if the OBJECTID isn't in the diagram
+    def junction(self, oid):
+        slot = self.junction_slot.get(oid)
+        if slot is None:
+            return None
+        return tuple(self.junction_xyzm[4 * slot:4 * slot + 4])
+
+    # (coords, offsets, hasZ, hasM) of an edge as NumPy arrays, or None
+    # ...in the layout geometry_arrays.to_geometry() takes; coords is a
+    # ...view onto vertex_xyzm, nothing is copied
+    def edge_arrays(self, oid):
+        slot = self.edge_slot.get(oid)
+        if slot is None:
+            return None
+        starts = np.frombuffer(self.part_start, dtype='i8')[self.edge_parts[slot]:self.edge_parts[slot + 1] + 1]
+        coords = np.frombuffer(self.vertex_xyzm, dtype='f8')[4 * starts[0]:4 * starts[-1]].reshape(-1, 4)
+        flags = self.edge_flags[slot]
+        return coords, starts - starts[0], bool(flags & 1), bool(flags & 2)
+
+#-----------------------------------------------
+
+# read an Export Diagram Content file into a DiagramContent, streaming
+def load_diagram(path, chunk_chars=CHUNK_CHARS):
+    content = DiagramContent()
+    for kind, record in iter_diagram(path, chunk_chars):
+        if kind == 'junction':
+            content.add_junction(record)
+        elif kind == 'edge':
+            content.add_edge(record)
+        else:
+            content.spatial_ref = record
+    return content
+
+#------END OF MODULE----------------------------
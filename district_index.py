@@ -0,0 +1,177 @@
+#------START OF MODULE--------------------------
+
+# In-memory point-in-polygon index for congressional district lookups
+#
+# geocode-then-find-congress.py finds a point's district by writing the
+# point into a feature class and running SelectLayerByLocation, a full
+# geoprocessing call per address. Here the district polygons are read
+# once, and whole arrays of points are located at a time with NumPy:
+#
+#   index = load_index(fcCongress, ['STATE_NAME', 'CDFIPS', 'NAME', 'PARTY'])
+#   slots = index.locate(x, y)        # polygon slot of each point, or -1
+#   index.attributes[slot]            # that polygon's field values
+#
+# The index cuts the polygons' extent into horizontal bands, and keeps
+# the edges of every ring (holes included) that reach into each band.
+# A point is inside a polygon when a ray from it towards +x crosses
+# that polygon's edges an odd number of times, and only the edges in
+# the point's own band can cross that ray, so each point is only ever
+# tested against a few hundred edges rather than the whole boundary.
+# Each band's points and edges are tested in one vectorized step.
+#
+# Points exactly on a boundary go to one side or the other; districts
+# don't overlap, so every other point is in at most one polygon.
+
+import numpy as np
+import geometry_arrays
+
+# the average number of edges per band the index aims for
+EDGES_PER_BAND = 64
+
+# most point-edge tests done in one step (bounds the memory used)
+MAX_TESTS = 4000000
+
+
+#-----------------------------------------------
+
+# the polygons, their attributes, and their edges by band
+# ...polygons is a list of (coords, offsets) of each polygon's rings, as
+# ...geometry_arrays.from_esri_json() returns them
+# ...attributes is a list with one entry per polygon
+class PolygonIndex:
+
+    def __init__(self, polygons, attributes, edges_per_band=EDGES_PER_BAND):
+        self.attributes = list(attributes)
+
+        # every edge of every ring: x0, y0, x1, y1 and its polygon slot
+        x0, y0, x1, y1, slot = [], [], [], [], []
+        for n, (coords, offsets) in enumerate(polygons):
+            for j in range(len(offsets) - 1):
+                ring = coords[offsets[j]:offsets[j + 1], 0:2]
+                if len(ring) < 2:
+                    continue
+                x0.append(ring[:-1, 0])
+                y0.append(ring[:-1, 1])
+                x1.append(ring[1:, 0])
+                y1.append(ring[1:, 1])
+                slot.append(np.full(len(ring) - 1, n, dtype='i4'))
+        empty = np.zeros(0)
+        self.x0 = np.concatenate(x0) if x0 else empty
+        self.y0 = np.concatenate(y0) if y0 else empty
+        self.x1 = np.concatenate(x1) if x1 else empty
+        self.y1 = np.concatenate(y1) if y1 else empty
+        self.slot = np.concatenate(slot) if slot else np.zeros(0, dtype='i4')
+
+        # horizontal edges never cross a horizontal ray, so they're left out
+        edges = np.nonzero(self.y0 != self.y1)[0]
+        ymin = np.minimum(self.y0[edges], self.y1[edges])
+        ymax = np.maximum(self.y0[edges], self.y1[edges])
+        self.nbands = max(1, len(edges) // edges_per_band)
+        self.band_y0 = ymin.min() if len(edges) else 0.0
+        top = ymax.max() if len(edges) else 1.0
+        self.band_height = (top - self.band_y0) / self.nbands or 1.0
+
+        # the edges in each band, as one sorted array plus where each band starts
+        first = self.band_of(ymin)
+        last = self.band_of(ymax)
+        counts = last - first + 1
+        band = np.repeat(first, counts) + (np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts))
+        edge = np.repeat(edges, counts)
+        order = np.argsort(band, kind='stable')
+        self.band_edges = edge[order]
+        self.band_start = np.searchsorted(band[order], np.arange(self.nbands + 1))
+
+    # the band of each y (clipped to the bands there are)
+    def band_of(self, y):
+        return np.clip(((np.asarray(y) - self.band_y0) // self.band_height).astype('i8'), 0, self.nbands - 1)
+
+    # the polygon slot of each point, or -1 where the point is in none
+    def locate(self, x, y):
+        x = np.asarray(x, dtype='f8')
+        y = np.asarray(y, dtype='f8')
+        found = np.full(len(x), -1, dtype='i4')
+        valid = np.nonzero(~(np.isnan(x) | np.isnan(y)))[0]
+        bands = self.band_of(y[valid])
+        order = np.argsort(bands, kind='stable')
+        points = valid[order]
+        bands = bands[order]
+        splits = np.nonzero(np.diff(bands))[0] + 1
+        for group in np.split(np.arange(len(points)), splits):
+            if not len(group):
+                continue
+            b = bands[group[0]]
+            edges = self.band_edges[self.band_start[b]:self.band_start[b + 1]]
+            if not len(edges):
+                continue
+            step = max(1, MAX_TESTS // len(edges))
+            for start in range(0, len(group), step):
+                p = points[group[start:start + step]]
+                found[p] = self._locate_band(x[p], y[p], edges)
+        return found
+
+    # locate points against one band's edges (see locate)
+    def _locate_band(self, px, py, edges):
+        ex0 = self.x0[edges]
+        ey0 = self.y0[edges]
+        ex1 = self.x1[edges]
+        ey1 = self.y1[edges]
+        pyc = py[:, None]
+        spans = (ey0 > pyc) != (ey1 > pyc)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            xcross = ex0 + (pyc - ey0) * (ex1 - ex0) / (ey1 - ey0)
+        crosses = spans & (px[:, None] < xcross)
+
+        # an odd count of crossings of a polygon's edges puts the point in it
+        pi, ei = np.nonzero(crosses)
+        npoly = len(self.attributes)
+        key = pi.astype('i8') * npoly + self.slot[edges][ei]
+        keys, counts = np.unique(key, return_counts=True)
+        inside = keys[counts % 2 == 1]
+        result = np.full(len(px), -1, dtype='i4')
+        result[inside // npoly] = inside % npoly
+        return result
+
+#-----------------------------------------------
+
+# read a polygon feature class into a PolygonIndex
+# ...fields are the attributes kept for each polygon
+# ...the polygons are read in 'wkid' (geocoder points are in 4326)
+def load_index(fc, fields, wkid=4326):
+    import arcpy
+    polygons = []
+    attributes = []
+    sr = arcpy.SpatialReference(wkid)
+    with arcpy.da.SearchCursor(fc, ['SHAPE@JSON'] + list(fields), spatial_reference=sr) as cursor:
+        for row in cursor:
+            coords, offsets = geometry_arrays.from_esri_json(row[0])[:2]
+            polygons.append((coords, offsets))
+            attributes.append(tuple(row[1:]))
+    return PolygonIndex(polygons, attributes)
+
+#-----------------------------------------------
+
+# add the district fields to geocoded rows, a chunk at a time
+# ...rows is what batch_geocoder.geocode_stream() yields; each matched
+# ...result gets the fields' values of the polygon its x, y falls in
+# ...(None if it's in none); unmatched rows pass through as they are
+def assign_districts(rows, index, fields, chunk_rows=10000):
+    chunk = []
+
+    def flush(chunk):
+        matched = [row[2] for row in chunk if row[2] is not None]
+        if matched:
+            slots = index.locate([r['x'] for r in matched], [r['y'] for r in matched])
+            for result, slot in zip(matched, slots.tolist()):
+                values = index.attributes[slot] if slot >= 0 else (None,) * len(fields)
+                result.update(zip(fields, values))
+        return chunk
+
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == chunk_rows:
+            yield from flush(chunk)
+            chunk = []
+    if chunk:
+        yield from flush(chunk)
+
+#------END OF MODULE----------------------------
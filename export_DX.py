@@ -25,9 +25,25 @@
 # 7-Run the script below. Each record of the two copied feature classes
 #   will be edited so that the features in the Shape field are updated
 #   from the original geographic feature to the new schematic feature
+#
+#   A record whose OBJECTID isn't in the diagram json is skipped, not
+#   written, so it keeps its original geographic feature; the script
+#   prints how many records (and which, the first 20) were skipped that
+#   way, and how many diagram objects had no record to go to.
+#
+# To run without ArcGIS Pro (on Linux, say), set GEOMETRY_BACKEND to
+# 'lite': the cursors and geometry then come from arcpy_lite.py, which
+# edits the FGDB through GDAL/OGR (GDAL 3.6+ can write to an FGDB).
 
-import arcpy
-import json
+# where geometry and cursors come from: 'arcpy', or 'lite' for arcpy_lite.py
+GEOMETRY_BACKEND = 'arcpy'
+
+if GEOMETRY_BACKEND == 'arcpy':
+    import arcpy
+else:
+    import arcpy_lite as arcpy
+import diagram_stream
+import geometry_arrays
 
 
 # location of FGDB folder the contains the edges and junctions feature classes
@@ -38,14 +54,27 @@ cursorPolylines = arcpy.da.UpdateCursor("your_tracks_fc_name", ["OBJECTID", "SHA
 cursorPoints = arcpy.da.UpdateCursor("your_switches_fc_name", ["OBJECTID", "SHAPE@"])
     
 
-# open the json file that contains the exported diagram
-jsonDX = open(r'C:\path\where\you\stored\the\diagram_export.json', 'r')
+# the json file that contains the exported diagram
+pathDX = r'C:\path\where\you\stored\the\diagram_export.json'
 
-# load the json object contents into a python object tree structure
-dataDX = json.load(jsonDX)
+# read the exported diagram a chunk at a time, keeping just an index of
+# the junctions and edges by OBJECTID and their coordinates in flat arrays
+# (see diagram_stream.py), so even a multi-gigabyte export fits in memory
+# and each feature class record can look up its diagram object directly
+contentDX = diagram_stream.load_diagram(pathDX)
 
 # get the spatial reference wkid
-wkid = dataDX['spatialRef']['wkid']
+wkid = contentDX.spatial_ref['wkid']
+
+# report the oids that are only on one side, in the feature class or in the json
+# (just the first 20 of each, there can be a lot of them)
+def report_unmatched(name, oidsFC, oidsDX):
+    onlyFC = sorted(oidsFC - oidsDX)
+    onlyDX = sorted(oidsDX - oidsFC)
+    if onlyFC:
+        print(name + ': ' + str(len(onlyFC)) + ' oids only in the feature class, e.g. ' + str(onlyFC[:20]))
+    if onlyDX:
+        print(name + ': ' + str(len(onlyDX)) + ' oids only in the json, e.g. ' + str(onlyDX[:20]))
 
 
 # EXPORT JUNCTIONS FROM DIAGRAM TO FGDB POINT FEATURE CLASS
@@ -57,27 +86,25 @@ wkid = dataDX['spatialRef']['wkid']
 # ...important ... 
 # the order of the features in the exported diagram json file is NOT 
 # the same order as the records in the feature class you're editing, 
-# so, for each record in the feature class, get its oid, then loop 
-# thru the json until you find the object with the same oid.
+# so, for each record in the feature class, get its oid, then look up
+# the object with the same oid in the junctions index read above.
 #
 # once you found the correct object in the json, construct a point
 # geometry object and write it into the "switches" point feature class' 
 # shape field.
 
+oidsPointsFC = set()
 for row in cursorPoints:
     oidFC = row[0]
-    for junction in dataDX['junctions']:
-        oidDX = junction['attributes']['OBJECTID']
-        if oidDX == oidFC:
-            x = junction['geometry']['x']
-            y = junction['geometry']['y']
-            z = junction['geometry']['z']
-            m = junction['geometry']['m']
-            pt = arcpy.Point(x,y,z,m)
-            ptGeometry = arcpy.PointGeometry(pt, wkid)
-            row[1] = ptGeometry
-            cursorPoints.updateRow(row)
-            break
+    oidsPointsFC.add(oidFC)
+    junction = contentDX.junction(oidFC)
+    if junction is not None:
+        x, y, z, m = junction
+        pt = arcpy.Point(x,y,z,m)
+        ptGeometry = arcpy.PointGeometry(pt, wkid)
+        row[1] = ptGeometry
+        cursorPoints.updateRow(row)
+report_unmatched('junctions', oidsPointsFC, set(contentDX.junction_slot))
     
 
 # EXPORT EDGES FROM DIAGRAM TO FGDB POLYLINE FEATURE CLASS
@@ -89,39 +116,28 @@ for row in cursorPoints:
 # ...important ... 
 # the order of the features in the exported diagram json file is NOT the 
 # same order as the records in the feature class you're editing, so,
-# for each record in the feature class, get its oid, then loop thru
-# the json until you find the object with the same oid.
+# for each record in the feature class, get its oid, then look up
+# the object with the same oid in the edges index read above.
 #
 # once you found the correct object in the json, construct a polyline
 # object and write it into the "tracks" polyline feature class' shape field.
+# the polyline is built in one call from the edge's vertex arrays (see
+# geometry_arrays.py), all of its paths, keeping z and m when it has them.
 #
 # also, for some reason, the x,y,z,m values for each vertex in the
 # json file are named 0,1,2,3
 
+oidsPolylinesFC = set()
 for row in cursorPolylines:
     oidFC = row[0]
-    for edge in dataDX['edges']:
-        oidDX = edge['attributes']['OBJECTID']
-        if oidDX == oidFC:            
-            pathNew = arcpy.Array()
-            pathJson = edge['geometry']['paths'][0]
-            z = 0
-            hasZ = edge['geometry']['hasZ']
-            m = 0
-            hasM = edge['geometry']['hasM']
-            for vertex in pathJson:
-                x = vertex[0]
-                y = vertex[1]
-                if hasZ: z = vertex[2]
-                if hasM: m = vertex[3]
-                pt = arcpy.Point(x,y,z,m)
-                pathNew.add(pt)
-            paths = arcpy.Array()
-            paths.add(pathNew)
-            pline = arcpy.Polyline(paths, wkid)
-            row[1] = pline
-            cursorPolylines.updateRow(row)
-            break
+    oidsPolylinesFC.add(oidFC)
+    edge = contentDX.edge_arrays(oidFC)
+    if edge is not None:
+        coords, offsets, hasZ, hasM = edge
+        pline = geometry_arrays.to_geometry(coords, offsets, wkid, hasZ, hasM, arcpy_module=arcpy)
+        row[1] = pline
+        cursorPolylines.updateRow(row)
+report_unmatched('edges', oidsPolylinesFC, set(contentDX.edge_slot))
 
 
 # clean up cursors and report complete
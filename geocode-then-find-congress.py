@@ -1,94 +1,119 @@
 import arcpy
 import requests
 import json
+import request_scheduler   # these three are in the same folder as this script
+import batch_geocoder
+import district_index
 
 ### User inputs a US street address and in return is shown
 ### information about the Congressional District that address
 ### resides within.
 
-# GEOCODE THE INPUT ADDRESS
+### Or, in batch mode, a whole file of addresses is geocoded, and
+### each address is given its Congressional District
 
-input_address = input('Enter a street address:')
+# the feature class that contains the congressional district polygons
+fcCongress = "C:/mapdata/congress_districts/data/congress_data.gdb/USA_118_Congress"
 
-# this is Esri's "World Geocoding Service"
-geocode_url = "https://geocode.arcgis.com/arcgis/rest/services/World/GeocodeServer/findAddressCandidates"
+# the fields in that feature class that contain the data we're want to know
+fldsCongress = ["STATE_NAME", "CDFIPS", "NAME", "PARTY"]
 
-# this builds the parameters needed by the geocoding REST service call
-input_address_parameter = "?SingleLine=" + input_address
-token = "&token=your_token_or_api_key_here"
-extra_params = "&f=json"
-api_url = geocode_url + input_address_parameter + token + extra_params
+# BATCH MODE
 
-# make the REST API call request
-# and receive response
-response = requests.get(api_url)
+# set this to a CSV or Parquet file of addresses to geocode all of them,
+# or None to be asked for one address
+batch_input_path = None
+# the column holding the address, and the one holding an id (or None to
+# number the rows)
+batch_address_field = "Address"
+batch_id_field = None
+# where the geocoded addresses are written (.csv or .parquet)
+batch_output_path = "C:/mapdata/congress_districts/data/geocoded_addresses.csv"
+# addresses per geocodeAddresses request, and requests in flight at once
+batch_size = 150
+batch_in_flight = 4
+# the batch request parameters (batch geocoding requires forStorage=true)
+batch_params = {"token": "your_token_or_api_key_here", "f": "json", "forStorage": "true"}
+# True to add the district fields to every geocoded address
+batch_find_districts = True
 
-# format the response into JSON
-response_json = response.json()
+if batch_input_path:
+    # read, geocode and write the addresses a batch at a time
+    # (see batch_geocoder.py), so memory stays flat for any file size
+    records = batch_geocoder.read_addresses(batch_input_path, batch_address_field, batch_id_field)
+    scheduler = request_scheduler.RequestScheduler(per_host=batch_in_flight, max_retries=6)
+    geocoded = batch_geocoder.geocode_stream(records, batch_params, batch_size=batch_size,
+                                             concurrency=batch_in_flight, scheduler=scheduler)
+    extra_fields = []
+    if batch_find_districts:
+        # load the district polygons into memory once (see district_index.py),
+        # then find the district of thousands of geocoded points at a time
+        index = district_index.load_index(fcCongress, fldsCongress)
+        geocoded = district_index.assign_districts(geocoded, index, fldsCongress)
+        extra_fields = fldsCongress
+    batch_geocoder.write_results(geocoded, batch_output_path, extra_fields=extra_fields)
+    scheduler.report()
 
-# parse the JSON response to pull out the data that we need
-best_candidate = response_json["candidates"][0]
-standardized_address = best_candidate["address"]
-location = best_candidate["location"]
-x = location["x"]
-y = location["y"]
-ptGeocoded = arcpy.Point(x,y)
-ptGeocoded_geom = arcpy.PointGeometry(ptGeocoded, '4326')
+else:
+    # GEOCODE THE INPUT ADDRESS
 
-# just a gut check to ensure that the geocoding returned a point
-print('x: ' + str(x) + ', ' + 'y: ' + str(y))
+    input_address = input('Enter a street address:')
 
-# FIND THE CONGRESSIONAL DISTRICT FOR A POINT LOCATION
+    # this is Esri's "World Geocoding Service"
+    geocode_url = "https://geocode.arcgis.com/arcgis/rest/services/World/GeocodeServer/findAddressCandidates"
 
-# the feature class that contains the congressional district polygons
-fcCongress = "C:/mapdata/congress_districts/data/congress_data.gdb/USA_118_Congress"
+    # this builds the parameters needed by the geocoding REST service call
+    input_address_parameter = "?SingleLine=" + input_address
+    token = "&token=your_token_or_api_key_here"
+    extra_params = "&f=json"
+    api_url = geocode_url + input_address_parameter + token + extra_params
 
-# the fields in that feature class that contain the data we're want to know
-fldsCongress = ["STATE_NAME", "CDFIPS", "NAME", "PARTY"]
+    # make the REST API call request and receive the response as JSON
+    # (the scheduler retries the request if the service is busy or throttling)
+    scheduler = request_scheduler.RequestScheduler(max_retries=6)
+    response_json = scheduler.get_json(requests.Session(), api_url)
 
-# the feature class where we will store the geocoded point
-fcGeocodedPoint = "C:/mapdata/congress_districts/data/congress_data.gdb/geocoded_points"
+    # stop here if the address couldn't be geocoded
+    if not response_json.get("candidates"):
+        raise SystemExit("No match for that address: " + str(response_json.get("error", "no candidates")))
 
-# edit the geocoded point into the "geocoded_points" feature class
-ucGeocodedPoint = arcpy.da.UpdateCursor(fcGeocodedPoint, ["SHAPE@"])
-for row in ucGeocodedPoint:
-    row[0] = ptGeocoded_geom
-    ucGeocodedPoint.updateRow(row)
-    
-# select the congressional district that contains the geocoded point
-selDistrict = arcpy.management.SelectLayerByLocation(fcCongress, "CONTAINS", fcGeocodedPoint, 0, "NEW SELECTION")
-	
-# open the selected attribute table so that we can read data we need from the selected fields
-scDistrict = arcpy.da.SearchCursor(selDistrict, fldsCongress)
-	
-# format and display the results to the user
-for row in scDistrict:
-    result = "\nStandardized address: " + standardized_address + \
-	     "\n" + \
-	     "\nState: " + row[0] + \
-	     "\nDistrict: " + row[1] + \
-	     "\nRepresentative: " + row[2] + \
-	     "\nParty: " + row[3]
-    print(result)
-    
+    # parse the JSON response to pull out the data that we need
+    best_candidate = response_json["candidates"][0]
+    standardized_address = best_candidate["address"]
+    location = best_candidate["location"]
+    x = location["x"]
+    y = location["y"]
+    ptGeocoded = arcpy.Point(x,y)
+    ptGeocoded_geom = arcpy.PointGeometry(ptGeocoded, '4326')
+
+    # just a gut check to ensure that the geocoding returned a point
+    print('x: ' + str(x) + ', ' + 'y: ' + str(y))
+
+    # FIND THE CONGRESSIONAL DISTRICT FOR A POINT LOCATION
+
+    # (the district polygons and their fields are set at the top)
+
+    # the feature class where we will store the geocoded point
+    fcGeocodedPoint = "C:/mapdata/congress_districts/data/congress_data.gdb/geocoded_points"
+
+    # edit the geocoded point into the "geocoded_points" feature class
+    ucGeocodedPoint = arcpy.da.UpdateCursor(fcGeocodedPoint, ["SHAPE@"])
+    for row in ucGeocodedPoint:
+        row[0] = ptGeocoded_geom
+        ucGeocodedPoint.updateRow(row)
     
-	
-	
-	
-	
-	
-	
-	
-	
-	
-	
-	
-	
-	
-	
-	
-	
-	
-	
-	
-	
+    # select the congressional district that contains the geocoded point
+    selDistrict = arcpy.management.SelectLayerByLocation(fcCongress, "CONTAINS", fcGeocodedPoint, 0, "NEW SELECTION")
+	
+    # open the selected attribute table so that we can read data we need from the selected fields
+    scDistrict = arcpy.da.SearchCursor(selDistrict, fldsCongress)
+	
+    # format and display the results to the user
+    for row in scDistrict:
+        result = "\nStandardized address: " + standardized_address + \
+    	     "\n" + \
+    	     "\nState: " + row[0] + \
+    	     "\nDistrict: " + row[1] + \
+    	     "\nRepresentative: " + row[2] + \
+    	     "\nParty: " + row[3]
+        print(result)
@@ -0,0 +1,245 @@
+#------START OF MODULE--------------------------
+
+# Geometries to and from flat XYZM arrays
+#
+# Building a polyline one arcpy.Point at a time (or reading one back
+# with  for part in pline: for pnt in part) creates a Python object per
+# vertex. For vertex-heavy jobs that's millions of short-lived objects.
+# This module moves whole geometries in and out of NumPy arrays instead,
+# going through the geometry's Esri JSON:
+#
+#   coords, offsets, hasZ, hasM = from_geometry(pline)
+#   pline = to_geometry(coords, offsets, wkid, hasZ, hasM)
+#
+# coords   (n, 4) float64 array of x, y, z, m for every vertex; a z or m
+#          the geometry doesn't have (or a null one) is NaN
+# offsets  int64 array of the first vertex of each part, plus the total
+#          vertex count at the end, so part j is coords[offsets[j]:offsets[j + 1]]
+#
+# Polylines ('paths'), polygons ('rings'), multipoints ('points') and
+# points are all handled; points and multipoints have a single part.
+#
+# from_wkb() and to_wkb() do the same for (ISO) well-known binary, the
+# form GDAL/OGR reads and writes geometries in, Z and M included.
+
+import json
+import struct
+import numpy as np
+
+
+#-----------------------------------------------
+
+# read an Esri JSON geometry (a dict or a string) into arrays
+# ...returns (coords, offsets, hasZ, hasM, kind), where kind is
+# ...'paths', 'rings', 'points' or 'point'
+def from_esri_json(shape):
+    if isinstance(shape, str):
+        shape = json.loads(shape)
+    hasZ = bool(shape.get('hasZ')) or ('x' in shape and shape.get('z') is not None)
+    hasM = bool(shape.get('hasM')) or ('x' in shape and shape.get('m') is not None)
+
+    if 'x' in shape:
+        kind = 'point'
+        parts = [[[shape['x'], shape['y']] + ([shape.get('z')] if hasZ else [])
+                  + ([shape.get('m')] if hasM else [])]]
+    else:
+        kind = next(k for k in ('paths', 'rings', 'points') if k in shape)
+        parts = [shape[kind]] if kind == 'points' else shape[kind]
+
+    # columns of the JSON vertices that hold z and m
+    z_col = 2 if hasZ else None
+    m_col = (3 if hasZ else 2) if hasM else None
+
+    counts = [len(part) for part in parts]
+    offsets = np.zeros(len(parts) + 1, dtype='i8')
+    offsets[1:] = np.cumsum(counts)
+    coords = np.full((offsets[-1], 4), np.nan)
+    for j, part in enumerate(parts):
+        if not part:
+            continue
+        arr = np.array(part, dtype='f8')
+        block = coords[offsets[j]:offsets[j + 1]]
+        block[:, 0:2] = arr[:, 0:2]
+        if z_col is not None and arr.shape[1] > z_col:
+            block[:, 2] = arr[:, z_col]
+        if m_col is not None and arr.shape[1] > m_col:
+            block[:, 3] = arr[:, m_col]
+    return coords, offsets, hasZ, hasM, kind
+
+# read an arcpy geometry into arrays, returns (coords, offsets, hasZ, hasM)
+def from_geometry(geom):
+    coords, offsets, hasZ, hasM, _ = from_esri_json(geom.JSON)
+    return coords, offsets, hasZ, hasM
+
+#-----------------------------------------------
+
+# the vertex lists of an array of coordinates, with NaN written as null
+def _vertex_lists(coords, hasZ, hasM):
+    cols = [0, 1] + ([2] if hasZ else []) + ([3] if hasM else [])
+    sub = coords[:, cols]
+    nan = np.isnan(sub)
+    if nan.any():
+        sub = sub.astype(object)
+        sub[nan] = None
+    return sub.tolist()
+
+# build an Esri JSON geometry dict from arrays
+# ...kind is 'paths' (polyline), 'rings' (polygon), 'points' (multipoint)
+# ...or 'point'; wkid may be None to leave out the spatial reference
+def to_esri_json(coords, offsets, wkid=None, hasZ=False, hasM=False, kind='paths'):
+    coords = np.asarray(coords, dtype='f8')
+    vertices = _vertex_lists(coords, hasZ, hasM)
+    if kind == 'point':
+        shape = {'x': vertices[0][0], 'y': vertices[0][1]}
+        if hasZ:
+            shape['z'] = vertices[0][2]
+        if hasM:
+            shape['m'] = vertices[0][-1]
+    elif kind == 'points':
+        shape = {'points': vertices}
+    else:
+        shape = {kind: [vertices[offsets[j]:offsets[j + 1]] for j in range(len(offsets) - 1)]}
+    if hasZ and kind != 'point':
+        shape['hasZ'] = True
+    if hasM and kind != 'point':
+        shape['hasM'] = True
+    if wkid is not None:
+        shape['spatialReference'] = {'wkid': wkid}
+    return shape
+
+# build an arcpy geometry from arrays, in one call
+# ...arcpy_module is arcpy (the default) or arcpy_lite
+def to_geometry(coords, offsets, wkid, hasZ=False, hasM=False, kind='paths', arcpy_module=None):
+    if arcpy_module is None:
+        import arcpy as arcpy_module
+    return arcpy_module.AsShape(to_esri_json(coords, offsets, wkid, hasZ, hasM, kind), True)
+
+#-----------------------------------------------
+
+# Esri JSON strings of one point per vertex, for a 'SHAPE@JSON' cursor field
+# ...the spatial reference is left out, so the points take the feature class's
+def point_json(coords, hasZ=False, hasM=False):
+    keys = ['x', 'y'] + (['z'] if hasZ else []) + (['m'] if hasM else [])
+    return [json.dumps(dict(zip(keys, vertex)))
+            for vertex in _vertex_lists(np.asarray(coords, dtype='f8'), hasZ, hasM)]
+
+#-----------------------------------------------
+
+# WKB geometry type codes and the kind of Esri JSON geometry each becomes
+_WKB_KINDS = {1: 'point', 2: 'paths', 3: 'rings', 4: 'points', 5: 'paths', 6: 'rings'}
+
+# read the geometry at 'pos' of a WKB buffer
+# ...returns (base type, hasZ, hasM, parts, pos after it), where parts is
+# ...a list of (n, 2 + hasZ + hasM) arrays; multi-geometries are flattened
+def _read_wkb(buf, pos):
+    order = '<' if buf[pos] == 1 else '>'
+    code = struct.unpack_from(order + 'I', buf, pos + 1)[0]
+    pos += 5
+    # ISO codes add 1000 for Z, 2000 for M, 3000 for both; the older
+    # extended codes set the top two bits instead
+    hasZ = bool(code & 0x80000000) or (code & 0xFFFF) // 1000 in (1, 3)
+    hasM = bool(code & 0x40000000) or (code & 0xFFFF) // 1000 in (2, 3)
+    base = (code & 0xFFFF) % 1000
+    dims = 2 + hasZ + hasM
+    dtype = np.dtype(order + 'f8')
+
+    def points(count, pos):
+        arr = np.frombuffer(buf, dtype, count * dims, pos).reshape(count, dims)
+        return arr, pos + count * dims * 8
+
+    if base == 1:
+        arr, pos = points(1, pos)
+        return base, hasZ, hasM, [arr], pos
+    count = struct.unpack_from(order + 'I', buf, pos)[0]
+    pos += 4
+    if base == 2:
+        arr, pos = points(count, pos)
+        return base, hasZ, hasM, [arr], pos
+    if base == 3:
+        parts = []
+        for _ in range(count):
+            n = struct.unpack_from(order + 'I', buf, pos)[0]
+            arr, pos = points(n, pos + 4)
+            parts.append(arr)
+        return base, hasZ, hasM, parts, pos
+    if base in (4, 5, 6):
+        parts = []
+        for _ in range(count):
+            _, _, _, sub, pos = _read_wkb(buf, pos)
+            parts.extend(sub)
+        if base == 4:
+            parts = [np.concatenate(parts) if parts else np.zeros((0, dims))]
+        return base, hasZ, hasM, parts, pos
+    raise ValueError('unsupported WKB geometry type ' + str(code))
+
+# read a WKB geometry (bytes) into arrays, as from_esri_json()
+def from_wkb(wkb):
+    base, hasZ, hasM, parts, _ = _read_wkb(memoryview(wkb), 0)
+    z_col = 2 if hasZ else None
+    m_col = (3 if hasZ else 2) if hasM else None
+    offsets = np.zeros(len(parts) + 1, dtype='i8')
+    offsets[1:] = np.cumsum([len(part) for part in parts])
+    coords = np.full((offsets[-1], 4), np.nan)
+    for j, arr in enumerate(parts):
+        block = coords[offsets[j]:offsets[j + 1]]
+        block[:, 0:2] = arr[:, 0:2]
+        if z_col is not None:
+            block[:, 2] = arr[:, z_col]
+        if m_col is not None:
+            block[:, 3] = arr[:, m_col]
+    return coords, offsets, hasZ, hasM, _WKB_KINDS[base]
+
+# twice the signed area of a ring (negative when clockwise)
+def _ring_area2(ring):
+    x = ring[:, 0]
+    y = ring[:, 1]
+    return float(np.dot(x[:-1], y[1:]) - np.dot(x[1:], y[:-1]))
+
+# build ISO WKB (bytes) from arrays
+# ...'paths' is a LineString when there's one part, else a MultiLineString;
+# ...'rings' follow the Esri rule that clockwise rings are outer rings and
+# ...counterclockwise ones are holes in the outer ring before them
+def to_wkb(coords, offsets, hasZ=False, hasM=False, kind='paths'):
+    coords = np.asarray(coords, dtype='f8')
+    cols = [0, 1] + ([2] if hasZ else []) + ([3] if hasM else [])
+    flag = 1000 * (bool(hasZ) + 2 * bool(hasM))
+
+    def header(base):
+        return struct.pack('<BI', 1, base + flag)
+
+    def part(j):
+        return np.ascontiguousarray(coords[offsets[j]:offsets[j + 1]][:, cols]).tobytes()
+
+    def count(j):
+        return struct.pack('<I', offsets[j + 1] - offsets[j])
+
+    nparts = len(offsets) - 1
+    if kind == 'point':
+        return header(1) + np.ascontiguousarray(coords[0:1, cols]).tobytes()
+    if kind == 'points':
+        return (header(4) + struct.pack('<I', len(coords))
+                + b''.join(header(1) + np.ascontiguousarray(coords[i:i + 1, cols]).tobytes()
+                           for i in range(len(coords))))
+    if kind == 'paths':
+        if nparts == 1:
+            return header(2) + count(0) + part(0)
+        return (header(5) + struct.pack('<I', nparts)
+                + b''.join(header(2) + count(j) + part(j) for j in range(nparts)))
+
+    # group the rings into polygons, each outer ring followed by its holes
+    polygons = []
+    for j in range(nparts):
+        ring = coords[offsets[j]:offsets[j + 1]]
+        if not polygons or _ring_area2(ring) < 0:
+            polygons.append([j])
+        else:
+            polygons[-1].append(j)
+
+    def polygon(rings):
+        return header(3) + struct.pack('<I', len(rings)) + b''.join(count(j) + part(j) for j in rings)
+
+    if len(polygons) == 1:
+        return polygon(polygons[0])
+    return header(6) + struct.pack('<I', len(polygons)) + b''.join(polygon(rings) for rings in polygons)
+
+#------END OF MODULE----------------------------
@@ -0,0 +1,361 @@
+#------START OF MODULE--------------------------
+
+# arcpy-style geometry objects on NumPy, for running without arcpy
+#
+# The curvature, calibration and diagram scripts only use a small part
+# of arcpy's geometry: Point, PointGeometry and Polyline, length,
+# firstPoint/lastPoint, positionAlongLine, projectAs, angleAndDistanceTo
+# and the JSON of a shape. This module implements just that subset, with
+# the same names and arguments, so the scripts can run on machines that
+# don't have ArcGIS Pro (see arcpy_lite.py, which adds the cursors):
+#
+#   sr = SpatialReference(4326)
+#   pline = AsShape(shape_json, True)
+#   ptg = pline.positionAlongLine(15.24)
+#   angle, meters = ptg_a.angleAndDistanceTo(ptg_b)
+#
+# Each geometry keeps its vertices as geometry_arrays does, one (n, 4)
+# x, y, z, m array plus part offsets, so going to and from Esri JSON or
+# WKB is one array copy. projectAs() goes through coordinate_projection
+# (so the same transformations and backends are available), and
+# angleAndDistanceTo() solves the geodesic on the ellipsoid with
+# Vincenty's inverse formula when the spatial reference is geographic.
+#
+# NOTE: only what the scripts in this folder call is here. Polygons and
+# multipoints can be read, written and projected, but have no area,
+# buffer, relational or other topological methods.
+
+import json
+import math
+import numpy as np
+import coordinate_projection
+import geometry_arrays
+
+# the ellipsoid of each geographic wkid (anything else is taken as WGS84)
+ELLIPSOIDS = {4269: coordinate_projection.GRS80, 4326: coordinate_projection.WGS84}
+
+# Vincenty iterations before giving up (only nearly antipodal points need many)
+VINCENTY_ITERATIONS = 200
+
+
+#-----------------------------------------------
+
+# a spatial reference, known by its wkid
+# ...wkids 4000-4999 are geographic (degrees), anything else projected
+class SpatialReference:
+
+    def __init__(self, item=None):
+        if isinstance(item, SpatialReference):
+            item = item.factoryCode
+        elif isinstance(item, dict):
+            item = item.get('latestWkid', item.get('wkid'))
+        self.factoryCode = int(item) if item else 0
+        self.type = 'Geographic' if 4000 <= self.factoryCode < 5000 else 'Projected'
+        self.name = str(self.factoryCode)
+
+    def __eq__(self, other):
+        return isinstance(other, SpatialReference) and other.factoryCode == self.factoryCode
+
+    def __hash__(self):
+        return hash(self.factoryCode)
+
+    def __repr__(self):
+        return 'SpatialReference(' + str(self.factoryCode) + ')'
+
+    # the spatial reference as a string ('' if it has no wkid)
+    def exportToString(self):
+        return coordinate_projection.authority_name(self.factoryCode) if self.factoryCode else ''
+
+# a spatial reference from a SpatialReference, a wkid, or None
+def _spatial_reference(sr):
+    if sr is None or isinstance(sr, SpatialReference):
+        return sr
+    return SpatialReference(sr)
+
+#-----------------------------------------------
+
+# one vertex; a Z or M the geometry doesn't have is None
+class Point:
+
+    def __init__(self, X=0.0, Y=0.0, Z=None, M=None, ID=0):
+        self.X = X
+        self.Y = Y
+        self.Z = Z
+        self.M = M
+        self.ID = ID
+
+    def __repr__(self):
+        return ' '.join('NaN' if v is None else str(v) for v in (self.X, self.Y, self.Z, self.M))
+
+# a list of Points (or of lists of Points), as arcpy.Array
+class Array(list):
+
+    def add(self, value):
+        self.append(value)
+
+    @property
+    def count(self):
+        return len(self)
+
+# the Point of one row of a coords array
+def _point(row):
+    return Point(float(row[0]), float(row[1]),
+                 None if row[2] != row[2] else float(row[2]),
+                 None if row[3] != row[3] else float(row[3]))
+
+#-----------------------------------------------
+
+# the distance (meters) and azimuth (degrees clockwise from north, at the
+# first point) between two points on an ellipsoid, by Vincenty's inverse
+# ...returns (azimuth, distance); azimuth is -180 to 180, as arcpy's is
+def geodesic_inverse(lon1, lat1, lon2, lat2, ellipsoid=coordinate_projection.WGS84):
+    a, f = ellipsoid
+    b = a * (1 - f)
+    L = math.radians(lon2 - lon1)
+    U1 = math.atan((1 - f) * math.tan(math.radians(lat1)))
+    U2 = math.atan((1 - f) * math.tan(math.radians(lat2)))
+    sinU1, cosU1 = math.sin(U1), math.cos(U1)
+    sinU2, cosU2 = math.sin(U2), math.cos(U2)
+
+    # cosU1 sinU2 - sinU1 cosU2 cos(lam), written so that it keeps its
+    # precision for points a few meters apart
+    sinU2mU1 = math.sin(U2 - U1)
+
+    def north(lam):
+        return sinU2mU1 + 2 * sinU1 * cosU2 * math.sin(lam / 2) ** 2
+
+    lam = L
+    for _ in range(VINCENTY_ITERATIONS):
+        sinLam, cosLam = math.sin(lam), math.cos(lam)
+        sinSigma = math.hypot(cosU2 * sinLam, north(lam))
+        if sinSigma == 0:
+            return 0.0, 0.0
+        cosSigma = sinU1 * sinU2 + cosU1 * cosU2 * cosLam
+        sigma = math.atan2(sinSigma, cosSigma)
+        sinAlpha = cosU1 * cosU2 * sinLam / sinSigma
+        cos2Alpha = 1 - sinAlpha * sinAlpha
+        cos2SigmaM = cosSigma - 2 * sinU1 * sinU2 / cos2Alpha if cos2Alpha else 0.0
+        C = f / 16 * cos2Alpha * (4 + f * (4 - 3 * cos2Alpha))
+        lamPrev = lam
+        lam = L + (1 - C) * f * sinAlpha * (sigma + C * sinSigma * (
+            cos2SigmaM + C * cosSigma * (-1 + 2 * cos2SigmaM * cos2SigmaM)))
+        # relative, since lam is tiny between points a few meters apart
+        if abs(lam - lamPrev) <= 1e-15 * abs(lam) + 1e-300:
+            break
+
+    u2 = cos2Alpha * (a * a - b * b) / (b * b)
+    A = 1 + u2 / 16384 * (4096 + u2 * (-768 + u2 * (320 - 175 * u2)))
+    B = u2 / 1024 * (256 + u2 * (-128 + u2 * (74 - 47 * u2)))
+    dSigma = B * sinSigma * (cos2SigmaM + B / 4 * (
+        cosSigma * (-1 + 2 * cos2SigmaM * cos2SigmaM)
+        - B / 6 * cos2SigmaM * (-3 + 4 * sinSigma * sinSigma) * (-3 + 4 * cos2SigmaM * cos2SigmaM)))
+    distance = b * A * (sigma - dSigma)
+    azimuth = math.degrees(math.atan2(cosU2 * sinLam, north(lam)))
+    return azimuth, distance
+
+#-----------------------------------------------
+
+# what every geometry has: its vertex arrays and spatial reference
+# ...coords and offsets are as geometry_arrays uses them
+class Geometry:
+
+    type = None
+    _kind = None
+
+    def __init__(self, coords, offsets, spatial_reference=None, has_z=False, has_m=False):
+        self._coords = np.asarray(coords, dtype='f8')
+        self._offsets = np.asarray(offsets, dtype='i8')
+        self.spatialReference = _spatial_reference(spatial_reference)
+        self.hasZ = bool(has_z)
+        self.hasM = bool(has_m)
+
+    @property
+    def _wkid(self):
+        return self.spatialReference.factoryCode if self.spatialReference else None
+
+    @property
+    def JSON(self):
+        return json.dumps(geometry_arrays.to_esri_json(self._coords, self._offsets, self._wkid,
+                                                       self.hasZ, self.hasM, self._kind))
+
+    @property
+    def WKB(self):
+        return geometry_arrays.to_wkb(self._coords, self._offsets, self.hasZ, self.hasM, self._kind)
+
+    @property
+    def firstPoint(self):
+        return _point(self._coords[0]) if len(self._coords) else None
+
+    @property
+    def lastPoint(self):
+        return _point(self._coords[-1]) if len(self._coords) else None
+
+    # the average of the vertices (for a point, the point itself)
+    # ...arcpy weights lines and polygons by length and area; this doesn't
+    @property
+    def centroid(self):
+        if not len(self._coords):
+            return None
+        return _point(np.nanmean(self._coords, axis=0) if len(self._coords) > 1 else self._coords[0])
+
+    @property
+    def pointCount(self):
+        return len(self._coords)
+
+    @property
+    def partCount(self):
+        return len(self._offsets) - 1
+
+    # the Points of part 'index', or of every part (as an Array of Arrays)
+    def getPart(self, index=None):
+        if index is None:
+            return Array(self.getPart(j) for j in range(self.partCount))
+        return Array(_point(row) for row in self._coords[self._offsets[index]:self._offsets[index + 1]])
+
+    def __iter__(self):
+        return iter(self.getPart())
+
+    # planar length (in the units of the spatial reference, as arcpy's)
+    @property
+    def length(self):
+        return float(self._segments()[3].sum())
+
+    # every segment: start and end coords, distance along the geometry
+    # at its start, and its length (gaps between parts aren't counted)
+    def _segments(self):
+        if getattr(self, '_segment_cache', None) is None:
+            c = self._coords
+            within = np.ones(max(len(c) - 1, 0), dtype=bool)
+            within[self._offsets[1:-1] - 1] = False
+            i = np.nonzero(within)[0]
+            starts = c[i]
+            ends = c[i + 1]
+            lengths = np.hypot(ends[:, 0] - starts[:, 0], ends[:, 1] - starts[:, 1])
+            along = np.concatenate(([0.0], np.cumsum(lengths)[:-1]))
+            self._segment_cache = (starts, ends, along, lengths)
+        return self._segment_cache
+
+    # the geometry in another spatial reference
+    # ...transformation_name is a datum transformation coordinate_projection knows
+    def projectAs(self, spatial_reference, transformation_name=None):
+        sr = _spatial_reference(spatial_reference)
+        if self.spatialReference is None or sr == self.spatialReference:
+            return self._copy(self._coords, sr)
+        tf = coordinate_projection.get_transformer(self._wkid, sr.factoryCode, transformation_name or None)
+        coords = self._coords.copy()
+        if len(coords):
+            x, y = tf(coords[:, 0], coords[:, 1])
+            coords[:, 0] = x
+            coords[:, 1] = y
+        return self._copy(coords, sr)
+
+    def _copy(self, coords, sr):
+        return _build(coords, self._offsets, self._kind, sr, self.hasZ, self.hasM)
+
+    def __repr__(self):
+        return '<' + type(self).__name__ + ' ' + str(self.pointCount) + ' points>'
+
+#-----------------------------------------------
+
+# a single point
+# ...made from a Point, as arcpy.PointGeometry(Point, spatial_reference)
+class PointGeometry(Geometry):
+
+    type = 'point'
+    _kind = 'point'
+
+    def __init__(self, inputs, spatial_reference=None, has_z=False, has_m=False):
+        if isinstance(inputs, Point):
+            inputs = [[inputs.X, inputs.Y,
+                       np.nan if inputs.Z is None else inputs.Z,
+                       np.nan if inputs.M is None else inputs.M]]
+            has_z = has_z or not np.isnan(inputs[0][2])
+            has_m = has_m or not np.isnan(inputs[0][3])
+        Geometry.__init__(self, inputs, [0, 1], spatial_reference, has_z, has_m)
+
+    # the angle (degrees from north, -180 to 180) and distance to another
+    # point geometry
+    # ...geodesic on the ellipsoid for a geographic spatial reference,
+    # ...otherwise (or with method 'PLANAR') in the plane
+    def angleAndDistanceTo(self, other, method='GEODESIC'):
+        x1, y1 = self._coords[0, 0:2]
+        x2, y2 = other._coords[0, 0:2]
+        sr = self.spatialReference
+        if method.upper() != 'PLANAR' and sr is not None and sr.type == 'Geographic':
+            ellipsoid = ELLIPSOIDS.get(sr.factoryCode, coordinate_projection.WGS84)
+            return geodesic_inverse(float(x1), float(y1), float(x2), float(y2), ellipsoid)
+        return math.degrees(math.atan2(x2 - x1, y2 - y1)), float(math.hypot(x2 - x1, y2 - y1))
+
+#-----------------------------------------------
+
+# the coords and offsets of an Array of Points, or an Array of Arrays
+def _from_points(inputs):
+    if isinstance(inputs, Point):
+        inputs = [inputs]
+    parts = [inputs] if not inputs or isinstance(inputs[0], Point) else inputs
+    offsets = np.zeros(len(parts) + 1, dtype='i8')
+    offsets[1:] = np.cumsum([len(part) for part in parts])
+    coords = np.array([[p.X, p.Y, np.nan if p.Z is None else p.Z, np.nan if p.M is None else p.M]
+                       for part in parts for p in part], dtype='f8').reshape(-1, 4)
+    return coords, offsets
+
+# shapes made of parts (from Points as arcpy's are, or see AsShape)
+class _Multipart(Geometry):
+
+    def __init__(self, inputs, spatial_reference=None, has_z=False, has_m=False):
+        coords, offsets = _from_points(inputs)
+        Geometry.__init__(self, coords, offsets, spatial_reference, has_z, has_m)
+
+class Polyline(_Multipart):
+
+    type = 'polyline'
+    _kind = 'paths'
+
+    # the point 'value' along the line (or that fraction of its length)
+    # ...Z and M are interpolated between the vertices either side of it
+    def positionAlongLine(self, value, use_percentage=False):
+        starts, ends, along, lengths = self._segments()
+        if not len(lengths):
+            return PointGeometry(self._coords[0:1], self.spatialReference, self.hasZ, self.hasM)
+        total = along[-1] + lengths[-1]
+        d = min(max(value * total if use_percentage else value, 0.0), total)
+        i = min(int(np.searchsorted(along + lengths, d)), len(lengths) - 1)
+        t = (d - along[i]) / lengths[i] if lengths[i] else 0.0
+        xyzm = starts[i] + t * (ends[i] - starts[i])
+        return PointGeometry(xyzm.reshape(1, 4), self.spatialReference, self.hasZ, self.hasM)
+
+class Polygon(_Multipart):
+
+    type = 'polygon'
+    _kind = 'rings'
+
+class Multipoint(_Multipart):
+
+    type = 'multipoint'
+    _kind = 'points'
+
+_KIND_CLASSES = {'point': PointGeometry, 'paths': Polyline, 'rings': Polygon, 'points': Multipoint}
+
+# a geometry straight from arrays (no Points made)
+def _build(coords, offsets, kind, spatial_reference=None, has_z=False, has_m=False):
+    geom = _KIND_CLASSES[kind].__new__(_KIND_CLASSES[kind])
+    Geometry.__init__(geom, coords, offsets, spatial_reference, has_z, has_m)
+    return geom
+
+#-----------------------------------------------
+
+# a geometry from Esri JSON (a dict or a string), as arcpy.AsShape
+def AsShape(shape, esri_json=False):
+    if not esri_json:
+        raise ValueError('only Esri JSON shapes are supported (esri_json=True)')
+    if isinstance(shape, str):
+        shape = json.loads(shape)
+    coords, offsets, hasZ, hasM, kind = geometry_arrays.from_esri_json(shape)
+    return _build(coords, offsets, kind, shape.get('spatialReference'), hasZ, hasM)
+
+# a geometry from WKB, as GDAL/OGR reads it
+def FromWKB(wkb, spatial_reference=None):
+    coords, offsets, hasZ, hasM, kind = geometry_arrays.from_wkb(wkb)
+    return _build(coords, offsets, kind, spatial_reference, hasZ, hasM)
+
+#------END OF MODULE----------------------------
@@ -0,0 +1,85 @@
+########
+#
+# Script: "load_columnar_outputs.py"
+#
+# BULK LOAD ARROW/PARQUET CURVE POINTS OR CALIBRATION POINTS INTO AN FGDB
+#
+# Description:
+#
+# measure_track_curvature.py (with COLUMNAR_FOLDER set) and
+# create_calibration_points.py (with COLUMNAR_PATH set) can write their
+# points to Arrow/Parquet files instead of to the FGDB, so they never
+# wait on its single writer (see columnar_output.py). This script loads
+# those files into the feature class they were meant for.
+#
+# The files are read a batch at a time, and the batches are regrouped
+# into chunks of CHUNK_ROWS rows (a run writes one small file per route,
+# and loading each on its own would mean thousands of tiny geoprocessing
+# calls). Each chunk is bulk loaded the same way the calibration writer
+# does it: NumPyArrayToFeatureClass into the memory workspace, then one
+# Append into the output feature class. Columns are matched to the output's fields by name; a column
+# the feature class doesn't have (RouteId, say) is left behind.
+#
+# Prep:
+#
+# The output feature class must already exist with the fields you want
+# to fill: curve_points is made from curve_points_template, and the
+# calibration points feature class is the one create_calibration_points
+# would have written to.
+#
+########
+
+#### SETTINGS
+
+# where geometry and cursors come from: 'arcpy', or 'lite' for arcpy_lite.py
+GEOMETRY_BACKEND = 'arcpy'
+
+if GEOMETRY_BACKEND == 'arcpy':
+    import arcpy
+else:
+    import arcpy_lite as arcpy
+
+# (these modules are in the same folder as this script)
+import calibration_writer
+import columnar_output
+import telemetry
+
+# a .parquet/.arrow file, or a folder of them (loaded in name order)
+COLUMNAR_PATH = 'C:/mapdata/Curvature/data/curve_points_parquet'
+
+# the feature class to load them into
+fcOUT = 'C:/mapdata/Curvature/data/RR_Track.gdb/curve_points'
+
+# the columns that make each point's shape, and their spatial reference
+# ...curve points: ('lambda', 'phi') in 4326
+# ...calibration points: ('X', 'Y', 'Z') in the calibration FC's own
+SHAPE_FIELDS = ('lambda', 'phi')
+WKID = 4326
+
+# rows per bulk load
+CHUNK_ROWS = 100000
+
+# where to write the stage timings and counters at the end of the run
+# (JSON, Prometheus text), and a file to profile it to (see telemetry.py)
+TELEMETRY_JSON = None
+TELEMETRY_PROMETHEUS = None
+PROFILE_PATH = None
+
+
+#-----------------------------------------------
+
+profiler = telemetry.Profile(PROFILE_PATH).start()
+
+# every CHUNK_ROWS rows, however many files they came from, plus copies
+# of their shape columns to make the points from (so the shape columns
+# themselves still load as fields)
+batches = columnar_output.read_arrays(COLUMNAR_PATH, CHUNK_ROWS)
+chunks = columnar_output.with_shape_columns(calibration_writer.chunked(batches, CHUNK_ROWS), SHAPE_FIELDS)
+written = calibration_writer.write_chunks(chunks, fcOUT, arcpy.SpatialReference(WKID), arcpy,
+                                          columnar_output.SHAPE_COLUMNS[:len(SHAPE_FIELDS)])
+print(str(written) + ' points loaded into ' + fcOUT)
+
+profiler.stop()
+telemetry.export(TELEMETRY_JSON, TELEMETRY_PROMETHEUS)
+
+#------END OF SCRIPT----
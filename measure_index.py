@@ -0,0 +1,345 @@
+#------START OF MODULE--------------------------
+
+# Memory-mapped measure index over the routes and their curve points
+#
+# Finding the curve point nearest a milepost or a coordinate used to
+# mean another SearchCursor scan of curve_points or of the routes FC.
+# This index is built once (see build_measure_index.py) into a folder of
+# .npy arrays, and opened with memory mapping, so a query process starts
+# straight away and only touches the pages its queries need:
+#
+#   index = MeasureIndex('C:/mapdata/Curvature/data/measure_index')
+#   lon, lat, X, Y = index.measure_to_xy('R1', 123.45)
+#   station = index.nearest_station(lon, lat)
+#   route_id, measure, meters = index.locate(lon, lat)
+#   stations = index.stations_between('R1', 120.0, 125.0)
+#
+# Every query is a binary search or a walk down a k-d tree, O(log n):
+#
+#   measure -> XY     each route's segments are kept sorted by their
+#                     lowest M, with a running maximum of their highest
+#                     M, so the segment holding a measure is found with
+#                     searchsorted (and a short step back if the
+#                     measures ever turn around); X, Y and lon, lat are
+#                     interpolated on M
+#   XY -> station     a k-d tree over the stations' projected X, Y,
+#                     stored implicitly as a permutation of the stations
+#   XY -> measure     the nearest station says where along its route to
+#                     look; the point is dropped onto the few segments
+#                     around there and M interpolated at the foot
+#   milepost range    each route's stations are sorted by milepost
+#
+# The route vertices come from SHAPE@JSON through geometry_arrays, and
+# are projected with coordinate_projection, exactly as the curvature
+# workers read them. The stations are the curvature engine's rows (see
+# curvature_engine.STATION_DTYPE), either computed while the index is
+# built or read from the columnar files of a curvature run.
+
+import json
+import os
+import numpy as np
+
+import coordinate_projection
+import curvature_engine
+import curvature_pool
+import geometry_arrays
+
+# stations per k-d tree leaf (a leaf is searched in one array step)
+LEAF_SIZE = 16
+
+# the stations as the index keeps them: the engine's rows plus their
+# route's slot, and how far along the route (projected meters) they are
+STATION_DTYPE = np.dtype(curvature_engine.STATION_DTYPE.descr + [('route', 'i4'), ('along', 'f8')])
+
+# the columns of the segment array
+# ...lower-case x, y are unprojected (wkid_D), upper-case projected (wkid_P);
+# ...s0 is how far along the route (projected meters) the segment starts
+SEGMENT_COLUMNS = ['m0', 'm1', 'x0', 'y0', 'x1', 'y1', 'X0', 'Y0', 'X1', 'Y1', 's0', 'length']
+
+# the arrays an index folder holds
+ARRAYS = ['segments', 'segment_start', 'by_m', 'by_m_low', 'by_m_high', 'stations', 'station_start',
+          'station_milepost', 'kd_order', 'kd_xy']
+
+
+#-----------------------------------------------
+
+# the segments of one route, in vertex order, as SEGMENT_COLUMNS
+# ...segments between parts, and zero-length ones, are left out
+def route_segments(coords, offsets, project):
+    X, Y = project(coords[:, 0], coords[:, 1]) if len(coords) else (np.zeros(0), np.zeros(0))
+    X = np.asarray(X, dtype='f8')
+    Y = np.asarray(Y, dtype='f8')
+    within = np.ones(max(len(coords) - 1, 0), dtype=bool)
+    within[offsets[1:-1] - 1] = False
+    i = np.nonzero(within)[0]
+    length = np.hypot(X[i + 1] - X[i], Y[i + 1] - Y[i])
+    i = i[length > 0]
+    length = length[length > 0]
+    segments = np.column_stack((coords[i, 3], coords[i + 1, 3], coords[i, 0], coords[i, 1],
+                                coords[i + 1, 0], coords[i + 1, 1], X[i], Y[i], X[i + 1], Y[i + 1],
+                                np.concatenate(([0.0], np.cumsum(length)))[:-1], length))
+    return segments.reshape(-1, len(SEGMENT_COLUMNS))
+
+# the stations of one route as the index keeps them
+# ...rows are the engine's STATION_DTYPE fields, in route order (the
+# ...first point, then stations 'interval' meters apart, though with
+# ...adaptive spacing the stations of long tangents are missing)
+# ...how far along each one is comes from its milepost: the engine
+# ...steps the mileposts by the rounded 'interval_miles', so the
+# ...station's number is the milepost difference over that step
+def route_stations(stations, slot, interval, interval_miles):
+    out = np.zeros(len(stations), dtype=STATION_DTYPE)
+    for name in curvature_engine.STATION_DTYPE.names:
+        out[name] = stations[name]
+    out['route'] = slot
+    if len(stations):
+        step = round(interval_miles, 5)
+        out['along'] = np.rint((out['milepost'] - out['milepost'][0]) / step) * interval
+    return out
+
+#-----------------------------------------------
+
+# the order of an implicit k-d tree over points (x, y)
+# ...the tree over positions [lo, hi) splits at the point at mid =
+# ...(lo + hi) // 2: [lo, mid) is at or below it, and [mid + 1, hi) at or
+# ...above it, on x at even depths and y at odd ones; ranges of LEAF_SIZE
+# ...or fewer are leaves. Each level is one lexsort of every range at once.
+def kd_order(x, y, leaf_size=LEAF_SIZE):
+    order = np.arange(len(x))
+    ranges = [(0, len(x))]
+    depth = 0
+    while ranges:
+        ranges = [(lo, hi) for lo, hi in ranges if hi - lo > leaf_size]
+        if not ranges:
+            break
+        coord = x if depth % 2 == 0 else y
+        sizes = np.array([hi - lo for lo, hi in ranges])
+        positions = np.concatenate([np.arange(lo, hi) for lo, hi in ranges])
+        group = np.repeat(np.arange(len(ranges)), sizes)
+        sort = np.lexsort((coord[order[positions]], group))
+        order[positions] = order[positions[sort]]
+        ranges = [half for lo, hi in ranges for half in ((lo, (lo + hi) // 2), ((lo + hi) // 2 + 1, hi))]
+        depth += 1
+    return order
+
+#-----------------------------------------------
+
+# build an index folder
+# ...routes is an iterable of (route_id, shape_json), the routes FC's
+# ...route id and SHAPE@JSON
+# ...settings is the curvature script's settings dict (wkids,
+# ...transformation, interval and tolerance constants)
+# ...stations is an iterable of structured arrays with the engine's
+# ...fields and RouteId (e.g. columnar_output.read_arrays() of a
+# ...curvature run's files), or None to compute them here
+def build_index(routes, folder, settings, stations=None, leaf_size=LEAF_SIZE):
+    curvature_pool.init_worker(settings)
+    project = coordinate_projection.get_transformer(settings['wkid_D'], settings['wkid_P'],
+                                                    settings['transformation'],
+                                                    settings.get('projection_backend'))
+    interval = settings['interval_meters']
+    interval_miles = settings['interval_miles']
+
+    route_ids = []
+    segment_blocks = []
+    station_blocks = []
+    for slot, (route_id, shape_json) in enumerate(routes):
+        route_ids.append('' if route_id is None else str(route_id))
+        if shape_json is None:
+            coords, offsets = np.zeros((0, 4)), np.zeros(1, dtype='i8')
+        else:
+            coords, offsets = geometry_arrays.from_esri_json(shape_json)[:2]
+        segment_blocks.append(route_segments(coords, offsets, project))
+        if stations is None:
+            _, _, computed = curvature_pool.compute_route((slot, route_id, shape_json))
+            station_blocks.append(route_stations(computed, slot, interval, interval_miles))
+
+    # stations read from a run are matched to their routes by RouteId
+    if stations is not None:
+        slots = dict((route_id, slot) for slot, route_id in enumerate(route_ids))
+        by_route = {}
+        for arr in stations:
+            ids = arr['RouteId'] if 'RouteId' in arr.dtype.names else np.full(len(arr), '')
+            for route_id in np.unique(ids):
+                if route_id in slots:
+                    by_route.setdefault(slots[route_id], []).append(arr[ids == route_id])
+        for slot in range(len(route_ids)):
+            rows = np.concatenate(by_route[slot]) if slot in by_route else \
+                np.zeros(0, dtype=curvature_engine.STATION_DTYPE)
+            rows = rows[np.argsort(rows['milepost'], kind='stable')]
+            station_blocks.append(route_stations(rows, slot, interval, interval_miles))
+
+    # segments, by route then in vertex order, and by route then lowest M
+    segment_start = np.zeros(len(route_ids) + 1, dtype='i8')
+    segment_start[1:] = np.cumsum([len(block) for block in segment_blocks])
+    segments = (np.concatenate(segment_blocks) if segment_blocks
+                else np.zeros((0, len(SEGMENT_COLUMNS))))
+    m_low = np.fmin(segments[:, 0], segments[:, 1])
+    m_high = np.fmax(segments[:, 0], segments[:, 1])
+    segment_route = np.repeat(np.arange(len(route_ids)), np.diff(segment_start))
+    by_m = np.lexsort((m_low, segment_route))
+    by_m_low = m_low[by_m]
+    by_m_high = m_high[by_m]
+    for slot in range(len(route_ids)):
+        lo, hi = segment_start[slot], segment_start[slot + 1]
+        by_m_high[lo:hi] = np.fmax.accumulate(by_m_high[lo:hi]) if hi > lo else by_m_high[lo:hi]
+
+    # stations, by route then milepost, and the k-d tree over them
+    station_start = np.zeros(len(route_ids) + 1, dtype='i8')
+    station_start[1:] = np.cumsum([len(block) for block in station_blocks])
+    all_stations = (np.concatenate(station_blocks) if station_blocks
+                    else np.zeros(0, dtype=STATION_DTYPE))
+    order = kd_order(all_stations['X'], all_stations['Y'], leaf_size)
+
+    arrays = {'segments': segments, 'segment_start': segment_start, 'by_m': by_m,
+              'by_m_low': by_m_low, 'by_m_high': by_m_high,
+              'stations': all_stations, 'station_start': station_start,
+              'station_milepost': np.ascontiguousarray(all_stations['milepost']),
+              'kd_order': order,
+              'kd_xy': np.column_stack((all_stations['X'][order], all_stations['Y'][order]))}
+
+    # the meta file is written last, so a folder without one is incomplete
+    os.makedirs(folder, exist_ok=True)
+    meta_path = os.path.join(folder, 'meta.json')
+    if os.path.exists(meta_path):
+        os.remove(meta_path)
+    for name in ARRAYS:
+        np.save(os.path.join(folder, name + '.npy'), arrays[name])
+    meta = {'routes': route_ids, 'wkid_D': settings['wkid_D'], 'wkid_P': settings['wkid_P'],
+            'transformation': settings['transformation'],
+            'projection_backend': settings.get('projection_backend'),
+            'interval_meters': interval, 'leaf_size': leaf_size}
+    with open(meta_path + '.tmp', 'w') as fileOUT:
+        json.dump(meta, fileOUT)
+    os.replace(meta_path + '.tmp', meta_path)
+    print('measure index: ' + str(len(route_ids)) + ' routes, ' + str(len(segments)) + ' segments, '
+          + str(len(all_stations)) + ' stations')
+
+#-----------------------------------------------
+
+# an index folder, memory-mapped
+# ...route ids are the strings they were built with ('' for none)
+class MeasureIndex:
+
+    def __init__(self, folder):
+        with open(os.path.join(folder, 'meta.json'), 'r') as fileIN:
+            self.meta = json.load(fileIN)
+        for name in ARRAYS:
+            setattr(self, name, np.load(os.path.join(folder, name + '.npy'), mmap_mode='r'))
+        self.route_ids = self.meta['routes']
+        self.slots = dict((route_id, slot) for slot, route_id in enumerate(self.route_ids))
+        self.leaf_size = self.meta['leaf_size']
+        self._project = None
+
+    # unprojected x, y (wkid_D) to projected X, Y (wkid_P)
+    def project(self, x, y):
+        if self._project is None:
+            self._project = coordinate_projection.get_transformer(
+                self.meta['wkid_D'], self.meta['wkid_P'], self.meta['transformation'],
+                self.meta.get('projection_backend'))
+        X, Y = self._project(np.atleast_1d(np.asarray(x, dtype='f8')), np.atleast_1d(np.asarray(y, dtype='f8')))
+        return float(X[0]), float(Y[0])
+
+    def _slot(self, route_id):
+        return self.slots['' if route_id is None else str(route_id)]
+
+    # the point at measure 'm' on a route, as (x, y, X, Y), or None if the
+    # route never reaches that measure
+    def measure_to_xy(self, route_id, m):
+        slot = self._slot(route_id)
+        lo, hi = self.segment_start[slot], self.segment_start[slot + 1]
+        k = lo + np.searchsorted(self.by_m_low[lo:hi], m, 'right') - 1
+        # step back while an earlier segment could still reach m
+        while k >= lo and self.by_m_high[k] >= m:
+            seg = self.segments[self.by_m[k]]
+            m0, m1 = seg[0], seg[1]
+            if min(m0, m1) <= m <= max(m0, m1):
+                t = (m - m0) / (m1 - m0) if m1 != m0 else 0.0
+                return (float(seg[2] + t * (seg[4] - seg[2])), float(seg[3] + t * (seg[5] - seg[3])),
+                        float(seg[6] + t * (seg[8] - seg[6])), float(seg[7] + t * (seg[9] - seg[7])))
+            k -= 1
+        return None
+
+    # the station nearest a projected X, Y: (station slot, distance)
+    def _nearest(self, X, Y):
+        kd = self.kd_xy
+        best = [np.inf, -1]
+        stack = [(0, len(kd), 0, 0.0)]
+        while stack:
+            lo, hi, depth, bound = stack.pop()
+            if bound >= best[0] or hi <= lo:
+                continue
+            if hi - lo <= self.leaf_size:
+                block = kd[lo:hi]
+                d2 = (block[:, 0] - X) ** 2 + (block[:, 1] - Y) ** 2
+                i = int(np.argmin(d2))
+                if d2[i] < best[0]:
+                    best = [float(d2[i]), lo + i]
+                continue
+            mid = (lo + hi) // 2
+            d2 = (kd[mid, 0] - X) ** 2 + (kd[mid, 1] - Y) ** 2
+            if d2 < best[0]:
+                best = [float(d2), mid]
+            diff = (X, Y)[depth % 2] - kd[mid, depth % 2]
+            near, far = ((lo, mid), (mid + 1, hi)) if diff < 0 else ((mid + 1, hi), (lo, mid))
+            stack.append((far[0], far[1], depth + 1, diff * diff))
+            stack.append((near[0], near[1], depth + 1, 0.0))
+        if best[1] < 0:
+            return None, None
+        return int(self.kd_order[best[1]]), best[0] ** 0.5
+
+    # the station nearest an unprojected x, y (or projected, with projected=True)
+    # ...returns a dict of its fields, plus RouteId and its distance in
+    # ...projected units, or None if the index has no stations
+    def nearest_station(self, x, y, projected=False):
+        X, Y = (x, y) if projected else self.project(x, y)
+        slot, distance = self._nearest(X, Y)
+        if slot is None:
+            return None
+        station = self.stations[slot]
+        result = dict(zip(STATION_DTYPE.names, station.tolist()))
+        result['RouteId'] = self.route_ids[result.pop('route')]
+        result['distance'] = distance
+        return result
+
+    # the route, measure and distance of the point on the routes nearest
+    # an unprojected x, y (or projected, with projected=True)
+    # ...the point is dropped onto the segments within two station
+    # ...intervals of the nearest station, and M interpolated at its foot
+    # ...(the window grows by twice the distance to that station, which on
+    # ...an adaptive tangent with its stations skipped can be a long way)
+    def locate(self, x, y, projected=False):
+        X, Y = (x, y) if projected else self.project(x, y)
+        slot, station_distance = self._nearest(X, Y)
+        if slot is None:
+            return None
+        station = self.stations[slot]
+        route = int(station['route'])
+        along = float(station['along'])
+        window = 2 * (self.meta['interval_meters'] + station_distance)
+        lo, hi = self.segment_start[route], self.segment_start[route + 1]
+        starts = self.segments[lo:hi, 10]
+        a = lo + max(np.searchsorted(starts, along - window, 'right') - 1, 0)
+        b = lo + np.searchsorted(starts, along + window, 'right')
+        seg = np.asarray(self.segments[a:b])
+        if not len(seg):
+            return self.route_ids[route], float(station['milepost']), float('nan')
+        dx = seg[:, 8] - seg[:, 6]
+        dy = seg[:, 9] - seg[:, 7]
+        t = np.clip(((X - seg[:, 6]) * dx + (Y - seg[:, 7]) * dy) / (dx * dx + dy * dy), 0.0, 1.0)
+        d = np.hypot(seg[:, 6] + t * dx - X, seg[:, 7] + t * dy - Y)
+        i = int(np.argmin(d))
+        measure = seg[i, 0] + t[i] * (seg[i, 1] - seg[i, 0])
+        return self.route_ids[route], float(measure), float(d[i])
+
+    # a route's stations with mileposts from m_from to m_to (inclusive)
+    # ...a slice of the memory-mapped STATION_DTYPE array, in milepost order
+    def stations_between(self, route_id, m_from, m_to):
+        slot = self._slot(route_id)
+        lo, hi = self.station_start[slot], self.station_start[slot + 1]
+        mileposts = self.station_milepost[lo:hi]
+        a = np.searchsorted(mileposts, m_from, 'left')
+        b = np.searchsorted(mileposts, m_to, 'right')
+        return self.stations[lo + a:lo + b]
+
+#------END OF MODULE----------------------------
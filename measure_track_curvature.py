@@ -10,16 +10,128 @@
 # Each route should be calibrated so that the M values are mileposts.
 # For each route feature, this script walks from start to end, placing a 
 # measure point every 50' so that each three sets of points is 100' long,
-# creating a measureable angle. You can adjust this value on LINE 26. 
+# creating a measureable angle. You can adjust this value with
+# CURVE_LENGTH_INTERVAL_FEET, below.
 # 
 # Then during this walk, the angle created by each set of three points 
 # can be measured, and then stored in the center point's attribute record.
 #
 # When the angle created by each set of three measured points is 
 # less than 0.5 degrees, that angle is considered "STRAIGHT". This 
-# curve tolerance value is also adjustable on LINE 26.
-
-import arcpy
+# curve tolerance value is adjustable with CURVE_TOLERANCE_PERCENT, below.
+#
+# Set USE_NUMPY_ENGINE to True to compute every station of the route in
+# one array pass (see curvature_engine.py) instead of walking the route
+# one station at a time. Both write the same curve_points rows.
+#
+# Set MULTI_ROUTE to True to measure every route in the FC instead of
+# just the first one. The routes are split across a pool of worker
+# processes (see curvature_pool.py), and this script is the only writer
+# to curve_points. Rows are written in route order. For multi-route
+# runs, add a RouteId text field to curve_points_template.
+#
+# Set GEOMETRY_BACKEND to 'lite' to run without ArcGIS Pro: the geometry
+# and cursors then come from arcpy_lite.py (NumPy and GDAL/OGR), which
+# reads and writes the same FGDB (GDAL 3.6+) or a GeoPackage, so the
+# script can run on Linux machines too.
+#
+# Set COLUMNAR_FOLDER to write the curve points to Arrow/Parquet files
+# in that folder instead of to curve_points (see columnar_output.py),
+# one file per route. In a MULTI_ROUTE run each worker writes its own
+# routes' files, so nothing waits on the FGDB's single writer. Load the
+# files into curve_points afterwards with load_columnar_outputs.py.
+#
+# Set INCREMENTAL to True to refresh curve_points in place instead of
+# recreating it: every route in the FC is fingerprinted, and only the
+# curve points of routes (or stretches of routes) that changed since the
+# last run are computed again and replaced (see curvature_increment.py).
+# The fingerprints are kept in INCREMENTAL_MANIFEST. The first run, and
+# any run after the settings change, is a full one. Like MULTI_ROUTE,
+# this needs the RouteId field in curve_points, and it writes to
+# curve_points even if COLUMNAR_FOLDER is set.
+#
+# Set CURVE_EVENTS to True, in a MULTI_ROUTE run, to also merge each
+# run of LEFT or RIGHT curve points into one curve event as the routes
+# come back, written to a curve_events table made from
+# curve_events_template (see curve_events.py). For any other run, make
+# the events afterwards with segment_curve_events.py.
+#
+# Set ADAPTIVE_SPACING to True to skip the curve points of long
+# tangents (uses the NumPy engine). Where the route's vertices run
+# (nearly) collinear, within TANGENT_TOLERANCE_DEGREES, a curve point
+# can only be STRAIGHT, so each such run keeps just its first and last
+# curve point, a STRAIGHT span with a curve of 0. Through the curves
+# every curve point is kept, 100' chords and all, and matches the full
+# run exactly (see curvature_engine.adaptive_stations).
+#
+# Set EXTRA_CHORD_LENGTHS_FEET to measure curvature over other chord
+# lengths too, 62' and 200' say, in the same pass (uses the NumPy
+# engine). Each one adds three fields to curve_points, e.g.
+# curve_percent_actual_62, curve_percent_absolute_62 and
+# curve_direction_62, so add those to curve_points_template. The curve
+# points stay 50' apart; each one's chord runs half a chord either side.
+#
+# Progress is printed every few seconds rather than for every curve
+# point, and at the end the script prints how long each stage took
+# (cursor reads, geometry, projections, inserts, waiting on the pool,
+# see telemetry.py). Set TELEMETRY_JSON and/or TELEMETRY_PROMETHEUS to
+# also write those to files, and PROFILE_PATH to profile the run (a
+# .prof cProfile dump, or an .html pyinstrument report).
+
+# where geometry and cursors come from: 'arcpy', or 'lite' for arcpy_lite.py
+GEOMETRY_BACKEND = 'arcpy'
+
+if GEOMETRY_BACKEND == 'arcpy':
+    import arcpy
+else:
+    import arcpy_lite as arcpy
+import columnar_output
+import curve_events
+import curvature_engine
+import curvature_increment
+import curvature_pool
+import telemetry
+
+# compute stations with the NumPy engine rather than the per-station loop
+USE_NUMPY_ENGINE = False
+
+# measure every route with a pool of worker processes (uses the NumPy engine)
+MULTI_ROUTE = False
+MULTI_ROUTE_WORKERS = None       # None = one worker per core
+MULTI_ROUTE_BATCH_ROWS = 10000   # curve points written per batch
+ROUTE_ID_FIELD = 'RouteId'       # in both the routes FC and curve_points
+
+# folder for Arrow/Parquet curve point files, or None to write to curve_points
+# ...(uses the NumPy engine); COLUMNAR_FORMAT is 'parquet' or 'arrow'
+COLUMNAR_FOLDER = None
+COLUMNAR_FORMAT = 'parquet'
+
+# refresh only the routes that changed since the last run (uses the pool)
+INCREMENTAL = False
+INCREMENTAL_MANIFEST = 'C:/mapdata/Curvature/data/curve_points_manifest.npz'
+
+# merge the curve points into curve events too (MULTI_ROUTE, to curve_points)
+CURVE_EVENTS = False
+
+# skip the curve points of long tangents (uses the NumPy engine)
+ADAPTIVE_SPACING = False
+TANGENT_TOLERANCE_DEGREES = 0.05   # keep well under CURVE_TOLERANCE_PERCENT
+
+# other chord lengths to measure curvature over, in feet, e.g. [62, 200]
+EXTRA_CHORD_LENGTHS_FEET = []
+
+# where to write the stage timings and counters at the end of the run,
+# as JSON and in the Prometheus text format (None for neither)
+TELEMETRY_JSON = None
+TELEMETRY_PROMETHEUS = None
+
+# profile the run to this file: .prof for cProfile, .html or .txt for
+# pyinstrument (None to not profile)
+PROFILE_PATH = None
+
+# how the NumPy engine projects coordinate arrays (see coordinate_projection.py)
+# ...'numpy', 'pyproj', 'arcpy', or None for the first one available
+PROJECTION_BACKEND = None
 
 # spatial reference conversion objects
 sr4326 = arcpy.SpatialReference(4326)
@@ -49,146 +161,301 @@ def normalize_bearing(angle):
 
 #-----------------------------------------------
 
-# FGDB for reading in the track lines, and where the curve points will go
-fgdb = "C:/mapdata/Curvature/data/RR_Track.gdb"
-arcpy.env.workspace = fgdb
-
-# FC of the track centerlines
-# ...this FC must contain PolylineM route features
-# ...this routes FC must be calibrated so that every vertex's M is a milepost value
-fcIN = fgdb + "/TRK_CTL_routes_calib_milepost"
-fieldsIN = ['SHAPE@']
-cursorREAD = arcpy.da.SearchCursor(fcIN, fieldsIN)
-
-# at the moment, we're just working with one route centerline
-# (when you have many, this will need to be a loop)
-row = cursorREAD.next()
-pline_D = row[0]
-pline_D_len = pline_D.length
-pline_P = pline_D.projectAs(sr102005, gt)
-pline_P_len = round(pline_P.length, 5)
-print('lenD: ' + str(pline_D_len) + ', lenM: ' + str(pline_P_len))
+# walk one route a station at a time with arcpy (or arcpy_lite) geometry calls
+# ...this is the original measuring loop, writing straight to cursorWRITE
+def walk_route(pline_D, pline_P, cursorWRITE):
+
+    pline_P_len = round(pline_P.length, 5)
+
+    # initialize the output curve point FC with its first record
+    # ( measuring curvature begins with the 2nd curve point)
+    ptFirst_P = pline_P.firstPoint
+    ptFirst_D = pline_D.firstPoint
+    ptgFirst_D = arcpy.PointGeometry(ptFirst_D, sr4326)
+    thisMeasure = ptFirst_D.M
+    print(thisMeasure) # the milepost of the first
+    to_insert = [ptgFirst_D, ptFirst_P.X, ptFirst_P.Y, ptFirst_D.X, ptFirst_D.Y, thisMeasure, \
+                 0, 0, 'STRAIGHT']
+    with telemetry.timer('insert'):
+        cursorWRITE.insertRow(to_insert)
+    progress = telemetry.Progress('curve points', \
+                                  curvature_engine.station_count(pline_P_len, CURVE_POINT_INTERVAL_METERS), \
+                                  'milepost')
+
+    startpt_len = 0
+    basept_len = startpt_len + CURVE_POINT_INTERVAL_METERS
+    endpt_len = startpt_len + (CURVE_POINT_INTERVAL_METERS * 2)
+    idx = 0
+
+    while endpt_len < pline_P_len:
     
-#-----------------------------------------------
-
-# FC for writing out the curve points, stored in the same FGDB
-# ensure the FGDB also contains the feature class template!
-arcpy.management.CreateFeatureclass(fgdb, "curve_points", "POINT", \
-                                    "curve_points_template", "ENABLED", "ENABLED", sr4326)
-fcOUT = fgdb + "/curve_points"
-fieldsOUT = ['SHAPE@', 'X', 'Y', 'lambda', 'phi', 'milepost', \
-             'curve_percent_actual', 'curve_percent_absolute', 'curve_direction']
-cursorWRITE = arcpy.da.InsertCursor(fcOUT, fieldsOUT)
-
-#-----------------------------------------------
-
-# initialize the output curve point FC with its first record
-# ( measuring curvature begins with the 2nd curve point)
-ptFirst_P = pline_P.firstPoint
-ptFirst_D = pline_D.firstPoint
-ptgFirst_D = arcpy.PointGeometry(ptFirst_D, sr4326)
-thisMeasure = ptFirst_D.M
-print(thisMeasure) # the milepost of the first
-to_insert = [ptgFirst_D, ptFirst_P.X, ptFirst_P.Y, ptFirst_D.X, ptFirst_D.Y, thisMeasure, \
-             0, 0, 'STRAIGHT']
-cursorWRITE.insertRow(to_insert)
-
-#-----------------------------------------------
-
-startpt_len = 0
-basept_len = startpt_len + CURVE_POINT_INTERVAL_METERS
-endpt_len = startpt_len + (CURVE_POINT_INTERVAL_METERS * 2)
-idx = 0
-
-while endpt_len < pline_P_len:
-    
-    idx += 1
-    #if idx == 5:
-    #    break
+        idx += 1
+        #if idx == 5:
+        #    break
     
-    # find the start, base, and end point in projected space
-    ptgStart_P = pline_P.positionAlongLine(startpt_len)
-    ptStart_P = ptgStart_P.firstPoint
-    ptgBase_P = pline_P.positionAlongLine(basept_len)
-    ptBase_P = ptgBase_P.firstPoint
-    ptgEnd_P = pline_P.positionAlongLine(endpt_len)
-    ptEnd_P = ptgEnd_P.firstPoint
+        # find the start, base, and end point in projected space
+        with telemetry.timer('geometry'):
+            ptgStart_P = pline_P.positionAlongLine(startpt_len)
+            ptStart_P = ptgStart_P.firstPoint
+            ptgBase_P = pline_P.positionAlongLine(basept_len)
+            ptBase_P = ptgBase_P.firstPoint
+            ptgEnd_P = pline_P.positionAlongLine(endpt_len)
+            ptEnd_P = ptgEnd_P.firstPoint
     
-    # find the start, base, and end point in unprojected space
-    ptgStart_D = ptgStart_P.projectAs(sr4326, gt)
-    ptStart_D = ptgStart_D.firstPoint
-    ptgBase_D = ptgBase_P.projectAs(sr4326, gt)
-    ptBase_D = ptgBase_D.firstPoint
-    ptgEnd_D = ptgEnd_P.projectAs(sr4326, gt)
-    ptEnd_D = ptgEnd_D.firstPoint
+        # find the start, base, and end point in unprojected space
+        with telemetry.timer('projection'):
+            ptgStart_D = ptgStart_P.projectAs(sr4326, gt)
+            ptStart_D = ptgStart_D.firstPoint
+            ptgBase_D = ptgBase_P.projectAs(sr4326, gt)
+            ptBase_D = ptgBase_D.firstPoint
+            ptgEnd_D = ptgEnd_P.projectAs(sr4326, gt)
+            ptEnd_D = ptgEnd_D.firstPoint
     
-    #### calculate the first and second bearings, and the delta
-    aad1 = ptgStart_D.angleAndDistanceTo(ptgBase_D)
-    angle1 = round(aad1[0], 5)
-    bearing1 = normalize_bearing(angle1)
-    aad2 = ptgBase_D.angleAndDistanceTo(ptgEnd_D)
-    angle2 = round(aad2[0], 5)
-    bearing2 = normalize_bearing(angle2)
-    bearing_delta = bearing2 - bearing1
-    curve_percent_actual = round(bearing_delta, 5)
-    curve_percent_absolute = abs(bearing_delta)
+        #### calculate the first and second bearings, and the delta
+        with telemetry.timer('geometry'):
+            aad1 = ptgStart_D.angleAndDistanceTo(ptgBase_D)
+            aad2 = ptgBase_D.angleAndDistanceTo(ptgEnd_D)
+        angle1 = round(aad1[0], 5)
+        bearing1 = normalize_bearing(angle1)
+        angle2 = round(aad2[0], 5)
+        bearing2 = normalize_bearing(angle2)
+        bearing_delta = bearing2 - bearing1
+        curve_percent_actual = round(bearing_delta, 5)
+        curve_percent_absolute = abs(bearing_delta)
     
-    # determine if this measured angle is right, left, or straight
-    curve_direction = "UNKNOWN"      # default
-    if curve_percent_actual > 0:
-        curve_direction = "RIGHT"
-    if curve_percent_actual < 0:
-        curve_direction = "LEFT"
-    if curve_percent_absolute < CURVE_TOLERANCE_PERCENT:
-        curve_direction = "STRAIGHT"
+        # determine if this measured angle is right, left, or straight
+        curve_direction = "UNKNOWN"      # default
+        if curve_percent_actual > 0:
+            curve_direction = "RIGHT"
+        if curve_percent_actual < 0:
+            curve_direction = "LEFT"
+        if curve_percent_absolute < CURVE_TOLERANCE_PERCENT:
+            curve_direction = "STRAIGHT"
     
-    # calculate the milepost value of the base point
-    thisMeasure = round(thisMeasure + CURVE_POINT_INTERVAL_MILES, 5)
+        # calculate the milepost value of the base point
+        thisMeasure = round(thisMeasure + CURVE_POINT_INTERVAL_MILES, 5)
     
-    # populate the base point shape and its attributes
-    to_insert = [ptgBase_D, ptBase_P.X, ptBase_P.Y, ptBase_D.X, ptBase_D.Y, thisMeasure, \
-                 curve_percent_actual, curve_percent_absolute, curve_direction]
-    cursorWRITE.insertRow(to_insert)
+        # populate the base point shape and its attributes
+        to_insert = [ptgBase_D, ptBase_P.X, ptBase_P.Y, ptBase_D.X, ptBase_D.Y, thisMeasure, \
+                     curve_percent_actual, curve_percent_absolute, curve_direction]
+        with telemetry.timer('insert'):
+            cursorWRITE.insertRow(to_insert)
     
-    # increment each of the three lengths by 50'
-    startpt_len = round(basept_len, 5)
-    basept_len = round(endpt_len, 5)
-    endpt_len = round(endpt_len + CURVE_POINT_INTERVAL_METERS, 5)
+        # increment each of the three lengths by 50'
+        startpt_len = round(basept_len, 5)
+        basept_len = round(endpt_len, 5)
+        endpt_len = round(endpt_len + CURVE_POINT_INTERVAL_METERS, 5)
     
-    print(str(idx)+ ': mile, ' + str(thisMeasure) + ', len, ' + str(endpt_len) + "/" + str(pline_P_len))
-       
-del cursorWRITE    
-    
-print('done')    
-
-#------END OF SCRIPT----------------------------
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
+        # (a line every few seconds, not one per curve point)
+        progress.update(1, thisMeasure)
 
+    progress.finish()
 
+#-----------------------------------------------
 
+# FGDB for reading in the track lines, and where the curve points will go
+fgdb = "C:/mapdata/Curvature/data/RR_Track.gdb"
+arcpy.env.workspace = fgdb
 
+# FC of the track centerlines
+# ...this FC must contain PolylineM route features
+# ...this routes FC must be calibrated so that every vertex's M is a milepost value
+fcIN = fgdb + "/TRK_CTL_routes_calib_milepost"
 
+# what the NumPy engine needs to know, for this process and for the workers
+settings = {'wkid_D': 4326, 'wkid_P': 102005, 'transformation': gt,
+            'projection_backend': PROJECTION_BACKEND,
+            'interval_meters': CURVE_POINT_INTERVAL_METERS,
+            'interval_miles': CURVE_POINT_INTERVAL_MILES,
+            'tolerance': CURVE_TOLERANCE_PERCENT,
+            'adaptive': ADAPTIVE_SPACING, 'tangent_tolerance': TANGENT_TOLERANCE_DEGREES,
+            'chords': EXTRA_CHORD_LENGTHS_FEET,
+            'output_folder': COLUMNAR_FOLDER, 'output_format': COLUMNAR_FORMAT}
 
+#-----------------------------------------------
 
+# refresh curve_points in place, for an INCREMENTAL run
+# ...the workers fingerprint every route and compute only the curve points
+# ...that changed; this process replaces those rows, then deletes the rows
+# ...of routes no longer in the FC
+def refresh_curve_points():
+    fcOUT = fgdb + "/curve_points"
+    fieldsOUT = ['SHAPE@XY', 'X', 'Y', 'lambda', 'phi', 'milepost', \
+                 'curve_percent_actual', 'curve_percent_absolute', 'curve_direction'] + \
+                curvature_engine.chord_fields(EXTRA_CHORD_LENGTHS_FEET) + [ROUTE_ID_FIELD]
+
+    # a missing manifest (or curve_points) means a full run
+    previous = curvature_increment.load_manifest(INCREMENTAL_MANIFEST, settings)
+    if not previous or not arcpy.Exists(fcOUT):
+        arcpy.management.CreateFeatureclass(fgdb, "curve_points", "POINT", \
+                                            "curve_points_template", "ENABLED", "ENABLED", sr4326)
+        previous = {}
+
+    fieldsIN = ['OID@', ROUTE_ID_FIELD, 'SHAPE@JSON']
+    cursorREAD = arcpy.da.SearchCursor(fcIN, fieldsIN, sql_clause=(None, 'ORDER BY OBJECTID'))
+    jobs = ((idx, row[1], row[2], previous.get(str(row[1])))
+            for idx, row in enumerate(telemetry.timed_iter('cursor_read', cursorREAD)))
+    results = curvature_pool.run_routes(jobs, settings, MULTI_ROUTE_WORKERS,
+                                        function=curvature_pool.refresh_route)
+
+    # a full run just inserts, through the one cursor
+    cursorWRITE = arcpy.da.InsertCursor(fcOUT, fieldsOUT) if not previous else None
+
+    entries = {}
+    changed = deleted = inserted = 0
+    for _, route_id, entry, window, mileposts, stations in results:
+        entries[str(route_id)] = entry
+        if window is None:
+            continue
+        changed += 1
+        if cursorWRITE is not None:
+            with telemetry.timer('insert'):
+                for to_insert in curvature_engine.station_rows(stations):
+                    cursorWRITE.insertRow(to_insert + (route_id,))
+            inserted += len(stations)
+        else:
+            d, i = curvature_increment.replace_rows(arcpy, fcOUT, fieldsOUT, ROUTE_ID_FIELD, route_id,
+                                                    mileposts, stations)
+            deleted += d
+            inserted += i
+    del cursorREAD
+    del cursorWRITE
+
+    for route_id in set(previous) - set(entries):
+        changed += 1
+        deleted += curvature_increment.delete_rows(arcpy, fcOUT, ROUTE_ID_FIELD, route_id)
+
+    curvature_increment.save_manifest(INCREMENTAL_MANIFEST, entries, settings)
+    print(str(len(entries)) + ' routes, ' + str(changed) + ' changed: ' + str(deleted) + \
+          ' curve points deleted, ' + str(inserted) + ' written')
 
+#-----------------------------------------------
 
+# the worker processes of a MULTI_ROUTE run re-import this script,
+# so everything that reads or writes data stays under this guard
+if __name__ == '__main__':
+
+    profiler = telemetry.Profile(PROFILE_PATH).start()
+
+    if INCREMENTAL:
+        refresh_curve_points()
+
+    else:
+
+        if COLUMNAR_FOLDER:
+
+            # the curve point files, in place of the curve_points FC
+            columnar_output.prepare_folder(COLUMNAR_FOLDER)
+            cursorWRITE = None
+
+        else:
+
+            # FC for writing out the curve points, stored in the same FGDB
+            # ensure the FGDB also contains the feature class template!
+            arcpy.management.CreateFeatureclass(fgdb, "curve_points", "POINT", \
+                                                "curve_points_template", "ENABLED", "ENABLED", sr4326)
+            fcOUT = fgdb + "/curve_points"
+            numpy_engine = USE_NUMPY_ENGINE or ADAPTIVE_SPACING or EXTRA_CHORD_LENGTHS_FEET or MULTI_ROUTE
+            fieldsOUT = ['SHAPE@XY' if numpy_engine else 'SHAPE@', 'X', 'Y', 'lambda', 'phi', 'milepost', \
+                         'curve_percent_actual', 'curve_percent_absolute', 'curve_direction']
+            if numpy_engine:
+                fieldsOUT += curvature_engine.chord_fields(EXTRA_CHORD_LENGTHS_FEET)
+            if MULTI_ROUTE:
+                fieldsOUT.append(ROUTE_ID_FIELD)
+            cursorWRITE = arcpy.da.InsertCursor(fcOUT, fieldsOUT)
+
+        if MULTI_ROUTE:
+
+            # every route in the FC, in OBJECTID order, read lazily as the pool needs them
+            fieldsIN = ['OID@', ROUTE_ID_FIELD, 'SHAPE@JSON']
+            cursorREAD = arcpy.da.SearchCursor(fcIN, fieldsIN, sql_clause=(None, 'ORDER BY OBJECTID'))
+            jobs = ((idx, row[1], row[2]) for idx, row in enumerate(telemetry.timed_iter('cursor_read', cursorREAD)))
+
+            if COLUMNAR_FOLDER:
+
+                # the workers compute the routes and write their files themselves
+                results = curvature_pool.run_routes(jobs, settings, MULTI_ROUTE_WORKERS,
+                                                    function=curvature_pool.write_route)
+                progress = telemetry.Progress('routes written')
+                written = 0
+                for _, _, count in results:
+                    written += count
+                    progress.update()
+                print(str(progress.finish()) + ' routes, ' + str(written) + ' curve points written to ' + COLUMNAR_FOLDER)
+
+            else:
+
+                # the workers compute the routes; this process drains them, in route order
+                results = curvature_pool.run_routes(jobs, settings, MULTI_ROUTE_WORKERS)
+
+                # each route's curve events, made on the way through
+                if CURVE_EVENTS:
+                    arcpy.management.CreateTable(fgdb, "curve_events", "curve_events_template")
+                    cursorEVENTS = arcpy.da.InsertCursor(fgdb + "/curve_events",
+                                                         [ROUTE_ID_FIELD] + curve_events.EVENT_FIELDS)
+                    results = curve_events.tap(results,
+                                               lambda events: curve_events.insert_events(cursorEVENTS, events),
+                                               CURVE_POINT_INTERVAL_FEET)
+                rows = (to_insert + (route_id,)
+                        for _, route_id, stations in results
+                        for to_insert in curvature_engine.station_rows(stations))
+
+                progress = telemetry.Progress('curve points written')
+                for batch in curvature_pool.batched(rows, MULTI_ROUTE_BATCH_ROWS):
+                    with telemetry.timer('insert'):
+                        for to_insert in batch:
+                            cursorWRITE.insertRow(to_insert)
+                    progress.update(len(batch))
+                progress.finish()
+
+                if CURVE_EVENTS:
+                    del cursorEVENTS
+
+            del cursorREAD
+
+        else:
+
+            fieldsIN = ['SHAPE@']
+            cursorREAD = arcpy.da.SearchCursor(fcIN, fieldsIN)
+
+            # just the first route centerline (set MULTI_ROUTE to measure them all)
+            with telemetry.timer('cursor_read'):
+                row = cursorREAD.next()
+            pline_D = row[0]
+            pline_D_len = pline_D.length
+            with telemetry.timer('projection'):
+                pline_P = pline_D.projectAs(sr102005, gt)
+            pline_P_len = round(pline_P.length, 5)
+            print('lenD: ' + str(pline_D_len) + ', lenM: ' + str(pline_P_len))
+
+            if COLUMNAR_FOLDER:
+
+                # the NumPy engine's stations, straight to the route's file
+                curvature_pool.init_worker(settings)
+                _, _, written = curvature_pool.write_route((0, None, pline_D.JSON))
+                print(str(written) + ' curve points written to ' + COLUMNAR_FOLDER)
+
+            elif USE_NUMPY_ENGINE or ADAPTIVE_SPACING or EXTRA_CHORD_LENGTHS_FEET:
+
+                # compute every station of the route in one array pass
+                # ...the route's vertices are projected once, densified every 50',
+                # ...and all of the stations are unprojected in a single call
+                curvature_pool.init_worker(settings)
+                _, _, stations = curvature_pool.compute_route((0, None, pline_D.JSON))
+                with telemetry.timer('insert'):
+                    for to_insert in curvature_engine.station_rows(stations):
+                        cursorWRITE.insertRow(to_insert)
+                print(str(len(stations)) + ' curve points, last mile ' + str(stations['milepost'][-1]))
+
+            else:
+                walk_route(pline_D, pline_P, cursorWRITE)
+
+            del cursorREAD
+
+        del cursorWRITE
+
+    profiler.stop()
+    telemetry.export(TELEMETRY_JSON, TELEMETRY_PROMETHEUS)
+    print('done')
 
+#------END OF SCRIPT----------------------------
@@ -0,0 +1,275 @@
+#------START OF MODULE--------------------------
+
+# Local stand-ins for the World Route and World Geocoding services
+#
+# Measuring the REST scripts against route.arcgis.com or
+# geocode.arcgis.com costs credits, needs a network, and never gives
+# the same numbers twice. This is a small HTTP server that answers the
+# same requests with the same shape of JSON, so the clients can be run
+# (and timed) against it on any machine:
+#
+#   .../Route_World/solve             one route per RouteName, or one
+#                                     route for plain "x,y;x,y" stops
+#   .../findAddressCandidates         one candidate per SingleLine
+#   .../geocodeAddresses              one location per address record
+#
+# Routes are the great-circle distance times a circuity factor, at a
+# fixed average speed; addresses are placed at a point derived from a
+# hash of the address, so the same address always lands in the same
+# place. An address containing "NOWHERE" is never matched.
+#
+# Every response waits 'latency' seconds plus or minus up to 'jitter'
+# (plus 'per_item' seconds for each route or address in the request).
+# A share of requests fail: 'throttle_rate' with HTTP 429 and a
+# Retry-After header, 'error_rate' with HTTP 503, and 'json_error_rate'
+# with HTTP 200 and an ArcGIS-style {"error": ...} body. The jitter and
+# the failures are drawn from the server's own random.Random, seeded
+# with 'seed', so a run with the same seed and the same requests gets
+# the same draws (with requests in flight at once, the draws still go
+# to whichever request gets there first).
+#
+# Run it on its own to serve on PORT until stopped:
+#
+#   python mock_services.py
+#
+# or call start_server() to run it on a background thread.
+
+import hashlib
+import json
+import math
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+# port served on when run as a script
+PORT = 8000
+
+# the default behaviour (see above)
+LATENCY = 0.08
+JITTER = 0.03
+PER_ITEM = 0.002
+THROTTLE_RATE = 0.0
+ERROR_RATE = 0.0
+JSON_ERROR_RATE = 0.0
+RETRY_AFTER = 1
+SEED = None
+
+# how the routes are made up: road miles per great-circle mile, and mph
+CIRCUITY = 1.25
+AVERAGE_MPH = 45.0
+
+# where made-up address locations fall (about the lower 48)
+ADDRESS_EXTENT = (-124.0, 25.0, -67.0, 49.0)
+
+EARTH_RADIUS_MILES = 3958.8
+
+
+#-----------------------------------------------
+
+# a made-up route between two (lon, lat) stops, as solve's route attributes
+def route_attributes(n, name, origin, destin):
+    lon1, lat1 = map(math.radians, origin)
+    lon2, lat2 = map(math.radians, destin)
+    a = (math.sin((lat2 - lat1) / 2) ** 2
+         + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2)
+    miles = 2 * EARTH_RADIUS_MILES * math.asin(min(1.0, math.sqrt(a))) * CIRCUITY
+    minutes = miles / AVERAGE_MPH * 60.0
+    return {'ObjectID': n, 'Name': name, 'FirstStopID': 2 * n - 1, 'LastStopID': 2 * n, 'StopCount': 2,
+            'Total_TravelTime': minutes, 'Total_Minutes': minutes, 'Total_Miles': miles,
+            'Total_Kilometers': miles * 1.609344, 'Shape_Length': miles * 1.609344 / 111.0}
+
+# the routes to solve in a 'stops' value, as [(name, origin, destin)]
+# ...either "x,y;x,y" or a feature set whose stops have RouteNames
+def parse_stops(stops):
+    if stops.lstrip().startswith('{'):
+        routes = {}
+        for feature in json.loads(stops)['features']:
+            name = feature['attributes'].get('RouteName', 'Location 1 - Location 2')
+            seq = feature['attributes'].get('Sequence', len(routes.get(name, [])) + 1)
+            routes.setdefault(name, []).append((seq, (feature['geometry']['x'], feature['geometry']['y'])))
+        return [(name, min(s)[1], max(s)[1]) for name, s in routes.items()]
+    points = [tuple(float(v) for v in stop.split(',')[:2]) for stop in stops.split(';')]
+    return [('Location 1 - Location 2', points[0], points[-1])]
+
+# a Route_World/solve response
+def solve_response(query):
+    features = [{'attributes': route_attributes(n, name, origin, destin)}
+                for n, (name, origin, destin) in enumerate(parse_stops(query['stops']), 1)]
+    return {'checksum': '', 'messages': [],
+            'routes': {'fieldAliases': {}, 'geometryType': 'esriGeometryPolyline',
+                       'spatialReference': {'wkid': 4326, 'latestWkid': 4326},
+                       'features': features}}, len(features)
+
+#-----------------------------------------------
+
+# a made-up location for an address, or None if it's "NOWHERE"
+def address_location(address):
+    if 'NOWHERE' in address.upper():
+        return None
+    digest = hashlib.md5(address.upper().encode('utf-8')).digest()
+    fx = int.from_bytes(digest[0:4], 'little') / 2.0 ** 32
+    fy = int.from_bytes(digest[4:8], 'little') / 2.0 ** 32
+    xmin, ymin, xmax, ymax = ADDRESS_EXTENT
+    return {'x': xmin + fx * (xmax - xmin), 'y': ymin + fy * (ymax - ymin)}
+
+# a findAddressCandidates response
+def candidates_response(query):
+    address = query.get('SingleLine', '')
+    location = address_location(address)
+    candidates = []
+    if location is not None:
+        candidates.append({'address': address.upper(), 'location': location, 'score': 100,
+                           'attributes': {},
+                           'extent': {'xmin': location['x'] - 0.001, 'ymin': location['y'] - 0.001,
+                                      'xmax': location['x'] + 0.001, 'ymax': location['y'] + 0.001}})
+    return {'spatialReference': {'wkid': 4326, 'latestWkid': 4326}, 'candidates': candidates}, 1
+
+# a geocodeAddresses response
+def geocode_addresses_response(query):
+    locations = []
+    for record in json.loads(query['addresses'])['records']:
+        attribs = record['attributes']
+        address = attribs.get('SingleLine', attribs.get('Address', ''))
+        location = address_location(address)
+        matched = location is not None
+        locations.append({'address': address.upper() if matched else '',
+                          'location': location or {'x': 'NaN', 'y': 'NaN'},
+                          'score': 100 if matched else 0,
+                          'attributes': {'ResultID': attribs.get('OBJECTID'), 'Status': 'M' if matched else 'U',
+                                         'Score': 100 if matched else 0,
+                                         'Match_addr': address.upper() if matched else ''}})
+    return {'spatialReference': {'wkid': 4326, 'latestWkid': 4326}, 'locations': locations}, len(locations)
+
+# the response maker for each operation, by the last part of its URL path
+OPERATIONS = {'solve': solve_response,
+              'findAddressCandidates': candidates_response,
+              'geocodeAddresses': geocode_addresses_response}
+
+#-----------------------------------------------
+
+# answers GET and POST requests to the operations above
+# ...the settings are on the server (see start_server)
+class MockHandler(BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        self.answer(parse_qs(urlparse(self.path).query))
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        query = parse_qs(urlparse(self.path).query)
+        query.update(parse_qs(self.rfile.read(length).decode('utf-8')))
+        self.answer(query)
+
+    # send a JSON body with a status and any extra headers
+    def send_json(self, status, body, headers=()):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def answer(self, query):
+        settings = self.server.settings
+        query = dict((k, v[-1]) for k, v in query.items())
+        operation = OPERATIONS.get(urlparse(self.path).path.rstrip('/').split('/')[-1])
+        if operation is None:
+            self.send_json(404, {'error': {'code': 404, 'message': 'unknown operation'}})
+            return
+        try:
+            body, items = operation(query)
+        except (KeyError, ValueError, TypeError) as e:
+            self.send_json(200, {'error': {'code': 400, 'message': 'bad request: ' + str(e)}})
+            return
+
+        jitter, roll = self.server.draw()
+        delay = settings['latency'] + jitter
+        time.sleep(max(0.0, delay + settings['per_item'] * items))
+        self.server.count()
+
+        if roll < settings['throttle_rate']:
+            self.send_json(429, {'error': {'code': 429, 'message': 'Too many requests'}},
+                           [('Retry-After', str(settings['retry_after']))])
+        elif roll < settings['throttle_rate'] + settings['error_rate']:
+            self.send_json(503, {'error': {'code': 503, 'message': 'Service unavailable'}})
+        elif roll < settings['throttle_rate'] + settings['error_rate'] + settings['json_error_rate']:
+            self.send_json(200, {'error': {'code': 500, 'message': 'Unable to complete operation.'}})
+        else:
+            self.send_json(200, body)
+
+# the server, holding the settings, its random numbers, and a count of
+# requests answered
+class MockServer(ThreadingHTTPServer):
+
+    daemon_threads = True
+
+    def __init__(self, address, settings, seed=SEED):
+        ThreadingHTTPServer.__init__(self, address, MockHandler)
+        self.settings = settings
+        self.random = random.Random(seed)
+        self.requests = 0
+        self.lock = threading.Lock()
+
+    def count(self):
+        with self.lock:
+            self.requests += 1
+
+    # start the random numbers over from a seed
+    def reseed(self, seed):
+        with self.lock:
+            self.random.seed(seed)
+
+    # one request's (jitter, failure roll)
+    def draw(self):
+        jitter = self.settings['jitter']
+        with self.lock:
+            return self.random.uniform(-jitter, jitter), self.random.random()
+
+#-----------------------------------------------
+
+# start a server on a background thread
+# ...port 0 picks a free port; seed seeds the jitter and failures
+# ...(None for a different run every time); returns (server, base_url), where the
+# ...services are base_url + '/World/Route/NAServer/Route_World/solve' etc.
+# ...stop it with server.shutdown()
+def start_server(port=0, latency=LATENCY, jitter=JITTER, per_item=PER_ITEM, throttle_rate=THROTTLE_RATE,
+                 error_rate=ERROR_RATE, json_error_rate=JSON_ERROR_RATE, retry_after=RETRY_AFTER, seed=SEED):
+    settings = {'latency': latency, 'jitter': jitter, 'per_item': per_item, 'throttle_rate': throttle_rate,
+                'error_rate': error_rate, 'json_error_rate': json_error_rate, 'retry_after': retry_after}
+    server = MockServer(('127.0.0.1', port), settings, seed)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, 'http://127.0.0.1:' + str(server.server_port) + '/arcgis/rest/services'
+
+# the service URLs under a base_url
+def route_url(base_url):
+    return base_url + '/World/Route/NAServer/Route_World/solve'
+
+def candidates_url(base_url):
+    return base_url + '/World/GeocodeServer/findAddressCandidates'
+
+def geocode_addresses_url(base_url):
+    return base_url + '/World/GeocodeServer/geocodeAddresses'
+
+
+if __name__ == '__main__':
+    server, base_url = start_server(PORT)
+    print('serving on ' + base_url + ' (Ctrl+C to stop)')
+    print('  ' + route_url(base_url))
+    print('  ' + candidates_url(base_url))
+    print('  ' + geocode_addresses_url(base_url))
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+#------END OF MODULE----------------------------
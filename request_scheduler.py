@@ -0,0 +1,212 @@
+#------START OF MODULE--------------------------
+
+# Rate-limited, retrying REST requests for the routing and geocoding scripts
+#
+# A long batch of solves or geocodes used to die on the first throttled
+# (HTTP 429) or failed (5xx) request, and start over from zero. A
+# RequestScheduler sits between the scripts and the service instead:
+#
+#   - a token bucket spaces the requests out to at most 'rate' per
+#     second (with bursts of up to 'burst')
+#   - at most 'per_host' requests are in flight to any one host
+#   - a throttled or failed request is retried with exponential backoff
+#     and full jitter, waiting at least as long as the service's
+#     Retry-After header asks
+#
+# ArcGIS services often report an error with HTTP 200 and an 'error'
+# object in the JSON, so the error's code is checked the same way. Only
+# errors that can go away on their own are retried (see RETRY_CODES);
+# a bad token or a bad request comes straight back to the caller.
+#
+# The checkpoint functions keep the OBJECTID of the last row a job has
+# committed in a small JSON file, so a job that does die can be started
+# again and carry on after it.
+
+import json
+import os
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
+
+import requests
+
+import telemetry
+
+# HTTP status (or ArcGIS error) codes worth retrying
+RETRY_CODES = (408, 429, 500, 502, 503, 504)
+
+# seconds to wait for a response
+TIMEOUT = 60
+
+
+#-----------------------------------------------
+
+# at most 'rate' acquisitions per second, with bursts of up to 'burst'
+# ...thread safe; acquire() blocks until a token is free
+class TokenBucket:
+
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        self.capacity = float(burst if burst is not None else max(1.0, rate))
+        self.tokens = self.capacity
+        self.stamp = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.stamp) * self.rate)
+                self.stamp = now
+                if self.tokens >= 1.0:
+                    self.tokens -= 1.0
+                    return
+                wait = (1.0 - self.tokens) / self.rate
+            time.sleep(wait)
+
+#-----------------------------------------------
+
+# seconds a Retry-After header asks for (a number, or an HTTP date), or None
+def retry_after_seconds(value):
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+# the code of an ArcGIS JSON error response, or None
+def error_code(response_json):
+    if isinstance(response_json, dict) and isinstance(response_json.get('error'), dict):
+        return response_json['error'].get('code')
+    return None
+
+#-----------------------------------------------
+
+# GET (and POST) requests with rate limiting, a per-host cap and retries
+# ...rate is requests per second over all hosts (None for no limit)
+# ...the counters (requests, retries, throttled, failed) are totals
+# ...since the scheduler was made
+class RequestScheduler:
+
+    def __init__(self, rate=None, burst=None, per_host=8, max_retries=6,
+                 base_delay=0.5, max_delay=60.0, timeout=TIMEOUT):
+        self.bucket = None if rate is None else TokenBucket(rate, burst)
+        self.per_host = per_host
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.timeout = timeout
+        self.hosts = {}
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.retries = 0
+        self.throttled = 0
+        self.failed = 0
+
+    # the semaphore capping the requests in flight to one host
+    def _host_slot(self, url):
+        host = urlparse(url).netloc
+        with self.lock:
+            if host not in self.hosts:
+                self.hosts[host] = threading.BoundedSemaphore(self.per_host)
+            return self.hosts[host]
+
+    # how long to wait before retry number 'attempt' (1, 2, ...)
+    # ...max_delay caps the backoff, never the service's Retry-After,
+    # ...which is always waited out in full
+    def backoff(self, attempt, retry_after=None):
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        return delay
+
+    # one GET, returning the response as a dict
+    # ...retried while it's throttled or fails in a way that may pass;
+    # ...once the retries run out, returns {'error': ...} instead of raising
+    def get_json(self, session, url, params=None, timeout=None):
+        return self.request_json(session, 'GET', url, params, None, timeout)
+
+    # one POST of form 'data' (for requests too long for a URL), as get_json
+    def post_json(self, session, url, data, timeout=None):
+        return self.request_json(session, 'POST', url, None, data, timeout)
+
+    # one request of either method, retried as described for get_json
+    def request_json(self, session, method, url, params=None, data=None, timeout=None):
+        slot = self._host_slot(url)
+        attempt = 0
+        while True:
+            if self.bucket is not None:
+                self.bucket.acquire()
+            retry_after = None
+            with slot:
+                with self.lock:
+                    self.requests += 1
+                telemetry.count('http_requests')
+                try:
+                    with telemetry.timer('http'):
+                        response = session.request(method, url, params=params, data=data,
+                                                   timeout=timeout or self.timeout)
+                    status = response.status_code
+                    retry_after = retry_after_seconds(response.headers.get('Retry-After'))
+                    try:
+                        result = response.json()
+                    except ValueError:
+                        result = {'error': {'code': status, 'message': 'response is not JSON'}}
+                except requests.RequestException as e:
+                    status = None
+                    result = {'error': {'code': None, 'message': str(e)}}
+
+            code = error_code(result)
+            transient = (status is None or status in RETRY_CODES or code in RETRY_CODES)
+            if not transient:
+                return result
+            if attempt >= self.max_retries:
+                with self.lock:
+                    self.failed += 1
+                telemetry.count('http_failed')
+                return result
+
+            attempt += 1
+            with self.lock:
+                self.retries += 1
+                if status == 429 or code == 429:
+                    self.throttled += 1
+            telemetry.count('http_retries')
+            time.sleep(self.backoff(attempt, retry_after))
+
+    # print the counters
+    def report(self):
+        print('requests: ' + str(self.requests) + ', retries: ' + str(self.retries)
+              + ' (' + str(self.throttled) + ' throttled), gave up: ' + str(self.failed))
+
+#-----------------------------------------------
+
+# the OBJECTID a checkpoint file says was committed last, or None
+def load_checkpoint(path):
+    if not path or not os.path.exists(path):
+        return None
+    with open(path, 'r') as fileIN:
+        return json.load(fileIN).get('last_oid')
+
+# record the OBJECTID of the last row committed
+# ...written to a temporary file and renamed over the old one, so a crash
+# ...mid-write never leaves a half-written checkpoint behind
+def save_checkpoint(path, last_oid):
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as fileOUT:
+        json.dump({'last_oid': last_oid, 'saved': time.strftime('%Y-%m-%d %H:%M:%S')}, fileOUT)
+    os.replace(tmp, path)
+
+# forget the checkpoint once a job has finished
+def clear_checkpoint(path):
+    if path and os.path.exists(path):
+        os.remove(path)
+
+#------END OF MODULE----------------------------
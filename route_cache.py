@@ -0,0 +1,122 @@
+#------START OF MODULE--------------------------
+
+# Persistent cache of World Route solves for route_solver.py
+#
+# REST-Route-World-solve.py is run once per topHierarchyLevel, and the
+# OD tables repeat a lot of origin/destination pairs, so the same route
+# gets solved (and paid for) over and over. This cache keeps every
+# solved route's attributes in a SQLite file, keyed on:
+#
+#   - the stops, each coordinate rounded to ROUND_DIGITS decimals
+#     (6 decimals of a degree is about 10 cm)
+#   - every other query parameter (useHierarchy, impedanceAttributeName,
+#     overrides, ...) except the token and the response format
+#
+# so a route is only solved again when something that changes its
+# answer changes. Only successful solves are cached.
+#
+# Entries older than 'ttl_days' are treated as missing (the street data
+# behind the service does change), and once the cache holds more than
+# 'max_entries' routes the least recently used ones are evicted.
+
+import hashlib
+import json
+import sqlite3
+import time
+
+# decimals the stop coordinates are rounded to in the key
+ROUND_DIGITS = 6
+
+# query parameters that don't change the answer, so aren't in the key
+IGNORED_PARAMS = ('token', 'f')
+
+# keys looked up per SQL statement (SQLite limits the '?' count)
+LOOKUP_BATCH = 500
+
+
+#-----------------------------------------------
+
+# a SQLite file of route attributes, keyed on stops and query parameters
+# ...hits and misses count the lookups since the cache was opened
+class RouteCache:
+
+    def __init__(self, path, ttl_days=None, max_entries=None):
+        self.conn = sqlite3.connect(path)
+        self.conn.execute('CREATE TABLE IF NOT EXISTS routes ('
+                          'key TEXT PRIMARY KEY, attributes TEXT NOT NULL, '
+                          'created REAL NOT NULL, used REAL NOT NULL)')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS routes_used ON routes (used)')
+        self.conn.commit()
+        self.ttl_seconds = None if ttl_days is None else ttl_days * 86400.0
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+
+    # the key of one solve request, from its query parameters
+    # ...None if a stop's coordinates aren't numbers (a null in the OD
+    # ...table makes a stop like 'None,34.05'), so it can't be cached
+    def key(self, params):
+        try:
+            stops = [[round(float(v), ROUND_DIGITS) for v in stop.split(',')]
+                     for stop in str(params['stops']).split(';')]
+        except ValueError:
+            return None
+        rest = sorted((k, str(v)) for k, v in params.items()
+                      if k != 'stops' and k not in IGNORED_PARAMS)
+        text = json.dumps([stops, rest], separators=(',', ':'))
+        return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+    # the cached attributes dict of every key that has one (and isn't
+    # ...expired), as {key: attributes}; the lookups count as hits/misses
+    def get_many(self, keys):
+        keys = list(keys)
+        unique = list(set(keys))
+        now = time.time()
+        oldest = 0 if self.ttl_seconds is None else now - self.ttl_seconds
+        found = {}
+        for start in range(0, len(unique), LOOKUP_BATCH):
+            batch = unique[start:start + LOOKUP_BATCH]
+            sql = ('SELECT key, attributes FROM routes WHERE created >= ? AND key IN ('
+                   + ','.join('?' * len(batch)) + ')')
+            for key, attributes in self.conn.execute(sql, [oldest] + batch):
+                found[key] = json.loads(attributes)
+        self.conn.executemany('UPDATE routes SET used = ? WHERE key = ?', [(now, k) for k in found])
+        self.conn.commit()
+        hits = sum(1 for k in keys if k in found)
+        self.hits += hits
+        self.misses += len(keys) - hits
+        return found
+
+    # add {key: attributes} to the cache, then evict down to max_entries
+    def put_many(self, items):
+        now = time.time()
+        self.conn.executemany('INSERT OR REPLACE INTO routes VALUES (?, ?, ?, ?)',
+                              [(k, json.dumps(a), now, now) for k, a in items.items()])
+        self.conn.commit()
+        self.evict()
+
+    # drop expired routes, then the least recently used beyond max_entries
+    # ...returns the number of routes dropped
+    def evict(self):
+        dropped = 0
+        if self.ttl_seconds is not None:
+            dropped += self.conn.execute('DELETE FROM routes WHERE created < ?',
+                                         (time.time() - self.ttl_seconds,)).rowcount
+        if self.max_entries is not None:
+            dropped += self.conn.execute('DELETE FROM routes WHERE key IN (SELECT key FROM routes '
+                                         'ORDER BY used DESC LIMIT -1 OFFSET ?)',
+                                         (self.max_entries,)).rowcount
+        self.conn.commit()
+        return dropped
+
+    # print the hit/miss counts so far
+    def report(self):
+        total = self.hits + self.misses
+        rate = 100.0 * self.hits / total if total else 0.0
+        print('route cache: ' + str(self.hits) + ' hits, ' + str(self.misses) + ' misses ('
+              + str(round(rate, 1)) + '% hit rate)')
+
+    def close(self):
+        self.conn.close()
+
+#------END OF MODULE----------------------------
@@ -0,0 +1,317 @@
+#------START OF MODULE--------------------------
+
+# Concurrent World Route solves for the REST-*.py scripts
+#
+# The scripts used to make one blocking requests.get() per OD row, so
+# the run time was the sum of every round trip. Here the solves run
+# on a pool of threads instead, with at most 'concurrency' requests in
+# flight at once, all sharing one requests.Session (and so one pool of
+# keep-alive connections to the service).
+#
+#   oids, ods = read_ods(fc, coord_fields)
+#   results = solve_ods(ods, ROUTE_URL, params, ['Total_TravelTime', 'Total_Miles'])
+#   write_results(fc, result_fields, oids, results)
+#
+# Results come back in the same order as the ODs, however the requests
+# happen to finish, and are written back with one UpdateCursor pass.
+# solve_table() does all three a chunk of rows at a time, checkpointing
+# the last OBJECTID written so a run that dies can be resumed.
+# A solve that fails leaves None in its place, and its row is left as
+# it was, so a rerun can pick it up.
+#
+# Given a RouteCache (see route_cache.py), ODs already solved on an
+# earlier run, or earlier in the same table, are not sent again.
+#
+# Given a batch size, many OD pairs go out in one request: each pair's
+# two stops share a RouteName, the service solves one route per name,
+# and the routes come back split out by name. Fewer round trips, and
+# fewer requests counted against the rate limit.
+#
+# The route URL is a parameter, so the whole thing can be pointed at a
+# local stand-in server (e.g. http://127.0.0.1:8000/solve) for testing.
+#
+# NOTE: no event loop is involved, so solve_ods() can be called from an
+# ArcGIS Pro or Jupyter notebook, which already has one running.
+
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+import request_scheduler
+import telemetry
+
+# the World Route solve endpoint
+ROUTE_URL = 'https://route.arcgis.com/arcgis/rest/services/World/Route/NAServer/Route_World/solve'
+
+# default number of requests in flight at once
+CONCURRENCY = 16
+
+# seconds to wait for a response
+TIMEOUT = 60
+
+# most OD pairs packed into one batched request (2 stops each; the
+# World Route service takes at most 150 stops per request)
+MAX_BATCH_PAIRS = 75
+
+# rows between progress messages while writing back
+REPORT_ROWS = 1000
+
+
+#-----------------------------------------------
+
+# the 'stops' value of one OD pair: lon,lat of the origin; lon,lat of the destination
+def stops_param(origin_lat, origin_lon, destin_lat, destin_lon):
+    return str(origin_lon) + ',' + str(origin_lat) + ';' + str(destin_lon) + ',' + str(destin_lat)
+
+# the 'stops' value of a batch of OD pairs, as a feature set
+# ...each pair gets its own RouteName ('0', '1', ...), so the service
+# ...solves a separate route for every pair in a single request
+def stops_featureset(ods):
+    features = []
+    for n, (origin_lat, origin_lon, destin_lat, destin_lon) in enumerate(ods):
+        for seq, (x, y) in enumerate(((origin_lon, origin_lat), (destin_lon, destin_lat)), 1):
+            features.append({'geometry': {'x': x, 'y': y},
+                             'attributes': {'RouteName': str(n), 'Sequence': seq}})
+    return json.dumps({'spatialReference': {'wkid': 4326}, 'features': features}, separators=(',', ':'))
+
+# the attributes dict of every route in a solve response, by route Name
+# ...(a route's Name is the RouteName of its stops)
+def routes_by_name(response_json):
+    try:
+        features = response_json['routes']['features']
+    except (KeyError, TypeError):
+        return {}
+    return dict((f['attributes'].get('Name'), f['attributes']) for f in features)
+
+# the attributes dict of the first route in a solve response, or None
+# ...if the response has no routes (an error, or no route found)
+def first_route(response_json):
+    try:
+        return response_json['routes']['features'][0]['attributes']
+    except (KeyError, IndexError, TypeError):
+        return None
+
+#-----------------------------------------------
+
+# a session whose connection pool holds 'concurrency' connections
+def make_session(concurrency=CONCURRENCY):
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=concurrency)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+# one blocking GET, returning the response as a dict
+# ...a failed request returns {'error': ...} instead of raising
+def fetch_json(session, url, params, timeout=TIMEOUT):
+    telemetry.count('http_requests')
+    try:
+        with telemetry.timer('http'):
+            response = session.get(url, params=params, timeout=timeout)
+        return response.json()
+    except (requests.RequestException, ValueError) as e:
+        return {'error': {'message': str(e)}}
+
+#-----------------------------------------------
+
+# solve every request in 'params_list' with at most 'concurrency' in flight
+# ...returns the response dicts, in the same order as params_list
+# ...given a RequestScheduler (see request_scheduler.py), the requests go
+# ...through it, so they're rate limited and retried
+def solve_all(session, url, params_list, concurrency=CONCURRENCY, timeout=TIMEOUT, scheduler=None):
+    fetch = fetch_json if scheduler is None else scheduler.get_json
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        return list(executor.map(lambda params: fetch(session, url, params, timeout), params_list))
+
+# solve one route per OD pair
+# ...ods is a list of (origin_lat, origin_lon, destin_lat, destin_lon)
+# ...params holds every query parameter except 'stops' (token, f, ...)
+# ...returns a list, in OD order, of the 'attribute_names' values of
+# ...each route, or None where the solve failed
+# ...with a cache (see route_cache.py) only the ODs it doesn't hold are
+# ...sent, and an OD repeated in 'ods' is only sent once
+# ...with batch_pairs, up to that many ODs go out in each request (see
+# ...stops_featureset), rather than one request per OD
+# ...with a scheduler (see request_scheduler.py), requests are rate
+# ...limited and retried
+def solve_ods(ods, url, params, attribute_names, concurrency=CONCURRENCY, session=None, cache=None,
+              batch_pairs=None, scheduler=None):
+    params_list = [dict(params, stops=stops_param(*od)) for od in ods]
+    if cache is not None:
+        keys = [cache.key(p) for p in params_list]
+        found = cache.get_many(key for key in keys if key is not None)
+    else:
+        keys = list(range(len(params_list)))
+        found = {}
+
+    # the ODs that actually have to be solved, one per distinct key
+    # (the index of the first OD with that key); an OD with no key (a
+    # null coordinate) isn't sent, and is left unsolved
+    todo = {}
+    for i, key in enumerate(keys):
+        if key is not None and key not in found and key not in todo:
+            todo[key] = i
+
+    # the keys each request solves, and the request's parameters
+    if batch_pairs:
+        batch_pairs = min(batch_pairs, MAX_BATCH_PAIRS)
+        todo_keys = list(todo)
+        batches = [todo_keys[start:start + batch_pairs] for start in range(0, len(todo_keys), batch_pairs)]
+        requests_list = [dict(params, stops=stops_featureset([ods[todo[k]] for k in batch])) for batch in batches]
+    else:
+        batches = [[k] for k in todo]
+        requests_list = [params_list[i] for i in todo.values()]
+
+    own_session = session is None
+    if own_session:
+        session = make_session(concurrency)
+    try:
+        responses = solve_all(session, url, requests_list, concurrency, scheduler=scheduler)
+    finally:
+        if own_session:
+            session.close()
+
+    # match the routes back to their ODs
+    solved = {}
+    failed = 0
+    for batch, response in zip(batches, responses):
+        if batch_pairs:
+            routes = routes_by_name(response)
+            attribs_list = [routes.get(str(n)) for n in range(len(batch))]
+        else:
+            attribs_list = [first_route(response)]
+        if all(attribs is None for attribs in attribs_list):
+            failed += 1
+            if failed <= 20:
+                print('solve failed: ' + str(response.get('error', response) if isinstance(response, dict) else response))
+        for key, attribs in zip(batch, attribs_list):
+            if attribs is not None:
+                solved[key] = attribs
+    if cache is not None:
+        cache.put_many(solved)
+        cache.report()
+    found.update(solved)
+
+    results = []
+    for key in keys:
+        attribs = found.get(key)
+        results.append(None if attribs is None else tuple(attribs[name] for name in attribute_names))
+    unkeyed = sum(key is None for key in keys)
+    if unkeyed:
+        print(str(unkeyed) + ' ODs with a missing coordinate not sent')
+    print(str(len(requests_list)) + ' requests sent, ' + str(failed) + ' failed; '
+          + str(sum(r is not None for r in results)) + ' of ' + str(len(ods)) + ' ODs solved')
+    return results
+
+#-----------------------------------------------
+
+# the where clause of the OBJECTIDs from 'first' to 'last' (either may be None)
+def oid_range_where(fc, first=None, last=None):
+    import arcpy
+    oid_field = arcpy.AddFieldDelimiters(fc, arcpy.Describe(fc).OIDFieldName)
+    where = []
+    if first is not None:
+        where.append(oid_field + ' >= ' + str(first))
+    if last is not None:
+        where.append(oid_field + ' <= ' + str(last))
+    return ' AND '.join(where) or None
+
+# read the OBJECTID and the origin/destination coordinates of every row,
+# ...in OBJECTID order
+# ...coord_fields is [origin lat, origin lon, destin lat, destin lon]
+# ...after_oid skips the rows up to and including that OBJECTID
+# ...returns (oids, ods)
+def read_ods(fc, coord_fields, after_oid=None):
+    import arcpy
+    oids = []
+    ods = []
+    where = None if after_oid is None else oid_range_where(fc, after_oid + 1)
+    sql_clause = (None, 'ORDER BY ' + arcpy.Describe(fc).OIDFieldName)
+    with arcpy.da.SearchCursor(fc, ['OID@'] + list(coord_fields), where, sql_clause=sql_clause) as cursor:
+        for row in cursor:
+            oids.append(row[0])
+            ods.append(tuple(row[1:5]))
+    return oids, ods
+
+# write each row's results into 'result_fields', in one UpdateCursor pass
+# ...over the OBJECTID range of 'oids'
+# ...results lines up with oids; a row whose result is None is left alone
+# ...convert is an optional function applied to each value before writing
+# ...returns the number of rows written
+def write_results(fc, result_fields, oids, results, convert=None):
+    import arcpy
+    if not oids:
+        return 0
+    by_oid = dict(zip(oids, results))
+    where = oid_range_where(fc, min(oids), max(oids))
+    written = 0
+    with arcpy.da.UpdateCursor(fc, ['OID@'] + list(result_fields), where) as cursor:
+        for row in cursor:
+            values = by_oid.get(row[0])
+            if values is None:
+                continue
+            if convert is not None:
+                values = [convert(v) for v in values]
+            cursor.updateRow([row[0]] + list(values))
+            written += 1
+            if written % REPORT_ROWS == 0:
+                print(str(written) + ' rows written')
+    print(str(written) + ' rows written')
+    return written
+
+#-----------------------------------------------
+
+# read, solve and write back a whole OD table, 'chunk_rows' rows at a time
+# ...after each chunk is written, the checkpoint file (if there is one)
+# ...is moved up to the last OBJECTID before the first row that failed,
+# ...so a rerun starts after it and every failed row is tried again;
+# ...once a row has failed the checkpoint stays put for the rest of the run
+# ...the checkpoint is removed once the whole table is done with no failures
+# ...the other arguments are as for read_ods, solve_ods and write_results
+# ...returns the number of rows written
+def solve_table(fc, coord_fields, result_fields, url, params, attribute_names, concurrency=CONCURRENCY,
+                cache=None, batch_pairs=None, scheduler=None, checkpoint_path=None, chunk_rows=None,
+                convert=None):
+    after_oid = request_scheduler.load_checkpoint(checkpoint_path)
+    if after_oid is not None:
+        print('resuming after OBJECTID ' + str(after_oid))
+    oids, ods = read_ods(fc, coord_fields, after_oid)
+    chunk_rows = chunk_rows or max(1, len(oids))
+
+    written = 0
+    any_failed = False
+    session = make_session(concurrency)
+    try:
+        for start in range(0, len(oids), chunk_rows):
+            chunk_oids = oids[start:start + chunk_rows]
+            results = solve_ods(ods[start:start + chunk_rows], url, params, attribute_names, concurrency,
+                                session, cache, batch_pairs, scheduler)
+            written += write_results(fc, result_fields, chunk_oids, results, convert)
+            if any_failed:
+                continue
+            done = checkpoint_oid(chunk_oids, results)
+            any_failed = done != chunk_oids[-1]
+            if checkpoint_path and done is not None:
+                request_scheduler.save_checkpoint(checkpoint_path, done)
+    finally:
+        session.close()
+    if scheduler is not None:
+        scheduler.report()
+    if any_failed:
+        print('some rows failed; checkpoint kept so a rerun retries them')
+    else:
+        request_scheduler.clear_checkpoint(checkpoint_path)
+    return written
+
+# the last OBJECTID in 'oids' before the first row whose result is None
+# ...(all of them solved: the last OBJECTID; the first one failed: None)
+def checkpoint_oid(oids, results):
+    done = None
+    for oid, result in zip(oids, results):
+        if result is None:
+            break
+        done = oid
+    return done
+
+#------END OF MODULE----------------------------
@@ -0,0 +1,92 @@
+########
+#
+# Script: "segment_curve_events.py"
+#
+# MERGE CURVE POINTS INTO CURVE EVENTS
+#
+# Description:
+#
+# Reads the curve points of a curvature run, a chunk at a time, and
+# merges every run of consecutive LEFT or RIGHT curve points on a route
+# into one curve event: its begin and end milepost, length, max and
+# mean degree, and spiral hints (see curve_events.py). There are orders
+# of magnitude fewer events than curve points, and finding a curve is
+# then a lookup, not a scan.
+#
+# The curve points come from the Arrow/Parquet files of a run with
+# COLUMNAR_FOLDER set, or from curve_points itself. The events go to a
+# table made from curve_events_template, with RouteId, begin_milepost
+# and end_milepost to make a route event layer on the routes, or to an
+# Arrow/Parquet file.
+#
+# (A MULTI_ROUTE run of measure_track_curvature.py with CURVE_EVENTS set
+# writes the same table as it goes.)
+#
+# Prep:
+#
+# Add a curve_events_template table to the FGDB with a RouteId text
+# field (left empty for the events of a single-route run, whose
+# curve_points has no RouteId) and the fields of curve_events.EVENT_FIELDS: curve_direction
+# (text), station_count (long) and the rest double.
+#
+########
+
+#### SETTINGS
+
+# where geometry and cursors come from: 'arcpy', or 'lite' for arcpy_lite.py
+GEOMETRY_BACKEND = 'arcpy'
+
+if GEOMETRY_BACKEND == 'arcpy':
+    import arcpy
+else:
+    import arcpy_lite as arcpy
+
+# (these modules are in the same folder as this script)
+import columnar_output
+import curve_events
+import telemetry
+
+# the curve points: a folder (or file) of Arrow/Parquet files, or None
+# to read curve_points in the FGDB
+COLUMNAR_PATH = None
+
+# the FGDB, with curve_points and curve_events_template
+fgdb = "C:/mapdata/Curvature/data/RR_Track.gdb"
+fcIN = fgdb + "/curve_points"
+ROUTE_ID_FIELD = 'RouteId'
+
+# an Arrow/Parquet file for the events, or None for the curve_events table
+EVENTS_PATH = None
+
+# where to write the stage timings and counters at the end of the run
+# (JSON, Prometheus text), and a file to profile it to (see telemetry.py)
+TELEMETRY_JSON = None
+TELEMETRY_PROMETHEUS = None
+PROFILE_PATH = None
+
+
+#-----------------------------------------------
+
+profiler = telemetry.Profile(PROFILE_PATH).start()
+
+if COLUMNAR_PATH:
+    chunks = columnar_output.read_arrays(COLUMNAR_PATH)
+else:
+    chunks = curve_events.cursor_chunks(arcpy, fcIN, ROUTE_ID_FIELD)
+events = curve_events.segment(chunks)
+
+if EVENTS_PATH:
+    written = columnar_output.write_arrays(events, EVENTS_PATH, 'curve_events')
+    print(str(written) + ' curve events written to ' + EVENTS_PATH)
+else:
+    arcpy.management.CreateTable(fgdb, "curve_events", "curve_events_template")
+    with arcpy.da.InsertCursor(fgdb + "/curve_events", [ROUTE_ID_FIELD] + curve_events.EVENT_FIELDS) as cursorEVENTS:
+        written = 0
+        for chunk in events:
+            written += curve_events.insert_events(cursorEVENTS, chunk)
+    print(str(written) + ' curve events written to ' + fgdb + '/curve_events')
+
+profiler.stop()
+telemetry.export(TELEMETRY_JSON, TELEMETRY_PROMETHEUS)
+
+#------END OF SCRIPT----
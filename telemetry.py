@@ -0,0 +1,341 @@
+#------START OF MODULE--------------------------
+
+# Stage timers, counters and progress reporting for the scripts
+#
+# The scripts used to print a line per row (per curve point, even), so
+# the only sign of where a run spent its time was how fast the lines
+# scrolled by, and in measure_track_curvature.py the prints themselves
+# were a fair share of it. This module keeps a few numbers per process
+# instead, cheap enough to leave on in production runs:
+#
+#   timers     calls, total and longest seconds of a named stage
+#   counters   running totals (routes, curve points, requests...)
+#
+#   with telemetry.timer('insert'):
+#       cursorWRITE.insertRow(to_insert)
+#   telemetry.count('curve_points', len(stations))
+#   for row in telemetry.timed_iter('cursor_read', cursorREAD):
+#       ...
+#
+# The stages the modules time are:
+#
+#   cursor_read   waiting on a SearchCursor for the next row
+#   geometry      geometry work: the curvature engine, positionAlongLine...
+#   projection    coordinate transformations (coordinate_projection.py
+#                 times every transformer call, projectAs in the walk)
+#   http          REST requests, retries included
+#   insert        writing rows (InsertCursor, bulk loads, columnar files)
+#   delete        deleting rows (incremental refreshes)
+#   pool_wait     the script waiting on the curvature workers
+#
+# Stages can nest (a projection inside the curvature engine counts in
+# both projection and geometry), so they don't add up to the run time.
+#
+# Progress replaces the per-row prints: update() it every row and it
+# prints a line (count, rate, percent done) at most every
+# PROGRESS_SECONDS.
+#
+# At the end of a run, export() prints the stages and counters, and
+# writes them as JSON and/or in the Prometheus text format (for
+# node_exporter's textfile collector, say). Profile dumps the whole run
+# to a cProfile file (.prof, for pstats or snakeviz), or, for a path
+# ending .html or .txt, a pyinstrument report.
+#
+# Every process keeps its own numbers. The curvature pool's workers
+# hand theirs back with each route and run_routes() merges them in, so
+# a worker stage's seconds are summed over the workers (CPU seconds,
+# more or less, rather than wall clock).
+#
+# NOTE: the pyinstrument reports need pyinstrument; cProfile is built in.
+
+import cProfile
+import json
+import os
+import re
+import sys
+import threading
+import time
+
+# seconds between progress lines
+PROGRESS_SECONDS = 5.0
+
+# the prefix of every Prometheus metric name
+METRIC_PREFIX = 'arcpy_samples_'
+
+# False to turn every timer and counter into a no-op
+ENABLED = True
+
+# name: [calls, seconds, max seconds]
+_timers = {}
+# name: total
+_counters = {}
+_lock = threading.Lock()
+_started = time.time()
+
+
+#-----------------------------------------------
+
+# add a measured time to a stage
+# ...longest is the longest of 'calls' calls taking 'seconds' in all
+def add_time(name, seconds, calls=1, longest=None):
+    longest = seconds if longest is None else longest
+    with _lock:
+        t = _timers.get(name)
+        if t is None:
+            _timers[name] = [calls, seconds, longest]
+        else:
+            t[0] += calls
+            t[1] += seconds
+            if longest > t[2]:
+                t[2] = longest
+
+# add to a counter
+def count(name, n=1):
+    if ENABLED:
+        with _lock:
+            _counters[name] = _counters.get(name, 0) + n
+
+# times the block it wraps into a stage
+class _Timer:
+
+    __slots__ = ('name', 'start')
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        add_time(self.name, time.perf_counter() - self.start)
+
+class _NoTimer:
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        pass
+
+_no_timer = _NoTimer()
+
+# a context manager timing its block into stage 'name'
+def timer(name):
+    return _Timer(name) if ENABLED else _no_timer
+
+# 'function', timing each call into stage 'name'
+def timed(name, function):
+    def call(*args, **kwargs):
+        if not ENABLED:
+            return function(*args, **kwargs)
+        start = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            add_time(name, time.perf_counter() - start)
+    return call
+
+# the items of 'iterable', timing the wait for each one into stage 'name'
+# ...for cursors: only the reading is timed, not what's done with each row
+def timed_iter(name, iterable):
+    it = iter(iterable)
+    while True:
+        start = time.perf_counter()
+        try:
+            item = next(it)
+        except StopIteration:
+            return
+        finally:
+            if ENABLED:
+                add_time(name, time.perf_counter() - start)
+        yield item
+
+#-----------------------------------------------
+
+# prints how far a loop has got, at most every 'seconds'
+# ...total (if known) adds the percent done; note_name labels the note
+# ...passed to update(), e.g. Progress('curve points', n, 'milepost')
+class Progress:
+
+    def __init__(self, label, total=None, note_name=None, seconds=PROGRESS_SECONDS):
+        self.label = label
+        self.total = total
+        self.note_name = note_name
+        self.seconds = seconds
+        self.done = 0
+        self.note = None
+        self.start = time.perf_counter()
+        self._next = self.start + seconds
+
+    # n more done; the note is only turned into text when a line is printed
+    def update(self, n=1, note=None):
+        self.done += n
+        self.note = note
+        if time.perf_counter() >= self._next:
+            self.print_line()
+
+    def print_line(self):
+        now = time.perf_counter()
+        self._next = now + self.seconds
+        elapsed = now - self.start
+        line = str(self.done)
+        if self.total:
+            line += '/' + str(self.total) + ' (' + '%.1f' % (100.0 * self.done / self.total) + '%)'
+        line += ' ' + self.label + ', ' + '%.0f' % (self.done / elapsed if elapsed > 0 else 0) + '/s'
+        if self.note_name and self.note is not None:
+            line += ', ' + self.note_name + ' ' + str(self.note)
+        print(line + ', ' + '%.1f' % elapsed + 's')
+
+    # print the final line, returns how many were done
+    def finish(self):
+        self.print_line()
+        return self.done
+
+#-----------------------------------------------
+
+# the timers and counters so far, as plain dicts
+def snapshot():
+    with _lock:
+        return {'timers': dict((name, {'calls': t[0], 'seconds': t[1], 'max_seconds': t[2]})
+                               for name, t in _timers.items()),
+                'counters': dict(_counters)}
+
+# add another process's snapshot() to this one's
+def merge(snap):
+    for name, t in snap['timers'].items():
+        add_time(name, t['seconds'], t['calls'], t['max_seconds'])
+    for name, n in snap['counters'].items():
+        count(name, n)
+
+# start over from nothing
+def reset():
+    global _started
+    with _lock:
+        _timers.clear()
+        _counters.clear()
+        _started = time.time()
+
+# a snapshot() with the script, process id, start time and wall clock seconds
+def run_summary():
+    summary = snapshot()
+    summary.update({'script': os.path.basename(sys.argv[0]) if sys.argv and sys.argv[0] else None,
+                    'pid': os.getpid(),
+                    'started': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(_started)),
+                    'wall_seconds': time.time() - _started})
+    return summary
+
+#-----------------------------------------------
+
+def _metric_name(name):
+    return METRIC_PREFIX + re.sub(r'[^a-zA-Z0-9_]', '_', name)
+
+def _label_value(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+# the run in the Prometheus text exposition format
+# ...labels are added to every sample, e.g. {'script': 'curvature'}
+def prometheus_text(labels=None):
+    summary = run_summary()
+    labels = dict(labels or {})
+    if summary['script'] and 'script' not in labels:
+        labels['script'] = summary['script']
+
+    def sample(name, value, extra=None):
+        pairs = sorted(labels.items()) + sorted((extra or {}).items())
+        inner = ','.join(k + '="' + _label_value(v) + '"' for k, v in pairs)
+        return name + ('{' + inner + '}' if inner else '') + ' ' + repr(float(value))
+
+    lines = []
+    timers = sorted(summary['timers'].items())
+    for suffix, key, kind, help_text in (('stage_seconds_total', 'seconds', 'counter', 'Seconds spent in each stage.'),
+                                         ('stage_calls_total', 'calls', 'counter', 'Calls of each stage.'),
+                                         ('stage_max_seconds', 'max_seconds', 'gauge', 'Longest call of each stage.')):
+        if timers:
+            lines.append('# HELP ' + METRIC_PREFIX + suffix + ' ' + help_text)
+            lines.append('# TYPE ' + METRIC_PREFIX + suffix + ' ' + kind)
+            for name, t in timers:
+                lines.append(sample(METRIC_PREFIX + suffix, t[key], {'stage': name}))
+    for name, n in sorted(summary['counters'].items()):
+        lines.append('# TYPE ' + _metric_name(name) + '_total counter')
+        lines.append(sample(_metric_name(name) + '_total', n))
+    lines.append('# TYPE ' + METRIC_PREFIX + 'run_wall_seconds gauge')
+    lines.append(sample(METRIC_PREFIX + 'run_wall_seconds', summary['wall_seconds']))
+    return '\n'.join(lines) + '\n'
+
+# write text to a file, under a temporary name first
+# ...(a collector reading the file never sees half of it)
+def _write_file(path, text):
+    with open(path + '.tmp', 'w') as fileOUT:
+        fileOUT.write(text)
+    os.replace(path + '.tmp', path)
+
+def write_json(path):
+    _write_file(path, json.dumps(run_summary(), indent=2))
+
+def write_prometheus(path, labels=None):
+    _write_file(path, prometheus_text(labels))
+
+# print the stages (longest first) and counters
+def report():
+    summary = run_summary()
+    print('%-14s %10s %12s %12s' % ('stage', 'calls', 'seconds', 'max ms'))
+    for name, t in sorted(summary['timers'].items(), key=lambda item: -item[1]['seconds']):
+        print('%-14s %10d %12.3f %12.3f' % (name, t['calls'], t['seconds'], t['max_seconds'] * 1000))
+    for name, n in sorted(summary['counters'].items()):
+        print(name + ': ' + str(n))
+    print('wall clock: ' + '%.3f' % summary['wall_seconds'] + 's')
+
+# the end of a run: report(), and write the JSON and Prometheus files
+# that have a path
+def export(json_path=None, prometheus_path=None, labels=None):
+    report()
+    if json_path:
+        write_json(json_path)
+    if prometheus_path:
+        write_prometheus(prometheus_path, labels)
+
+#-----------------------------------------------
+
+# profiles this process from start() to stop(), dumping to 'path'
+# ...a path ending .html or .txt gets a pyinstrument report, any other
+# ...a cProfile dump; with no path, start() and stop() do nothing
+class Profile:
+
+    def __init__(self, path=None):
+        self.path = path
+        self._profiler = None
+
+    def start(self):
+        if not self.path:
+            return self
+        if os.path.splitext(self.path)[1].lower() in ('.html', '.txt'):
+            from pyinstrument import Profiler
+            self._profiler = Profiler()
+            self._profiler.start()
+        else:
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+        return self
+
+    def stop(self):
+        if self._profiler is None:
+            return
+        if isinstance(self._profiler, cProfile.Profile):
+            self._profiler.disable()
+            self._profiler.dump_stats(self.path)
+        else:
+            self._profiler.stop()
+            if self.path.lower().endswith('.html'):
+                _write_file(self.path, self._profiler.output_html())
+            else:
+                _write_file(self.path, self._profiler.output_text())
+        self._profiler = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+#------END OF MODULE----------------------------
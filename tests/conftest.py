@@ -0,0 +1,71 @@
+# The modules under test sit next to the scripts, in the repository root,
+# and are imported the way the scripts import them.
+
+import json
+import os
+import sys
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+import coordinate_projection
+import curvature_engine
+
+# the curvature script's spatial references and transformation
+WKID_D = 4326
+WKID_P = 102005
+TRANSFORMATION = 'NAD_1983_To_WGS_1984_4'
+
+MILES_PER_METER = 1 / 1609.344
+
+# the curvature script's settings dict, as the pool and the index take it
+SETTINGS = {'wkid_D': WKID_D, 'wkid_P': WKID_P, 'transformation': TRANSFORMATION,
+            'projection_backend': 'numpy',
+            'interval_meters': curvature_engine.CURVE_POINT_INTERVAL_METERS,
+            'interval_miles': curvature_engine.CURVE_POINT_INTERVAL_MILES,
+            'tolerance': curvature_engine.CURVE_TOLERANCE_PERCENT,
+            'adaptive': False, 'tangent_tolerance': curvature_engine.TANGENT_TOLERANCE_DEGREES,
+            'chords': []}
+
+
+def project(x, y):
+    return coordinate_projection.get_transformer(WKID_D, WKID_P, TRANSFORMATION, 'numpy')(x, y)
+
+
+def unproject(x, y):
+    return coordinate_projection.get_transformer(WKID_P, WKID_D, TRANSFORMATION, 'numpy')(x, y)
+
+
+# a track in projected meters: a tangent, a curve of 'radius' turning
+# 'degrees' (right for a positive angle), then another tangent
+def track(tangent_in=300.0, radius=400.0, degrees=60.0, tangent_out=300.0, step=5.0,
+          x0=-50000.0, y0=20000.0):
+    points = [(x0 + d, y0) for d in np.arange(0.0, tangent_in, step)]
+    turn = np.radians(degrees)
+    sign = -1.0 if degrees > 0 else 1.0
+    cx, cy = x0 + tangent_in, y0 + sign * radius
+    for a in np.linspace(0.0, abs(turn), max(int(radius * abs(turn) / step), 2)):
+        points.append((cx + radius * np.sin(a), cy - sign * radius * np.cos(a)))
+    heading = -turn
+    end = points[-1]
+    for d in np.arange(step, tangent_out + step, step):
+        points.append((end[0] + d * np.cos(heading), end[1] + d * np.sin(heading)))
+    return np.array(points, dtype='f8')
+
+
+# a route's SHAPE@JSON (4326, with M) from projected parts and their M values
+def route_json(parts_P, measures):
+    paths = []
+    for part, m in zip(parts_P, measures):
+        lon, lat = unproject(part[:, 0], part[:, 1])
+        paths.append(np.column_stack((lon, lat, m)).tolist())
+    return json.dumps({'hasM': True, 'paths': paths, 'spatialReference': {'wkid': WKID_D}})
+
+
+# M in miles along a part, from 'start' (decreasing with step=-1)
+def part_measures(part, start, step=1):
+    s = np.concatenate(([0.0], np.cumsum(np.hypot(np.diff(part[:, 0]), np.diff(part[:, 1])))))
+    return start + step * s * MILES_PER_METER
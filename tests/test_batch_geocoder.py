@@ -0,0 +1,73 @@
+# Geocoding addresses in batches: results in input order, repeats sent once,
+# and the memo evicting an address between a chunk's submit and its drain
+
+import json
+
+import pytest
+
+import batch_geocoder
+
+URL = 'https://example.com/geocodeAddresses'
+
+
+# a geocodeAddresses service: an address's x is its length, and
+# addresses starting with 'NOWHERE' don't match
+class FakeScheduler:
+
+    def __init__(self):
+        self.sent = []
+
+    def post_json(self, session, url, data):
+        records = json.loads(data['addresses'])['records']
+        self.sent.append([r['attributes']['SingleLine'] for r in records])
+        locations = []
+        for r in records:
+            address = r['attributes']['SingleLine']
+            status = 'U' if address.startswith('NOWHERE') else 'M'
+            locations.append({'address': address.upper(), 'score': 100,
+                              'location': {'x': float(len(address)), 'y': 1.0},
+                              'attributes': {'ResultID': r['attributes']['OBJECTID'], 'Status': status}})
+        return {'locations': locations}
+
+
+def geocode(addresses, **options):
+    scheduler = FakeScheduler()
+    records = list(enumerate(addresses))
+    out = list(batch_geocoder.geocode_stream(records, {'f': 'json'}, URL, scheduler=scheduler,
+                                             session=object(), **options))
+    return out, scheduler.sent
+
+
+def x(result):
+    return None if result is None else result['x']
+
+#-----------------------------------------------
+
+def test_normalize_address():
+    assert batch_geocoder.normalize_address(' 380  New York St., Redlands ') == '380 NEW YORK ST REDLANDS'
+
+
+def test_results_in_input_order():
+    addresses = ['1 A St', 'NOWHERE 2', '33 B Ave', '4 C Rd', '555 D Blvd']
+    out, sent = geocode(addresses, batch_size=2, concurrency=2)
+    assert [row_id for row_id, _, _ in out] == list(range(5))
+    assert [x(result) for _, _, result in out] == [6.0, None, 8.0, 6.0, 10.0]
+    assert sorted(sum(sent, [])) == sorted(addresses)
+
+
+def test_repeats_are_sent_once():
+    addresses = ['1 A St', '1 a st.', '2 B St', '1 A St', '2 B St', '3 C St']
+    out, sent = geocode(addresses, batch_size=2, concurrency=2)
+    assert len(sum(sent, [])) == 3
+    assert [x(result) for _, _, result in out] == [6.0, 6.0, 6.0, 6.0, 6.0, 6.0]
+
+
+@pytest.mark.parametrize('window', [2, 3])
+def test_memo_eviction_before_drain(monkeypatch, window):
+    # with room for one address, the memo hit on '2 BB St' in the third
+    # chunk is evicted by the second chunk's results before the third is
+    # drained; it keeps the result it had when it was submitted
+    monkeypatch.setattr(batch_geocoder, 'MEMO_ENTRIES', 1)
+    addresses = ['1 A St', '2 BB St', '3 CCC St', '4 DDDD St', '2 BB St', '5 E St', '3 CCC St', '6 F St']
+    out, sent = geocode(addresses, batch_size=2, concurrency=1, window=window)
+    assert [x(result) for _, _, result in out] == [float(len(a)) for a in addresses]
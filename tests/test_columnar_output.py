@@ -0,0 +1,116 @@
+# Arrow/Parquet outputs: what's written comes back the same, in order,
+# from a file or a folder of route files
+
+import os
+
+import numpy as np
+import pytest
+
+pytest.importorskip('pyarrow')
+
+import columnar_output
+import curvature_engine as ce
+import curvature_pool
+from conftest import SETTINGS, part_measures, route_json, track, unproject
+
+FORMATS = ['parquet', 'arrow']
+
+
+def stations(chords=()):
+    return ce.compute_stations([track()], 5.0, unproject, chords=chords)
+
+
+def read_all(path, batch_rows=100000):
+    return np.concatenate(list(columnar_output.read_arrays(path, batch_rows)))
+
+
+def assert_same_fields(read, written):
+    for name in written.dtype.names:
+        np.testing.assert_array_equal(read[name], written[name])
+
+#-----------------------------------------------
+
+@pytest.mark.parametrize('fmt', FORMATS)
+def test_stations_round_trip(tmp_path, fmt):
+    arr = stations()
+    path = str(tmp_path / ('stations.' + fmt))
+    assert columnar_output.write_arrays([arr[:20], arr[20:20], arr[20:]], path, 'stations', {'RouteId': 'R1'}) \
+        == len(arr)
+    read = read_all(path)
+    assert read.dtype.names == tuple(name for name, _ in columnar_output.SCHEMAS['stations'])
+    assert set(read['RouteId']) == {'R1'}
+    assert_same_fields(read, arr)
+
+
+@pytest.mark.parametrize('fmt', FORMATS)
+def test_chord_columns_round_trip(tmp_path, fmt):
+    arr = stations(chords=(200,))
+    columns = columnar_output.extra_columns(arr.dtype, 'stations')
+    assert columns == [('curve_percent_actual_200', 'float64'), ('curve_percent_absolute_200', 'float64'),
+                       ('curve_direction_200', 'string')]
+    path = str(tmp_path / ('stations.' + fmt))
+    columnar_output.write_arrays([arr], path, 'stations', {'RouteId': 'R1'}, columns)
+    assert_same_fields(read_all(path), arr)
+
+
+def test_calibration_nulls_and_batches(tmp_path):
+    arr = np.zeros(5, dtype=[('X', 'f8'), ('Y', 'f8'), ('RouteName', 'U10'), ('Measure', 'f8')])
+    arr['X'] = np.arange(5)
+    arr['RouteName'] = ['a', 'bb', '', 'dddd', 'e']
+    path = str(tmp_path / 'calibration.parquet')
+    columnar_output.write_arrays([arr], path, 'calibration')
+    batches = list(columnar_output.read_arrays(path, batch_rows=2))
+    assert [len(b) for b in batches] == [2, 2, 1]
+    read = np.concatenate(batches)
+    assert_same_fields(read, arr)
+    # Z and RouteId weren't written: null, so NaN and ''
+    assert np.isnan(read['Z']).all() and set(read['RouteId']) == {''}
+
+
+def test_curve_events_keep_integer_counts(tmp_path):
+    import curve_events
+    events = np.zeros(2, dtype=curve_events.event_dtype())
+    events['RouteId'] = ['R1', 'R2']
+    events['station_count'] = [3, 12]
+    path = str(tmp_path / 'events.arrow')
+    columnar_output.write_arrays([events], path, 'curve_events')
+    read = read_all(path)
+    assert read['station_count'].dtype == np.dtype('i8')
+    assert_same_fields(read, events)
+
+#-----------------------------------------------
+
+@pytest.mark.parametrize('fmt', FORMATS)
+def test_route_files_read_back_in_route_order(tmp_path, fmt):
+    folder = str(tmp_path / 'out')
+    columnar_output.prepare_folder(folder)
+    part = track()
+    curvature_pool.init_worker(dict(SETTINGS, output_folder=folder, output_format=fmt))
+    jobs = [(index, 'R' + str(index), route_json([part], [part_measures(part, 10.0 * index)]))
+            for index in (11, 2, 7)]
+    for job in jobs:
+        assert curvature_pool.write_route(job)[2] == len(curvature_pool.compute_route(job)[2])
+    read = read_all(folder)
+    assert list(dict.fromkeys(read['RouteId'])) == ['R2', 'R7', 'R11']
+    expected = np.concatenate([curvature_pool.compute_route(job)[2] for job in sorted(jobs)])
+    assert_same_fields(read, expected)
+    # an earlier run's files are cleared
+    columnar_output.prepare_folder(folder)
+    assert columnar_output.output_files(folder) == []
+
+
+def test_failed_write_leaves_no_file(tmp_path):
+    path = str(tmp_path / 'stations.parquet')
+    with pytest.raises(RuntimeError):
+        with columnar_output.ColumnarWriter(path, 'stations') as writer:
+            writer.write(stations())
+            raise RuntimeError('worker died')
+    assert os.listdir(str(tmp_path)) == []
+
+
+def test_with_shape_columns():
+    arr = stations()
+    out = next(columnar_output.with_shape_columns([arr], ['X', 'Y']))
+    np.testing.assert_array_equal(out['SHAPE_X'], arr['X'])
+    np.testing.assert_array_equal(out['SHAPE_Y'], arr['Y'])
+    assert 'SHAPE_Z' not in out.dtype.names and out.dtype.names[:len(arr.dtype.names)] == arr.dtype.names
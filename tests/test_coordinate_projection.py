@@ -0,0 +1,97 @@
+# The NumPy transformers: the equidistant conic against its definition,
+# the Helmert datum shift, and round trips through both
+
+import numpy as np
+import pytest
+
+import coordinate_projection as cp
+from conftest import TRANSFORMATION, WKID_D, WKID_P
+
+# a grid over the contiguous US, in degrees
+LON, LAT = [g.ravel() for g in np.meshgrid(np.linspace(-125.0, -67.0, 30), np.linspace(24.0, 50.0, 20))]
+
+# about a millimeter, in degrees of latitude
+MM_DEGREES = 1e-8
+
+
+# the meridional arc from lat0 to lat1 (degrees), integrated numerically
+def meridian_distance(lat0, lat1, ellipsoid=cp.GRS80):
+    a, f = ellipsoid
+    e2 = f * (2 - f)
+    phi = np.radians(np.linspace(lat0, lat1, 200001))
+    radius = a * (1 - e2) / (1 - e2 * np.sin(phi) ** 2) ** 1.5
+    return np.sum((radius[1:] + radius[:-1]) / 2 * np.diff(phi))
+
+#-----------------------------------------------
+
+def test_eqdc_snyder_example():
+    # Snyder p. 292: Clarke 1866, standard parallels 29.5 and 45.5
+    clarke_1866 = (6378206.4, 1 / 294.9786982)
+    params = dict(cp.EQDC_102005, standard_parallel_1=29.5, standard_parallel_2=45.5, latitude_of_origin=23.0)
+    x, y = cp.eqdc_forward(-75.0, 35.0, params, clarke_1866)
+    assert x == pytest.approx(1885051.9, abs=0.1)
+
+
+def test_eqdc_central_meridian_is_true_to_scale():
+    x, y = cp.eqdc_forward(np.array([-96.0, -96.0]), np.array([39.0, 45.0]))
+    np.testing.assert_allclose(x, 0.0, atol=1e-9)
+    assert y[0] == pytest.approx(0.0, abs=1e-6)
+    assert y[1] == pytest.approx(meridian_distance(39.0, 45.0), abs=0.001)
+
+
+@pytest.mark.parametrize('lat', [33.0, 45.0])
+def test_eqdc_standard_parallels_are_true_to_scale(lat):
+    a, f = cp.GRS80
+    e2 = f * (2 - f)
+    x, y = cp.eqdc_forward(np.array([-100.0, -99.999]), np.array([lat, lat]))
+    along = a * np.cos(np.radians(lat)) / np.sqrt(1 - e2 * np.sin(np.radians(lat)) ** 2) * np.radians(0.001)
+    assert np.hypot(np.diff(x), np.diff(y))[0] == pytest.approx(along, rel=1e-9)
+
+
+def test_eqdc_round_trip():
+    lon, lat = cp.eqdc_inverse(*cp.eqdc_forward(LON, LAT))
+    np.testing.assert_allclose(lon, LON, atol=MM_DEGREES)
+    np.testing.assert_allclose(lat, LAT, atol=MM_DEGREES)
+
+#-----------------------------------------------
+
+def test_helmert_shift_is_about_a_meter():
+    lon, lat = cp.helmert(LON, LAT, cp.NAD_1983_TO_WGS_1984_4, cp.GRS80, cp.WGS84)
+    meters = np.hypot((lon - LON) * np.cos(np.radians(LAT)) * 111320.0, (lat - LAT) * 110570.0)
+    assert 0.3 < meters.min() and meters.max() < 2.0
+
+
+def test_helmert_round_trip():
+    lon, lat = cp.helmert(LON, LAT, cp.NAD_1983_TO_WGS_1984_4, cp.GRS80, cp.WGS84)
+    lon, lat = cp.helmert(lon, lat, cp.NAD_1983_TO_WGS_1984_4, cp.WGS84, cp.GRS80, inverse=True)
+    np.testing.assert_allclose(lon, LON, atol=MM_DEGREES)
+    np.testing.assert_allclose(lat, LAT, atol=MM_DEGREES)
+
+
+def test_projected_to_wgs84_round_trip():
+    x, y = cp.project_xy(LON, LAT, WKID_D, WKID_P, TRANSFORMATION, 'numpy')
+    lon, lat = cp.project_xy(x, y, WKID_P, WKID_D, TRANSFORMATION, 'numpy')
+    np.testing.assert_allclose(lon, LON, atol=MM_DEGREES)
+    np.testing.assert_allclose(lat, LAT, atol=MM_DEGREES)
+    # and the datum shift is in there: 4269 lands about a meter away
+    x83, y83 = cp.project_xy(LON, LAT, 4269, WKID_P, backend='numpy')
+    assert 0.3 < np.hypot(x - x83, y - y83).min() < np.hypot(x - x83, y - y83).max() < 2.0
+
+#-----------------------------------------------
+
+def test_transformers_are_cached():
+    tf = cp.get_transformer(WKID_P, WKID_D, TRANSFORMATION, 'numpy')
+    assert cp.get_transformer(WKID_P, WKID_D, TRANSFORMATION, 'numpy') is tf
+
+
+def test_numpy_backend_refuses_other_pairs():
+    with pytest.raises(ValueError, match='no transformer'):
+        cp.get_transformer(WKID_P, WKID_D, 'NAD_1983_To_WGS_1984_5', 'numpy')
+    with pytest.raises(ValueError, match='no transformer'):
+        cp.get_transformer(3857, WKID_D, None, 'numpy')
+
+
+def test_authority_name():
+    assert cp.authority_name(102005) == 'ESRI:102005'
+    assert cp.authority_name(54004) == 'ESRI:54004'
+    assert cp.authority_name(4326) == 'EPSG:4326'
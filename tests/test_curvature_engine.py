@@ -0,0 +1,225 @@
+# The NumPy engine against the original per-station loop
+#
+# loop_stations() is walk_route() from measure_track_curvature.py, line
+# for line, on geometry_backend's arcpy-style geometry (positionAlongLine,
+# projectAs, and a Vincenty angleAndDistanceTo) instead of arcpy's.
+
+import numpy as np
+import pytest
+
+import curvature_engine as ce
+import geometry_backend
+from conftest import TRANSFORMATION, WKID_P, track, unproject
+
+INTERVAL = ce.CURVE_POINT_INTERVAL_METERS
+INTERVAL_MILES = ce.CURVE_POINT_INTERVAL_MILES
+
+
+# the original loop's rows after the first point, as tuples in
+# STATION_DTYPE order
+def loop_stations(parts_P, first_measure, interval=INTERVAL, tolerance=ce.CURVE_TOLERANCE_PERCENT):
+    pline_P = geometry_backend.AsShape({'paths': [part.tolist() for part in parts_P],
+                                        'spatialReference': {'wkid': WKID_P}}, True)
+    pline_P_len = round(pline_P.length, 5)
+    thisMeasure = first_measure
+    startpt_len = 0
+    basept_len = startpt_len + interval
+    endpt_len = startpt_len + (interval * 2)
+    rows = []
+    while endpt_len < pline_P_len:
+        ptgStart_P = pline_P.positionAlongLine(startpt_len)
+        ptgBase_P = pline_P.positionAlongLine(basept_len)
+        ptBase_P = ptgBase_P.firstPoint
+        ptgEnd_P = pline_P.positionAlongLine(endpt_len)
+        ptgStart_D = ptgStart_P.projectAs(4326, TRANSFORMATION)
+        ptgBase_D = ptgBase_P.projectAs(4326, TRANSFORMATION)
+        ptBase_D = ptgBase_D.firstPoint
+        ptgEnd_D = ptgEnd_P.projectAs(4326, TRANSFORMATION)
+        aad1 = ptgStart_D.angleAndDistanceTo(ptgBase_D)
+        aad2 = ptgBase_D.angleAndDistanceTo(ptgEnd_D)
+        bearing1 = normalize_bearing(round(aad1[0], 5))
+        bearing2 = normalize_bearing(round(aad2[0], 5))
+        bearing_delta = bearing2 - bearing1
+        curve_percent_actual = round(bearing_delta, 5)
+        curve_percent_absolute = abs(bearing_delta)
+        curve_direction = 'UNKNOWN'
+        if curve_percent_actual > 0:
+            curve_direction = 'RIGHT'
+        if curve_percent_actual < 0:
+            curve_direction = 'LEFT'
+        if curve_percent_absolute < tolerance:
+            curve_direction = 'STRAIGHT'
+        thisMeasure = round(thisMeasure + INTERVAL_MILES, 5)
+        rows.append((ptBase_P.X, ptBase_P.Y, ptBase_D.X, ptBase_D.Y, thisMeasure,
+                     curve_percent_actual, curve_percent_absolute, curve_direction))
+        startpt_len = round(basept_len, 5)
+        basept_len = round(endpt_len, 5)
+        endpt_len = round(endpt_len + interval, 5)
+    return rows
+
+
+def normalize_bearing(angle):
+    az = angle
+    if az < 0:
+        az = 180 + (180 - abs(az))
+    if az >= 360:
+        az = 0
+    return az
+
+
+# assert engine rows match the loop's, within the engine's stated tolerance
+def assert_matches_loop(stations, rows):
+    assert len(stations) == len(rows)
+    loop = np.array(rows, dtype=ce.STATION_DTYPE)
+    np.testing.assert_allclose(stations['X'], loop['X'], atol=1e-6)
+    np.testing.assert_allclose(stations['Y'], loop['Y'], atol=1e-6)
+    np.testing.assert_allclose(stations['lambda'], loop['lambda'], atol=1e-9)
+    np.testing.assert_allclose(stations['phi'], loop['phi'], atol=1e-9)
+    np.testing.assert_array_equal(stations['milepost'], loop['milepost'])
+    np.testing.assert_allclose(stations['curve_percent_actual'], loop['curve_percent_actual'], atol=2e-5)
+    np.testing.assert_array_equal(stations['curve_direction'], loop['curve_direction'])
+
+
+#-----------------------------------------------
+
+@pytest.mark.parametrize('degrees', [60.0, -35.0])
+def test_compute_stations_matches_loop(degrees):
+    part = track(degrees=degrees)
+    stations = ce.compute_stations([part], 12.5, unproject)
+    assert_matches_loop(stations, loop_stations([part], 12.5))
+    assert set(stations['curve_direction']) == {'STRAIGHT', 'RIGHT' if degrees > 0 else 'LEFT'}
+
+
+def test_compute_stations_window_matches_full_run():
+    part = track()
+    full = ce.compute_stations([part], 3.0, unproject)
+    window = ce.compute_stations([part], 3.0, unproject, window=(20, 41))
+    np.testing.assert_array_equal(window, full[20:41])
+
+
+def test_multipart_with_gap_matches_loop():
+    # the second part starts 40 m off the end of the first; its first
+    # segment must not be drawn from the first part's last vertex
+    part = track(tangent_out=0.0, degrees=30.0)
+    first, second = part[:70], part[70:] + np.array([0.0, 40.0])
+    x, y, s = ce.cumulative_length([first, second])
+    assert len(x) == len(part)
+    assert (x[70], y[70]) == tuple(second[0])
+    assert s[70] == s[69]
+    stations = ce.compute_stations([first, second], 0.0, unproject)
+    assert_matches_loop(stations, loop_stations([first, second], 0.0))
+
+
+def test_multipart_sharing_a_vertex_drops_the_repeat():
+    part = track()
+    first, second = part[:50], part[49:]
+    x, _, s = ce.cumulative_length([first, second])
+    assert len(x) == len(part)
+    assert np.all(np.diff(s) > 0)
+    split = ce.compute_stations([first, second], 1.0, unproject)
+    whole = ce.compute_stations([part], 1.0, unproject)
+    np.testing.assert_allclose(split['Y'], whole['Y'], atol=1e-9)
+    np.testing.assert_array_equal(split[['milepost', 'curve_percent_actual', 'curve_direction']],
+                                  whole[['milepost', 'curve_percent_actual', 'curve_direction']])
+
+
+@pytest.mark.parametrize('parts', [[],
+                                   [np.array([[10.0, 20.0]])],
+                                   [np.array([[10.0, 20.0], [10.0, 20.0]])],
+                                   [np.array([[0.0, 0.0], [20.0, 0.0]])]])
+def test_degenerate_routes_have_no_stations(parts):
+    for engine in (ce.compute_stations, ce.adaptive_stations):
+        stations = engine(parts, 5.0, unproject)
+        assert len(stations) == 0
+        assert stations.dtype == ce.STATION_DTYPE
+
+
+def test_station_distances_of_zero_length_line():
+    assert len(ce.station_distances(0.0)) == 0
+    assert ce.station_count(0.0) == 0
+    assert ce.station_count(2 * INTERVAL + 0.001) == 1
+
+
+def test_mileposts_step_from_first_measure():
+    # the loop never reads M past the first vertex, so neither does the
+    # engine: the mileposts climb by the interval whatever the M values do
+    part = track()
+    stations = ce.compute_stations([part], 100.0, unproject)
+    assert np.all(np.diff(stations['milepost']) > 0)
+    assert stations['milepost'][0] == round(100.0 + INTERVAL_MILES, 5)
+
+#-----------------------------------------------
+
+def test_adaptive_stations_match_full_run_off_the_tangents():
+    part = track(tangent_in=1500.0, tangent_out=1500.0)
+    full = ce.compute_stations([part], 7.0, unproject)
+    adaptive = ce.adaptive_stations([part], 7.0, unproject)
+    assert len(adaptive) < len(full) / 2
+    by_milepost = dict((mp, i) for i, mp in enumerate(full['milepost']))
+    rows = np.array([by_milepost[mp] for mp in adaptive['milepost']])
+    assert np.all(np.diff(rows) > 0)
+
+    # every curve station is kept, exactly as the full run has it
+    curved = np.nonzero(full['curve_direction'] != 'STRAIGHT')[0]
+    assert set(curved) <= set(rows)
+    measured = adaptive['curve_percent_absolute'] != 0
+    np.testing.assert_array_equal(adaptive[measured], full[rows[measured]])
+
+    # and every span left in place of skipped stations is STRAIGHT in the full run too
+    assert np.all(full['curve_direction'][rows[~measured]] == 'STRAIGHT')
+    assert np.all(adaptive['curve_direction'][~measured] == 'STRAIGHT')
+
+
+def test_adaptive_stations_on_multipart_with_gap():
+    part = track(tangent_in=1200.0, tangent_out=0.0, degrees=30.0)
+    first, second = part[:300], part[300:] + np.array([0.0, 40.0])
+    full = ce.compute_stations([first, second], 0.0, unproject)
+    adaptive = ce.adaptive_stations([first, second], 0.0, unproject)
+    curved = full[full['curve_direction'] != 'STRAIGHT']
+    assert len(curved)
+    kept = np.isin(adaptive['milepost'], curved['milepost'])
+    np.testing.assert_array_equal(adaptive[kept], curved)
+
+#-----------------------------------------------
+
+def test_chord_of_two_intervals_equals_base_curvature():
+    part = track()
+    stations = ce.compute_stations([part], 0.0, unproject, chords=(100,))
+    np.testing.assert_array_equal(stations['curve_percent_actual_100'], stations['curve_percent_actual'])
+    np.testing.assert_array_equal(stations['curve_direction_100'], stations['curve_direction'])
+
+
+def test_longer_chord_matches_loop_over_that_chord():
+    part = track(radius=250.0)
+    stations = ce.compute_stations([part], 0.0, unproject, chords=(200,))
+    pline_P = geometry_backend.AsShape({'paths': [part.tolist()], 'spatialReference': {'wkid': WKID_P}}, True)
+    line_len = round(pline_P.length, 5)
+    half = 200 * ce.METERS_PER_FOOT / 2
+    for k, st in enumerate(stations):
+        d = round((k + 1) * INTERVAL, 5)
+        start, end = round(d - half, 5), round(d + half, 5)
+        if start < 0 or end >= line_len:
+            assert np.isnan(st['curve_percent_actual_200'])
+            assert st['curve_direction_200'] == 'UNKNOWN'
+            continue
+        pts = [pline_P.positionAlongLine(v).projectAs(4326, TRANSFORMATION) for v in (start, d, end)]
+        bearing1 = normalize_bearing(round(pts[0].angleAndDistanceTo(pts[1])[0], 5))
+        bearing2 = normalize_bearing(round(pts[1].angleAndDistanceTo(pts[2])[0], 5))
+        assert st['curve_percent_actual_200'] == pytest.approx(round(bearing2 - bearing1, 5), abs=2e-5)
+
+
+def test_adaptive_chords_match_full_run_where_measured():
+    part = track(tangent_in=1500.0)
+    full = ce.compute_stations([part], 0.0, unproject, chords=(62, 200))
+    adaptive = ce.adaptive_stations([part], 0.0, unproject, chords=(62, 200))
+    measured = adaptive['curve_percent_absolute'] != 0
+    rows = np.searchsorted(full['milepost'], adaptive['milepost'][measured])
+    for name in ce.chord_fields((62, 200)):
+        np.testing.assert_array_equal(adaptive[name][measured], full[name][rows])
+
+
+def test_station_rows_put_nan_chords_in_as_null():
+    stations = ce.compute_stations([track()], 0.0, unproject, chords=(200,))
+    first = next(ce.station_rows(stations))
+    assert first[0] == (stations['lambda'][0], stations['phi'][0])
+    assert None in first
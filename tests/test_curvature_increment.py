@@ -0,0 +1,173 @@
+# Incremental refresh: a full run of the old route with the changed
+# window replaced must come out the same as a full run of the new one
+
+import numpy as np
+import pytest
+
+import curvature_engine as ce
+import curvature_increment
+import curvature_pool
+from conftest import SETTINGS, part_measures, route_json, track
+
+
+@pytest.fixture(autouse=True)
+def worker():
+    curvature_pool.init_worker(SETTINGS)
+
+
+# a full run's curve points of a route
+def full_run(shape_json):
+    return curvature_pool.compute_route((0, 'R', shape_json))[2]
+
+
+# the manifest entry of a route, as the last run saved it
+def manifest_entry(shape_json):
+    _, parts_P, _ = curvature_pool._route_parts(shape_json)
+    return curvature_increment.route_digest(shape_json, parts_P)[0]
+
+
+# old curve points with a refresh's rows put in, the way replace_rows()
+# does it in curve_points: delete the mileposts, insert the new rows
+def apply_refresh(old, mileposts, stations):
+    keep = np.ones(len(old), dtype=bool)
+    if mileposts[0] is not None:
+        keep &= old['milepost'] < mileposts[0] - curvature_increment.MILEPOST_SLACK
+        if mileposts[1] is not None:
+            keep |= old['milepost'] > mileposts[1] + curvature_increment.MILEPOST_SLACK
+    else:
+        keep[:] = False
+    merged = np.concatenate((old[keep], stations))
+    return merged[np.argsort(merged['milepost'], kind='stable')]
+
+
+def refresh(old_json, new_json):
+    return curvature_pool.refresh_route((0, 'R', new_json, manifest_entry(old_json)))
+
+
+def assert_refresh_matches_full_run(old_json, new_json):
+    window, mileposts, stations = refresh(old_json, new_json)[3:]
+    merged = apply_refresh(full_run(old_json), mileposts, stations)
+    full = full_run(new_json)
+    np.testing.assert_array_equal(merged['milepost'], full['milepost'])
+    np.testing.assert_allclose(merged['X'], full['X'], atol=1e-6)
+    np.testing.assert_allclose(merged['curve_percent_actual'], full['curve_percent_actual'], atol=1e-9)
+    np.testing.assert_array_equal(merged['curve_direction'], full['curve_direction'])
+    return window, stations
+
+#-----------------------------------------------
+
+def test_unchanged_route_is_left_alone():
+    part = track()
+    shape_json = route_json([part], [part_measures(part, 5.0)])
+    assert refresh(shape_json, shape_json)[3:] == (None, None, None)
+
+
+def test_new_route_is_computed_whole():
+    part = track()
+    shape_json = route_json([part], [part_measures(part, 5.0)])
+    _, _, _, window, mileposts, stations = curvature_pool.refresh_route((0, 'R', shape_json, None))
+    assert window[2] and mileposts == (None, None)
+    np.testing.assert_array_equal(stations, full_run(shape_json))
+
+
+def test_moved_first_vertex_replaces_the_whole_route():
+    part = track()
+    moved = part.copy()
+    moved[0, 1] += 3.0
+    m = part_measures(part, 5.0)
+    window, stations = assert_refresh_matches_full_run(route_json([part], [m]), route_json([moved], [m]))
+    assert window[2]
+
+
+def test_vertex_slid_along_a_tangent_replaces_only_its_window():
+    # the length is the same, so the rest of the route matches from the end
+    part = track(tangent_in=1000.0)
+    moved = part.copy()
+    moved[100, 0] += 2.0
+    m = part_measures(part, 5.0)
+    window, stations = assert_refresh_matches_full_run(route_json([part], [m]), route_json([moved], [m]))
+    first, stop, whole = window
+    length = manifest_entry(route_json([moved], [m]))[2]
+    assert not whole and 0 < first < stop < ce.station_count(length)
+    # the three-point windows that touch vertex 100 (500 m along), and no more
+    dist = ce.station_distances(length)
+    assert dist[first + 2] > 495.0 and dist[first + 1] <= 495.0
+    assert dist[stop - 1] < 505.0 and dist[stop] >= 505.0
+    assert len(stations) == stop - first
+
+
+def test_realigned_curve_replaces_to_the_end():
+    # pushing a curve vertex out lengthens the route, so every curve
+    # point after it moves
+    part = track(tangent_in=600.0)
+    moved = part.copy()
+    moved[150, 1] += 1.5
+    window, stations = assert_refresh_matches_full_run(route_json([part], [part_measures(part, 5.0)]),
+                                                       route_json([moved], [part_measures(moved, 5.0)]))
+    first, stop, whole = window
+    assert not whole and first > 0
+    assert stop == ce.station_count(manifest_entry(route_json([moved], [part_measures(moved, 5.0)]))[2])
+
+
+@pytest.mark.parametrize('keep', [-40, -1])
+def test_shortened_route_drops_the_rows_past_its_end(keep):
+    part = track()
+    short = part[:keep]
+    window, stations = assert_refresh_matches_full_run(route_json([part], [part_measures(part, 5.0)]),
+                                                       route_json([short], [part_measures(short, 5.0)]))
+    assert not window[2]
+
+
+def test_lengthened_route_adds_rows_at_its_end():
+    part = track()
+    window, stations = assert_refresh_matches_full_run(route_json([part[:-30]], [part_measures(part[:-30], 5.0)]),
+                                                       route_json([part], [part_measures(part, 5.0)]))
+    assert not window[2]
+
+
+def test_changed_measures_decreasing_route():
+    # M on a decreasing route: a change of one interior vertex's M alone
+    # leaves the curve points as they were, outside a small window
+    part = track()
+    m = part_measures(part, 30.0, -1)
+    changed = m.copy()
+    changed[120] += 0.001
+    window, stations = assert_refresh_matches_full_run(route_json([part], [m]), route_json([part], [changed]))
+    assert not window[2] and window[1] - window[0] <= 4
+
+
+def test_multipart_route_refresh():
+    part = track(tangent_out=600.0)
+    first, second = part[:100], part[100:] + np.array([0.0, 40.0])
+    moved = second.copy()
+    moved[30, 1] += 2.0
+    old = route_json([first, second], [part_measures(first, 1.0), part_measures(second, 2.0)])
+    new = route_json([first, moved], [part_measures(first, 1.0), part_measures(moved, 2.0)])
+    window, stations = assert_refresh_matches_full_run(old, new)
+    assert not window[2] and window[0] > 0
+
+#-----------------------------------------------
+
+def test_window_mileposts():
+    count = 10
+    mileposts = ce.station_mileposts(2.0, count)
+    assert curvature_increment.window_mileposts((0, count, True), 2.0, count, ce.CURVE_POINT_INTERVAL_MILES) \
+        == (None, None)
+    assert curvature_increment.window_mileposts((3, 6, False), 2.0, count, ce.CURVE_POINT_INTERVAL_MILES) \
+        == (mileposts[3], mileposts[5])
+    assert curvature_increment.window_mileposts((3, count, False), 2.0, count, ce.CURVE_POINT_INTERVAL_MILES) \
+        == (mileposts[3], None)
+
+
+def test_manifest_round_trip(tmp_path):
+    part = track()
+    entry = manifest_entry(route_json([part], [part_measures(part, 5.0)]))
+    path = str(tmp_path / 'manifest.npz')
+    curvature_increment.save_manifest(path, {'R': entry, 'S': entry}, SETTINGS)
+    manifest = curvature_increment.load_manifest(path, SETTINGS)
+    assert sorted(manifest) == ['R', 'S']
+    assert manifest['R'][0] == entry[0] and manifest['R'][2] == entry[2]
+    np.testing.assert_array_equal(manifest['S'][1], entry[1])
+    # a manifest made with other settings is no manifest at all
+    assert curvature_increment.load_manifest(path, dict(SETTINGS, tolerance=1.0)) == {}
+    assert curvature_increment.load_manifest(str(tmp_path / 'missing.npz'), SETTINGS) == {}
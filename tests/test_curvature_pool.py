@@ -0,0 +1,84 @@
+# A route's SHAPE@JSON as the pool reads it: null and empty shapes, Z
+# and M columns
+
+import json
+
+import numpy as np
+import pytest
+
+import curvature_engine as ce
+import curvature_increment
+import curvature_pool
+import measure_index
+from conftest import SETTINGS, part_measures, route_json, track, unproject
+
+EMPTY_SHAPES = [None,
+                json.dumps({'hasM': True, 'paths': []}),
+                json.dumps({'hasM': True, 'paths': [[]]}),
+                json.dumps({'paths': []})]
+
+
+@pytest.fixture(autouse=True)
+def worker():
+    curvature_pool.init_worker(SETTINGS)
+
+#-----------------------------------------------
+
+@pytest.mark.parametrize('shape_json', EMPTY_SHAPES)
+def test_null_or_empty_shape_has_no_stations(shape_json):
+    slot, route_id, stations = curvature_pool.compute_route((3, 'R', shape_json))
+    assert (slot, route_id, len(stations)) == (3, 'R', 0)
+    assert stations.dtype == ce.station_dtype(())
+
+
+def test_no_stations_carries_the_chord_fields():
+    curvature_pool.init_worker(dict(SETTINGS, chords=[200]))
+    stations = curvature_pool.compute_route((0, 'R', None))[2]
+    assert 'curve_percent_actual_200' in stations.dtype.names
+
+
+def test_route_without_m_is_a_clear_error():
+    part = track()
+    lon, lat = unproject(part[:, 0], part[:, 1])
+    shape_json = json.dumps({'paths': [np.column_stack((lon, lat)).tolist()]})
+    with pytest.raises(ValueError, match='no M values'):
+        curvature_pool.compute_route((0, 'R', shape_json))
+
+
+def test_m_after_z():
+    part = track()
+    m = part_measures(part, 7.0)
+    lon, lat = unproject(part[:, 0], part[:, 1])
+    with_z = json.dumps({'hasZ': True, 'hasM': True,
+                         'paths': [np.column_stack((lon, lat, np.full(len(m), 150.0), m)).tolist()]})
+    stations = curvature_pool.compute_route((0, 'R', with_z))[2]
+    np.testing.assert_array_equal(stations, curvature_pool.compute_route((0, 'R', route_json([part], [m])))[2])
+    assert stations['milepost'][0] == 7.0
+
+#-----------------------------------------------
+
+def test_route_emptied_since_the_last_run_loses_its_curve_points():
+    part = track()
+    shape_json = route_json([part], [part_measures(part, 5.0)])
+    _, parts_P, _ = curvature_pool._route_parts(shape_json)
+    previous = curvature_increment.route_digest(shape_json, parts_P)[0]
+    _, _, entry, window, mileposts, stations = curvature_pool.refresh_route((0, 'R', None, previous))
+    assert window[2] and mileposts == (None, None) and len(stations) == 0
+    # and stays empty on the next run without being touched
+    assert curvature_pool.refresh_route((0, 'R', None, entry))[3:] == (None, None, None)
+
+
+def test_new_empty_route():
+    _, _, entry, window, mileposts, stations = curvature_pool.refresh_route((0, 'R', None, None))
+    assert entry == curvature_increment.EMPTY_ENTRY
+    assert window == (0, 0, True) and len(stations) == 0
+
+
+def test_index_skips_a_null_route(tmp_path):
+    part = track()
+    routes = [('NULL', None), ('R', route_json([part], [part_measures(part, 5.0)]))]
+    measure_index.build_index(routes, str(tmp_path), SETTINGS)
+    index = measure_index.MeasureIndex(str(tmp_path))
+    assert len(index.stations_between('NULL', 0.0, 100.0)) == 0
+    assert index.measure_to_xy('NULL', 5.0) is None
+    assert index.measure_to_xy('R', 5.01) is not None
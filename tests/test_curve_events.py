@@ -0,0 +1,175 @@
+# Curve events: runs of LEFT/RIGHT curve points merged per route, the
+# same however the curve points are split into chunks
+
+import itertools
+
+import numpy as np
+import pytest
+
+import curvature_engine as ce
+import curve_events
+from conftest import track, unproject
+
+FEET = ce.CURVE_POINT_INTERVAL_FEET
+
+
+def points(route_ids, directions, degrees=None, start=1.0, id_dtype='U8'):
+    n = len(directions)
+    chunk = np.zeros(n, dtype=curve_events._station_dtype(id_dtype))
+    chunk['RouteId'] = route_ids
+    chunk['milepost'] = start + np.arange(n) * ce.CURVE_POINT_INTERVAL_MILES
+    chunk['curve_percent_absolute'] = degrees if degrees is not None else np.where(
+        np.array(directions) == 'STRAIGHT', 0.1, 2.0)
+    chunk['curve_direction'] = directions
+    return chunk
+
+
+# the events of a whole array of curve points, one run at a time
+def naive_events(rows):
+    events = []
+    i = 0
+    for (route_id, direction), run in itertools.groupby(zip(rows['RouteId'], rows['curve_direction'])):
+        n = len(list(run))
+        if direction in curve_events.CURVE_DIRECTIONS:
+            events.append(curve_events._event(rows[i:i + n], FEET))
+        i += n
+    return events
+
+
+def all_events(chunks):
+    out = list(curve_events.segment(chunks))
+    return np.concatenate(out) if out else np.zeros(0, dtype=curve_events.event_dtype())
+
+
+def split(rows, sizes):
+    bounds = np.cumsum([0] + list(sizes))
+    return [rows[a:b] for a, b in zip(bounds[:-1], bounds[1:])]
+
+#-----------------------------------------------
+
+S, L, R = 'STRAIGHT', 'LEFT', 'RIGHT'
+
+
+def test_runs_are_merged_per_route_and_direction():
+    rows = points(['A'] * 8 + ['B'] * 4,
+                  [S, L, L, L, R, R, S, L] + [L, L, S, S])
+    events = all_events([rows])
+    assert events['RouteId'].tolist() == ['A', 'A', 'A', 'B']
+    assert events['curve_direction'].tolist() == [L, R, L, L]
+    assert events['station_count'].tolist() == [3, 2, 1, 2]
+    np.testing.assert_allclose(events['length_feet'], events['station_count'] * FEET)
+    assert events['begin_milepost'][0] == rows['milepost'][1]
+    assert events['end_milepost'][0] == rows['milepost'][3]
+    # a curve at the end of route A doesn't run on into route B's
+    assert events['end_milepost'][2] == events['begin_milepost'][2] == rows['milepost'][7]
+
+
+@pytest.mark.parametrize('sizes', [[12], [1] * 12, [2, 5, 5], [4, 4, 4], [7, 0, 5], [3, 3, 1, 5]])
+def test_chunking_does_not_change_the_events(sizes):
+    rows = points(['A'] * 8 + ['B'] * 4,
+                  [S, L, L, L, R, R, S, L] + [L, L, S, S],
+                  degrees=np.linspace(0.5, 3.0, 12))
+    np.testing.assert_array_equal(all_events(split(rows, sizes)), np.array(naive_events(rows),
+                                                                            dtype=curve_events.event_dtype('U8')))
+
+
+def test_curve_at_the_very_end_is_flushed():
+    rows = points(['A'] * 5, [S, S, R, R, R])
+    events = all_events(split(rows, [2, 3]))
+    assert len(events) == 1 and events['station_count'][0] == 3
+
+
+def test_longer_route_ids_in_a_later_chunk():
+    first = points(['A'] * 3, [S, L, L])
+    second = points(['A', 'A-much-longer-id', 'A-much-longer-id'], [L, R, R], id_dtype='U20')
+    events = all_events([first, second])
+    assert events['RouteId'].tolist() == ['A', 'A-much-longer-id']
+    assert events['station_count'].tolist() == [3, 2]
+
+
+def test_spiral_hints():
+    degrees = [0.1, 0.6, 1.2, 2.0, 2.0, 2.0, 1.0, 0.1]
+    rows = points(['A'] * 8, [S, R, R, R, R, R, R, S], degrees=degrees)
+    event = all_events([rows])[0]
+    assert event['max_degree'] == 2.0
+    assert event['mean_degree'] == pytest.approx(np.mean(degrees[1:7]))
+    assert event['spiral_in_feet'] == 2 * FEET
+    assert event['spiral_out_feet'] == 1 * FEET
+
+
+def test_no_curves_no_events():
+    assert len(all_events([points(['A'] * 4, [S] * 4)])) == 0
+    assert len(all_events([])) == 0
+
+#-----------------------------------------------
+
+def test_tap_passes_results_through_and_writes_their_events():
+    stations = ce.compute_stations([track()], 0.0, unproject)
+    results = [(0, 'R1', stations), (1, None, stations)]
+    written = []
+    out = list(curve_events.tap(iter(results), written.append))
+    assert out == results
+    events = np.concatenate(written)
+    assert set(events['RouteId']) == {'R1', ''}
+    assert events['station_count'].sum() == 2 * np.isin(stations['curve_direction'], ['LEFT', 'RIGHT']).sum()
+
+
+# an arcpy module with just what cursor_chunks uses, over rows in memory
+class FakeField:
+
+    def __init__(self, name):
+        self.name = name
+
+
+class FakeCursor:
+
+    def __init__(self, rows, fields, sql_clause):
+        self.rows = [tuple(row[f] for f in fields) for row in rows]
+        self.fields = fields
+        self.order = sql_clause[1]
+
+    def __enter__(self):
+        return iter(self.rows)
+
+    def __exit__(self, *exc):
+        return False
+
+
+class FakeArcpy:
+
+    def __init__(self, rows, field_names):
+        self.rows = rows
+        self.field_names = field_names
+        self.cursors = []
+        outer = self
+
+        class da:
+            @staticmethod
+            def SearchCursor(fc, fields, sql_clause=None):
+                outer.cursors.append(FakeCursor(rows, fields, sql_clause))
+                return outer.cursors[-1]
+        self.da = da
+
+    def ListFields(self, fc):
+        return [FakeField(name) for name in self.field_names]
+
+
+@pytest.mark.parametrize('has_route_id', [True, False])
+def test_cursor_chunks(has_route_id):
+    rows = points(['A'] * 5, [S, L, L, S, R])
+    dicts = [dict(zip(rows.dtype.names, row)) for row in rows.tolist()]
+    names = ['OBJECTID', 'Shape'] + (['routeid'] if has_route_id else []) + curve_events.STATION_FIELDS[1:]
+    for d in dicts:
+        d['routeid'] = d['RouteId']
+    fake = FakeArcpy(dicts, names)
+    chunks = list(curve_events.cursor_chunks(fake, 'curve_points', 'routeid', chunk_rows=2))
+    assert [len(c) for c in chunks] == [2, 2, 1]
+    cursor = fake.cursors[0]
+    if has_route_id:
+        assert cursor.fields[0] == 'routeid' and cursor.order == 'ORDER BY routeid, milepost'
+    else:
+        assert 'routeid' not in cursor.fields and cursor.order == 'ORDER BY milepost'
+    merged = np.concatenate(chunks)
+    assert set(merged['RouteId']) == ({'A'} if has_route_id else {''})
+    np.testing.assert_array_equal(merged['milepost'], rows['milepost'])
+    assert len(all_events(chunks)) == 2
@@ -0,0 +1,100 @@
+# The streaming diagram reader: the same records however the file is cut
+# into chunks, as json.load() reads them
+
+import json
+import math
+
+import numpy as np
+import pytest
+
+import diagram_stream
+
+
+# an Export Diagram Content document, with other top-level values and
+# strings full of JSON punctuation to trip up a splitter
+def diagram():
+    junctions = [{'attributes': {'OBJECTID': oid, 'name': 'sw "%d", {x: [1]}' % oid},
+                  'geometry': {'x': 100.125 * oid, 'y': -2.5e-3 * oid, 'z': None if oid == 3 else oid, 'm': 0}}
+                 for oid in range(1, 6)]
+    junctions.append({'attributes': {'OBJECTID': 6}, 'geometry': {'x': 1234567.890123, 'y': 1e10}})
+    edges = [{'attributes': {'OBJECTID': 11, 'label': 'main ]}, track'},
+              'geometry': {'paths': [[[0.5, 1.5], [2.25, 3.75], [12345.6789, -9876.54321]]]}},
+             {'attributes': {'OBJECTID': 12, 'label': 'sidéing \\ "b"'},
+              'geometry': {'hasZ': True, 'hasM': True,
+                           'paths': [[[1, 2, 3, 4], [5, 6, None, 8]], [[9, 10, 11, None]]]}},
+             {'attributes': {'OBJECTID': 13},
+              'geometry': {'hasM': True, 'paths': [[[1, 1, 100], [2, 2, 200.5]]]}}]
+    return {'diagramInfo': {'name': 'Basic [1]', 'tag': '{}'},
+            'spatialRef': {'wkid': 102100, 'latestWkid': 3857},
+            'junctions': junctions,
+            'containers': [{'attributes': {'OBJECTID': 99}}, []],
+            'edges': edges,
+            'count': 12345678901234567890,
+            'done': True}
+
+
+def write(tmp_path, doc, indent):
+    path = str(tmp_path / 'diagram.json')
+    with open(path, 'w') as fileOUT:
+        json.dump(doc, fileOUT, indent=indent)
+    return path
+
+
+def same(a, b):
+    return a == b or (isinstance(a, float) and isinstance(b, float) and math.isnan(a) and math.isnan(b))
+
+#-----------------------------------------------
+
+@pytest.mark.parametrize('indent', [None, 2])
+@pytest.mark.parametrize('chunk_chars', [1, 2, 3, 7, 64, 1 << 20])
+def test_records_are_the_same_however_the_file_is_split(tmp_path, indent, chunk_chars):
+    doc = diagram()
+    records = list(diagram_stream.iter_diagram(write(tmp_path, doc, indent), chunk_chars))
+    assert records == ([('spatialRef', doc['spatialRef'])] +
+                       [('junction', j) for j in doc['junctions']] +
+                       [('edge', e) for e in doc['edges']])
+
+
+@pytest.mark.parametrize('chunk_chars', [1, 5, 1 << 20])
+def test_load_diagram(tmp_path, chunk_chars):
+    doc = diagram()
+    content = diagram_stream.load_diagram(write(tmp_path, doc, 1), chunk_chars)
+    assert content.spatial_ref['wkid'] == 102100
+    assert content.junction(1) == (100.125, -2.5e-3, 1, 0)
+    x, y, z, m = content.junction(3)
+    assert (x, y, m) == (300.375, -7.5e-3, 0) and math.isnan(z)
+    assert content.junction(6) == (1234567.890123, 1e10, 0, 0)
+    assert content.junction(11) is None and content.edge_arrays(1) is None
+
+    coords, offsets, hasZ, hasM = content.edge_arrays(11)
+    assert not hasZ and not hasM
+    np.testing.assert_array_equal(offsets, [0, 3])
+    np.testing.assert_array_equal(coords[:, :2], doc['edges'][0]['geometry']['paths'][0])
+
+    coords, offsets, hasZ, hasM = content.edge_arrays(12)
+    assert hasZ and hasM
+    np.testing.assert_array_equal(offsets, [0, 2, 3])
+    expected = [[1, 2, 3, 4], [5, 6, float('nan'), 8], [9, 10, 11, float('nan')]]
+    assert all(same(a, b) for row, want in zip(coords.tolist(), expected) for a, b in zip(row, want))
+
+    coords, offsets, hasZ, hasM = content.edge_arrays(13)
+    assert not hasZ and hasM
+    assert coords.tolist() == [[1, 1, 0, 100], [2, 2, 0, 200.5]]
+
+
+def test_empty_diagram(tmp_path):
+    content = diagram_stream.load_diagram(write(tmp_path, {}, None), 1)
+    assert content.spatial_ref is None and content.junction_slot == {} and content.edge_slot == {}
+    content = diagram_stream.load_diagram(write(tmp_path, {'junctions': [], 'edges': []}, None), 2)
+    assert content.junction_slot == {} and content.edge_slot == {}
+
+
+@pytest.mark.parametrize('chunk_chars', [1, 7, 1 << 20])
+def test_truncated_file_is_an_error(tmp_path, chunk_chars):
+    path = write(tmp_path, diagram(), None)
+    with open(path) as fileIN:
+        text = fileIN.read()
+    with open(path, 'w') as fileOUT:
+        fileOUT.write(text[:len(text) // 2])
+    with pytest.raises(ValueError):
+        list(diagram_stream.iter_diagram(path, chunk_chars))
@@ -0,0 +1,112 @@
+# The banded point-in-polygon index: the same answers as testing every
+# edge of every polygon, holes and multipart polygons included
+
+import numpy as np
+import pytest
+
+import district_index
+import geometry_arrays
+
+
+def square(x0, y0, size, clockwise=True):
+    ring = [[x0, y0], [x0, y0 + size], [x0 + size, y0 + size], [x0 + size, y0], [x0, y0]]
+    return ring if clockwise else ring[::-1]
+
+
+# a wobbly ring of n vertices around (cx, cy), so edges reach across bands
+def blob(cx, cy, radius, n=40):
+    a = np.linspace(0.0, 2 * np.pi, n, endpoint=False)
+    r = radius * (1 + 0.2 * np.sin(5 * a))
+    ring = np.column_stack((cx + r * np.cos(a), cy - r * np.sin(a))).tolist()
+    return ring + ring[:1]
+
+
+# a district with a lake in it; the island district in the lake; a
+# district of two parts; and one that touches the first along x = 10
+DISTRICTS = [('LAKESIDE', [square(0, 0, 10), square(3, 3, 4, clockwise=False)]),
+             ('ISLAND', [square(4, 4, 2)]),
+             ('ARCHIPELAGO', [blob(20, 5, 3), square(14, 12, 3), blob(25, 15, 2)]),
+             ('NEIGHBOR', [square(10, 0, 4)])]
+
+
+def polygons():
+    return [geometry_arrays.from_esri_json({'rings': rings})[:2] for _, rings in DISTRICTS]
+
+
+# the even-odd test against every edge of one polygon
+def naive_inside(px, py, coords, offsets):
+    crossings = 0
+    for j in range(len(offsets) - 1):
+        ring = coords[offsets[j]:offsets[j + 1], :2]
+        for (x0, y0), (x1, y1) in zip(ring[:-1], ring[1:]):
+            if (y0 > py) != (y1 > py) and px < x0 + (py - y0) * (x1 - x0) / (y1 - y0):
+                crossings += 1
+    return crossings % 2 == 1
+
+
+def naive_locate(x, y, polys):
+    found = []
+    for px, py in zip(x, y):
+        slots = [n for n, (coords, offsets) in enumerate(polys) if naive_inside(px, py, coords, offsets)]
+        assert len(slots) <= 1
+        found.append(slots[0] if slots else -1)
+    return found
+
+#-----------------------------------------------
+
+@pytest.mark.parametrize('edges_per_band', [1, 3, 64])
+def test_hole_and_multipart(edges_per_band):
+    index = district_index.PolygonIndex(polygons(), [name for name, _ in DISTRICTS], edges_per_band)
+    names = dict((name, n) for n, (name, _) in enumerate(DISTRICTS))
+    points = {(1, 1): 'LAKESIDE', (9.5, 5): 'LAKESIDE',
+              (3.5, 3.5): None,               # in the lake, off the island
+              (6.5, 5): None,
+              (5, 5): 'ISLAND',
+              (20, 5): 'ARCHIPELAGO', (15, 13): 'ARCHIPELAGO', (25, 15): 'ARCHIPELAGO',
+              (15, 5): None,                  # between the parts
+              (12, 2): 'NEIGHBOR',
+              (-1, 5): None, (30, 30): None}
+    x, y = zip(*points)
+    slots = index.locate(x, y)
+    assert [index.attributes[s] if s >= 0 else None for s in slots] == \
+        [name for name in points.values()]
+    assert slots.tolist() == [names.get(name, -1) for name in points.values()]
+
+
+@pytest.mark.parametrize('edges_per_band', [1, 5, 64])
+def test_random_points_match_testing_every_edge(edges_per_band):
+    rng = np.random.default_rng(7)
+    x = rng.uniform(-2.0, 30.0, 2000)
+    y = rng.uniform(-2.0, 20.0, 2000)
+    polys = polygons()
+    index = district_index.PolygonIndex(polys, range(len(polys)), edges_per_band)
+    assert index.locate(x, y).tolist() == naive_locate(x, y, polys)
+
+
+def test_tests_split_by_max_tests(monkeypatch):
+    monkeypatch.setattr(district_index, 'MAX_TESTS', 7)
+    rng = np.random.default_rng(3)
+    x = rng.uniform(-2.0, 30.0, 300)
+    y = rng.uniform(-2.0, 20.0, 300)
+    polys = polygons()
+    assert district_index.PolygonIndex(polys, range(len(polys)), 4).locate(x, y).tolist() == \
+        naive_locate(x, y, polys)
+
+
+def test_nan_points_and_an_empty_index():
+    index = district_index.PolygonIndex(polygons(), range(len(DISTRICTS)))
+    assert index.locate([np.nan, 5.0, 1.0], [5.0, np.nan, 1.0]).tolist() == [-1, -1, 0]
+    assert district_index.PolygonIndex([], []).locate([1.0], [1.0]).tolist() == [-1]
+
+#-----------------------------------------------
+
+def test_assign_districts():
+    index = district_index.PolygonIndex(polygons(), [(name, n) for n, (name, _) in enumerate(DISTRICTS)])
+    rows = [(0, 'a', {'x': 5.0, 'y': 5.0}), (1, 'b', None), (2, 'c', {'x': 3.5, 'y': 3.5}),
+            (3, 'd', {'x': 12.0, 'y': 2.0})]
+    out = list(district_index.assign_districts(iter(rows), index, ['NAME', 'CD'], chunk_rows=3))
+    assert [row[0] for row in out] == [0, 1, 2, 3]
+    assert out[0][2]['NAME'] == 'ISLAND' and out[0][2]['CD'] == 1
+    assert out[1][2] is None
+    assert out[2][2]['NAME'] is None and out[2][2]['CD'] is None
+    assert out[3][2]['NAME'] == 'NEIGHBOR'
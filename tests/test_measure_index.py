@@ -0,0 +1,146 @@
+# The measure index: its k-d tree, nearest-station search, measure -> XY
+# and XY -> measure, on routes built in memory
+
+import numpy as np
+import pytest
+
+import curvature_engine as ce
+import measure_index
+from conftest import MILES_PER_METER, SETTINGS, part_measures, route_json, track
+
+
+@pytest.fixture
+def index(tmp_path):
+    up = track(tangent_in=1500.0)
+    down = track(degrees=-45.0, y0=25000.0)
+    routes = [('UP', route_json([up], [part_measures(up, 10.0)])),
+              ('DOWN', route_json([down], [part_measures(down, 50.0, -1)]))]
+    measure_index.build_index(routes, str(tmp_path), dict(SETTINGS, adaptive=True))
+    return measure_index.MeasureIndex(str(tmp_path))
+
+#-----------------------------------------------
+
+# whether kd_order's permutation is an implicit k-d tree over (x, y)
+def check_kd(x, y, order, lo, hi, depth, leaf_size):
+    if hi - lo <= leaf_size:
+        return
+    coord = (x if depth % 2 == 0 else y)[order]
+    mid = (lo + hi) // 2
+    assert np.all(coord[lo:mid] <= coord[mid])
+    assert np.all(coord[mid + 1:hi] >= coord[mid])
+    check_kd(x, y, order, lo, mid, depth + 1, leaf_size)
+    check_kd(x, y, order, mid + 1, hi, depth + 1, leaf_size)
+
+
+@pytest.mark.parametrize('n', [0, 1, 16, 17, 1000])
+def test_kd_order_is_a_kd_tree(n):
+    rng = np.random.default_rng(n)
+    x = rng.normal(size=n)
+    y = rng.normal(size=n)
+    x[::7] = 0.5  # ties
+    order = measure_index.kd_order(x, y, leaf_size=4)
+    np.testing.assert_array_equal(np.sort(order), np.arange(n))
+    check_kd(x, y, order, 0, n, 0, 4)
+
+
+def test_nearest_matches_brute_force(index):
+    rng = np.random.default_rng(1)
+    xy = np.column_stack((index.stations['X'], index.stations['Y']))
+    lo, hi = xy.min(axis=0) - 100, xy.max(axis=0) + 100
+    for X, Y in rng.uniform(lo, hi, size=(200, 2)):
+        slot, distance = index._nearest(X, Y)
+        d = np.hypot(xy[:, 0] - X, xy[:, 1] - Y)
+        assert distance == pytest.approx(d.min())
+        assert d[slot] == pytest.approx(d.min())
+
+
+def test_nearest_station_reports_route_and_distance(index):
+    st = index.stations[len(index.stations) // 3]
+    found = index.nearest_station(float(st['X']) + 1.0, float(st['Y']), projected=True)
+    assert found['milepost'] == st['milepost']
+    assert found['RouteId'] == index.route_ids[st['route']]
+    assert found['distance'] == pytest.approx(1.0, abs=1e-6)
+
+#-----------------------------------------------
+
+@pytest.mark.parametrize('route_id, sign', [('UP', 1), ('DOWN', -1)])
+def test_measure_to_xy_lands_on_the_route(index, route_id, sign):
+    slot = index.slots[route_id]
+    segments = np.asarray(index.segments[index.segment_start[slot]:index.segment_start[slot + 1]])
+    first, last = segments[0], segments[-1]
+    assert sign * (last[1] - first[0]) > 0
+
+    # at a vertex, and halfway along a segment
+    x, y, X, Y = index.measure_to_xy(route_id, first[1])
+    assert (X, Y) == pytest.approx((first[8], first[9]))
+    seg = segments[len(segments) // 2]
+    x, y, X, Y = index.measure_to_xy(route_id, (seg[0] + seg[1]) / 2)
+    assert (X, Y) == pytest.approx(((seg[6] + seg[8]) / 2, (seg[7] + seg[9]) / 2))
+    assert (x, y) == pytest.approx(((seg[2] + seg[4]) / 2, (seg[3] + seg[5]) / 2))
+
+    # past either end of the route
+    assert index.measure_to_xy(route_id, min(first[0], last[1]) - 1.0) is None
+    assert index.measure_to_xy(route_id, max(first[0], last[1]) + 1.0) is None
+
+
+def test_measure_to_xy_when_measures_turn_around(tmp_path):
+    # M climbs to the middle of a straight part and falls back: a measure
+    # on the way up is also on the way down, and either point will do
+    part = track(tangent_in=1000.0, degrees=0.0, tangent_out=0.0)
+    m = part_measures(part, 0.0)
+    half = len(m) // 2
+    m[half:] = 2 * m[half] - m[half:]
+    measure_index.build_index([('R', route_json([part], [m]))], str(tmp_path), SETTINGS)
+    index = measure_index.MeasureIndex(str(tmp_path))
+    x, y, X, Y = index.measure_to_xy('R', m[half])
+    assert (X, Y) == pytest.approx(tuple(part[half]), abs=1e-3)
+    quarter = m[half] / 2
+    x, y, X, Y = index.measure_to_xy('R', quarter)
+    way_up = part[0, 0] + quarter / MILES_PER_METER
+    way_down = part[half, 0] + (m[half] - quarter) / MILES_PER_METER
+    assert min(abs(X - way_up), abs(X - way_down)) == pytest.approx(0.0, abs=1e-3)
+    assert Y == pytest.approx(part[0, 1], abs=1e-3)
+    assert index.measure_to_xy('R', m[half] + 0.001) is None
+
+#-----------------------------------------------
+
+def test_adaptive_stations_know_how_far_along_they_are(index):
+    # with adaptive spacing the tangent's stations are missing, so the
+    # station numbers come from the mileposts, not the row numbers
+    slot = index.slots['UP']
+    rows = np.asarray(index.stations[index.station_start[slot]:index.station_start[slot + 1]])
+    along = rows['along']
+    assert along[-1] > (len(rows) - 1) * ce.CURVE_POINT_INTERVAL_METERS
+    steps = along / ce.CURVE_POINT_INTERVAL_METERS
+    np.testing.assert_allclose(steps, np.rint(steps), atol=1e-9)
+
+
+@pytest.mark.parametrize('route_id', ['UP', 'DOWN'])
+def test_locate_after_a_long_tangent(index, route_id):
+    # on the curve, and on the tangents whose stations were skipped
+    slot = index.slots[route_id]
+    lo, hi = index.segment_start[slot], index.segment_start[slot + 1]
+    for seg in np.asarray(index.segments[lo:hi])[::7]:
+        X, Y = (seg[6] + seg[8]) / 2, (seg[7] + seg[9]) / 2
+        found, measure, distance = index.locate(X, Y, projected=True)
+        assert found == route_id
+        assert distance == pytest.approx(0.0, abs=1e-6)
+        assert measure == pytest.approx((seg[0] + seg[1]) / 2, abs=1e-9)
+
+
+def test_stations_between(index):
+    rows = index.stations_between('UP', 10.94, 10.98)
+    assert len(rows) == 4
+    assert rows['milepost'].min() >= 10.94 and rows['milepost'].max() <= 10.98
+    assert np.all(np.diff(rows['milepost']) > 0)
+    assert len(index.stations_between('UP', 99.0, 100.0)) == 0
+
+
+def test_route_stations_from_mileposts():
+    stations = np.zeros(4, dtype=ce.STATION_DTYPE)
+    stations['milepost'] = [3.0, ce.station_mileposts(3.0, 1)[0]] + list(ce.station_mileposts(3.0, 9)[7:9])
+    rows = measure_index.route_stations(stations, 2, ce.CURVE_POINT_INTERVAL_METERS,
+                                        ce.CURVE_POINT_INTERVAL_MILES)
+    np.testing.assert_allclose(rows['along'], np.array([0, 1, 8, 9]) * ce.CURVE_POINT_INTERVAL_METERS)
+    assert np.all(rows['route'] == 2)
+    assert len(measure_index.route_stations(stations[:0], 0, 1.0, 1.0)) == 0
@@ -0,0 +1,106 @@
+# Retries, Retry-After and checkpoints of the request scheduler
+
+import email.utils
+import time
+
+import pytest
+import requests
+
+import request_scheduler
+
+
+class FakeResponse:
+
+    def __init__(self, status, body, headers=None):
+        self.status_code = status
+        self.body = body
+        self.headers = headers or {}
+
+    def json(self):
+        if self.body is None:
+            raise ValueError('not JSON')
+        return self.body
+
+
+# a session that hands back 'responses' in turn (an exception is raised)
+class FakeSession:
+
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.calls = 0
+
+    def request(self, method, url, params=None, data=None, timeout=None):
+        self.calls += 1
+        response = self.responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    waited = []
+    monkeypatch.setattr(request_scheduler.time, 'sleep', waited.append)
+    return waited
+
+#-----------------------------------------------
+
+def test_retry_after_seconds():
+    assert request_scheduler.retry_after_seconds(None) is None
+    assert request_scheduler.retry_after_seconds('') is None
+    assert request_scheduler.retry_after_seconds('7') == 7.0
+    assert request_scheduler.retry_after_seconds('-3') == 0.0
+    assert request_scheduler.retry_after_seconds('soon') is None
+    later = email.utils.formatdate(time.time() + 120, usegmt=True)
+    assert request_scheduler.retry_after_seconds(later) == pytest.approx(120, abs=2)
+
+
+def test_backoff_waits_out_retry_after_beyond_max_delay():
+    scheduler = request_scheduler.RequestScheduler(base_delay=0.5, max_delay=2.0)
+    for attempt in range(1, 8):
+        assert 0 <= scheduler.backoff(attempt) <= 2.0
+        assert scheduler.backoff(attempt, retry_after=30.0) == 30.0
+        assert scheduler.backoff(attempt, retry_after=0.0) <= 2.0
+
+
+def test_throttled_then_ok(sleeps):
+    scheduler = request_scheduler.RequestScheduler(max_retries=3)
+    session = FakeSession([FakeResponse(429, {}, {'Retry-After': '5'}),
+                           FakeResponse(200, {'error': {'code': 503, 'message': 'busy'}}),
+                           FakeResponse(200, {'routes': 1})])
+    assert scheduler.get_json(session, 'https://example.com/solve') == {'routes': 1}
+    assert session.calls == 3
+    assert sleeps[0] >= 5.0
+    assert (scheduler.requests, scheduler.retries, scheduler.throttled, scheduler.failed) == (3, 2, 1, 0)
+
+
+def test_bad_request_is_not_retried(sleeps):
+    scheduler = request_scheduler.RequestScheduler()
+    session = FakeSession([FakeResponse(200, {'error': {'code': 498, 'message': 'invalid token'}})])
+    assert request_scheduler.error_code(scheduler.get_json(session, 'https://example.com/solve')) == 498
+    assert session.calls == 1 and not sleeps
+
+
+def test_gives_up_after_max_retries(sleeps):
+    scheduler = request_scheduler.RequestScheduler(max_retries=2)
+    session = FakeSession([requests.ConnectionError('down'), FakeResponse(502, None),
+                           FakeResponse(502, None)])
+    result = scheduler.post_json(session, 'https://example.com/solve', {'stops': '1,2;3,4'})
+    assert request_scheduler.error_code(result) == 502
+    assert session.calls == 3 and len(sleeps) == 2
+    assert scheduler.failed == 1
+
+#-----------------------------------------------
+
+def test_checkpoint_round_trip(tmp_path):
+    path = str(tmp_path / 'job.checkpoint')
+    assert request_scheduler.load_checkpoint(path) is None
+    assert request_scheduler.load_checkpoint(None) is None
+    request_scheduler.save_checkpoint(path, 41)
+    request_scheduler.save_checkpoint(path, 42)
+    assert request_scheduler.load_checkpoint(path) == 42
+    assert not (tmp_path / 'job.checkpoint.tmp').exists()
+    request_scheduler.clear_checkpoint(path)
+    assert request_scheduler.load_checkpoint(path) is None
+    request_scheduler.clear_checkpoint(path)
+    request_scheduler.clear_checkpoint(None)
@@ -0,0 +1,83 @@
+# The SQLite route cache: its keys, hits and misses, expiry and eviction
+
+import pytest
+
+import route_cache
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = route_cache.RouteCache(str(tmp_path / 'routes.sqlite'))
+    yield cache
+    cache.close()
+
+
+def params(stops, **more):
+    return dict({'stops': stops, 'f': 'json', 'token': 'abc'}, **more)
+
+#-----------------------------------------------
+
+def test_key_ignores_token_and_format_and_rounds_the_stops(cache):
+    key = cache.key(params('-117.1,34.05;-117.2,34.06'))
+    assert key == cache.key({'stops': '-117.1000000001,34.05;-117.2,34.06', 'token': 'other'})
+    assert key != cache.key(params('-117.1,34.05;-117.2,34.07'))
+    assert key != cache.key(params('-117.1,34.05;-117.2,34.06', useHierarchy='false'))
+    # parameter order doesn't matter
+    assert cache.key(params('1,2;3,4', a=1, b=2)) == cache.key(params('1,2;3,4', b=2, a=1))
+
+
+def test_null_coordinate_has_no_key(cache):
+    assert cache.key(params('None,34.05;-117.2,34.06')) is None
+    assert cache.key(params('-117.1,34.05;-117.2,')) is None
+
+
+def test_hits_and_misses(cache):
+    cache.put_many({'k1': {'Total_Miles': 1.5}})
+    found = cache.get_many(['k1', 'k2', 'k1'])
+    assert found == {'k1': {'Total_Miles': 1.5}}
+    assert (cache.hits, cache.misses) == (2, 1)
+
+
+def test_many_keys_span_several_statements(cache):
+    items = dict(('k' + str(i), {'n': i}) for i in range(route_cache.LOOKUP_BATCH * 2 + 7))
+    cache.put_many(items)
+    assert cache.get_many(items) == items
+
+
+def test_survives_reopening(tmp_path):
+    path = str(tmp_path / 'routes.sqlite')
+    cache = route_cache.RouteCache(path)
+    cache.put_many({'k': {'a': 1}})
+    cache.close()
+    cache = route_cache.RouteCache(path)
+    assert cache.get_many(['k']) == {'k': {'a': 1}}
+    cache.close()
+
+
+def test_expired_routes_are_missing_and_evicted(tmp_path, monkeypatch):
+    now = [1000000.0]
+    monkeypatch.setattr(route_cache.time, 'time', lambda: now[0])
+    cache = route_cache.RouteCache(str(tmp_path / 'routes.sqlite'), ttl_days=1)
+    cache.put_many({'old': {'a': 1}})
+    now[0] += 86400.0 * 0.5
+    cache.put_many({'new': {'a': 2}})
+    assert set(cache.get_many(['old', 'new'])) == {'old', 'new'}
+    now[0] += 86400.0 * 0.75
+    assert set(cache.get_many(['old', 'new'])) == {'new'}
+    assert cache.evict() == 1
+    cache.close()
+
+
+def test_least_recently_used_are_evicted(tmp_path, monkeypatch):
+    now = [1000000.0]
+    monkeypatch.setattr(route_cache.time, 'time', lambda: now[0])
+    cache = route_cache.RouteCache(str(tmp_path / 'routes.sqlite'), max_entries=2)
+    for key in ('a', 'b'):
+        now[0] += 1
+        cache.put_many({key: {}})
+    now[0] += 1
+    cache.get_many(['a'])
+    now[0] += 1
+    cache.put_many({'c': {}})
+    assert set(cache.get_many(['a', 'b', 'c'])) == {'a', 'c'}
+    cache.close()
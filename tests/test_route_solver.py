@@ -0,0 +1,194 @@
+# Solving OD tables: results in order, the cache and batching, and
+# resuming a table from its checkpoint
+
+import asyncio
+import json
+
+import pytest
+
+import request_scheduler
+import route_cache
+import route_solver
+
+URL = 'https://example.com/solve'
+ATTRIBUTES = ['Total_Miles']
+
+
+class FakeResponse:
+
+    def __init__(self, body):
+        self.body = body
+        self.status_code = 200
+        self.headers = {}
+
+    def json(self):
+        return self.body
+
+
+# a solve service: a route's Total_Miles is the sum of its stops' coordinates
+# ...stops whose origin lat is in 'fail' get no route
+class FakeSession:
+
+    def __init__(self, fail=()):
+        self.fail = set(fail)
+        self.requests = []
+
+    def get(self, url, params=None, timeout=None):
+        self.requests.append(params)
+        stops = params['stops']
+        if stops.startswith('{'):
+            pairs = {}
+            for f in json.loads(stops)['features']:
+                pairs.setdefault(f['attributes']['RouteName'], []).append((f['geometry']['y'], f['geometry']['x']))
+            features = [{'attributes': {'Name': name, 'Total_Miles': sum(map(sum, pts))}}
+                        for name, pts in pairs.items() if pts[0][0] not in self.fail]
+        else:
+            (olon, olat), (dlon, dlat) = [map(float, s.split(',')) for s in stops.split(';')]
+            features = [] if olat in self.fail else [{'attributes': {'Total_Miles': olat + olon + dlat + dlon}}]
+        return FakeResponse({'routes': {'features': features}})
+
+    # (as a RequestScheduler calls it)
+    def request(self, method, url, params=None, data=None, timeout=None):
+        return self.get(url, params, timeout)
+
+    def close(self):
+        pass
+
+
+def od(n):
+    return (float(n), float(n) / 10, float(n) + 0.5, 1.0)
+
+
+def miles(n):
+    return (sum(od(n)),)
+
+#-----------------------------------------------
+
+def test_results_in_od_order():
+    session = FakeSession(fail=[3.0])
+    ods = [od(n) for n in (1, 2, 3, 2, 4, 1)]
+    results = route_solver.solve_ods(ods, URL, {'f': 'json'}, ATTRIBUTES, concurrency=3, session=session)
+    assert results == [miles(1), miles(2), None, miles(2), miles(4), miles(1)]
+    assert len(session.requests) == 6
+
+
+def test_solve_from_inside_a_running_event_loop():
+    # as in an ArcGIS Pro or Jupyter notebook
+    async def notebook_cell():
+        return route_solver.solve_ods([od(1), od(2)], URL, {}, ATTRIBUTES, 2, FakeSession())
+    assert asyncio.run(notebook_cell()) == [miles(1), miles(2)]
+
+
+def test_repeats_sent_once_with_a_cache(tmp_path):
+    cache = route_cache.RouteCache(str(tmp_path / 'routes.sqlite'))
+    session = FakeSession()
+    ods = [od(n) for n in (1, 2, 2, 1)]
+    results = route_solver.solve_ods(ods, URL, {}, ATTRIBUTES, 2, session, cache)
+    assert results == [miles(1), miles(2), miles(2), miles(1)]
+    assert len(session.requests) == 2
+    cache.close()
+
+
+def test_null_coordinate_is_left_unsolved_with_a_cache(tmp_path):
+    cache = route_cache.RouteCache(str(tmp_path / 'routes.sqlite'))
+    session = FakeSession()
+    ods = [od(1), (None, 0.5, 2.0, 1.0), od(2)]
+    results = route_solver.solve_ods(ods, URL, {}, ATTRIBUTES, 2, session, cache)
+    assert results == [miles(1), None, miles(2)]
+    assert len(session.requests) == 2
+    cache.close()
+
+
+@pytest.mark.parametrize('batch_pairs', [None, 2, 500])
+def test_batched_and_cached(tmp_path, batch_pairs):
+    cache = route_cache.RouteCache(str(tmp_path / 'routes.sqlite'))
+    ods = [od(n) for n in range(1, 8)]
+    session = FakeSession(fail=[5.0])
+    first = route_solver.solve_ods(ods, URL, {'f': 'json', 'token': 't1'}, ATTRIBUTES, 2, session, cache, batch_pairs)
+    assert first == [None if n == 5 else miles(n) for n in range(1, 8)]
+
+    # the second run only sends the one that failed (and the token doesn't matter)
+    session = FakeSession()
+    second = route_solver.solve_ods(ods, URL, {'f': 'json', 'token': 't2'}, ATTRIBUTES, 2, session, cache, batch_pairs)
+    assert second == [miles(n) for n in range(1, 8)]
+    assert len(session.requests) == 1
+    cache.close()
+
+
+def test_solve_through_a_scheduler():
+    scheduler = request_scheduler.RequestScheduler(max_retries=0)
+    session = FakeSession()
+    results = route_solver.solve_ods([od(1), od(2)], URL, {}, ATTRIBUTES, 2, session, scheduler=scheduler)
+    assert results == [miles(1), miles(2)]
+    assert scheduler.requests == 2
+
+
+def test_stops_featureset_names_each_pair():
+    features = json.loads(route_solver.stops_featureset([od(1), od(2)]))['features']
+    assert [(f['attributes']['RouteName'], f['attributes']['Sequence']) for f in features] == \
+        [('0', 1), ('0', 2), ('1', 1), ('1', 2)]
+    assert features[0]['geometry'] == {'x': od(1)[1], 'y': od(1)[0]}
+
+#-----------------------------------------------
+
+@pytest.mark.parametrize('results, expected', [([(1,), (2,), (3,)], 30),
+                                               ([(1,), None, (3,)], 10),
+                                               ([None, (2,), (3,)], None),
+                                               ([], None)])
+def test_checkpoint_oid(results, expected):
+    assert route_solver.checkpoint_oid([10, 20, 30][:len(results)], results) == expected
+
+
+# an OD table in memory, read and written the way read_ods and write_results do
+@pytest.fixture
+def table(monkeypatch):
+    rows = dict((oid, {'od': od(oid), 'result': None}) for oid in range(1, 11))
+    reads = []
+
+    def read_ods(fc, coord_fields, after_oid=None):
+        oids = [oid for oid in sorted(rows) if after_oid is None or oid > after_oid]
+        reads.append(oids)
+        return oids, [rows[oid]['od'] for oid in oids]
+
+    def write_results(fc, result_fields, oids, results, convert=None):
+        written = 0
+        for oid, result in zip(oids, results):
+            if result is not None:
+                rows[oid]['result'] = result
+                written += 1
+        return written
+
+    monkeypatch.setattr(route_solver, 'read_ods', read_ods)
+    monkeypatch.setattr(route_solver, 'write_results', write_results)
+    return rows, reads
+
+
+def test_solve_table_resumes_after_the_last_good_row(tmp_path, table, monkeypatch):
+    rows, reads = table
+    checkpoint = str(tmp_path / 'ods.checkpoint')
+    fail = [5.0]
+    monkeypatch.setattr(route_solver, 'make_session', lambda concurrency: FakeSession(fail))
+
+    written = route_solver.solve_table('ods', [], ['miles'], URL, {}, ATTRIBUTES, 2,
+                                       checkpoint_path=checkpoint, chunk_rows=3)
+    assert written == 9
+    assert rows[5]['result'] is None and rows[10]['result'] == miles(10)
+    # rows 1-4 are done; the rest of the run wrote 6-10 but the checkpoint stays put
+    assert request_scheduler.load_checkpoint(checkpoint) == 4
+
+    fail.clear()
+    written = route_solver.solve_table('ods', [], ['miles'], URL, {}, ATTRIBUTES, 2,
+                                       checkpoint_path=checkpoint, chunk_rows=3)
+    assert reads[-1] == list(range(5, 11))
+    assert written == 6
+    assert all(row['result'] == miles(oid) for oid, row in rows.items())
+    assert request_scheduler.load_checkpoint(checkpoint) is None
+
+
+def test_solve_table_first_row_failing_saves_no_checkpoint(tmp_path, table, monkeypatch):
+    rows, reads = table
+    checkpoint = str(tmp_path / 'ods.checkpoint')
+    monkeypatch.setattr(route_solver, 'make_session', lambda concurrency: FakeSession([1.0]))
+    route_solver.solve_table('ods', [], ['miles'], URL, {}, ATTRIBUTES, 2, checkpoint_path=checkpoint, chunk_rows=4)
+    assert request_scheduler.load_checkpoint(checkpoint) is None
+    assert rows[1]['result'] is None and rows[2]['result'] == miles(2)